@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cost of rollup maintenance on single-reading posts
+
+Posts one reading at a time to /pool/data (the firmware's request shape)
+with rollup maintenance enabled and with update_rollups replaced by a no-op
+(re-bound here only for comparison), and reports milliseconds and SQL
+statements per post. Readings are spread over several devices so buckets
+are both created and updated.
+
+Usage:
+  python benchmarks/ingest_rollups.py [posts]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+_directory = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_directory, 'bench.db')}")
+os.environ.setdefault('ARCHIVE_DIR', os.path.join(_directory, 'archive'))
+os.environ.setdefault('RETENTION_INTERVAL', '0')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main  # noqa: E402
+
+DEVICES = 10
+
+
+def sample(index):
+    return {
+        "device_id": f"BENCH_POOL_{index % DEVICES:03d}",
+        "sensors": {"ph": 7.0 + (index % 7) / 10, "turbidity": 3.5, "temperature": 26.0 + (index % 5) / 10},
+        "status": {"water_quality": "optimal", "wifi_rssi": -65, "uptime": index}
+    }
+
+
+class StatementCounter:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        # executemany runs the statement once per parameter set
+        self.total += len(parameters) if executemany else 1
+
+
+def print_header(text):
+    print("\n" + "="*50)
+    print(f" {text}")
+    print("="*50)
+
+
+def measure(client, counter, posts):
+    for index in range(DEVICES):
+        client.post('/pool/data', json=sample(index))  # create devices, warm caches
+    counter.total = 0
+    start = time.perf_counter()
+    for index in range(posts):
+        response = client.post('/pool/data', json=sample(index))
+        assert response.status_code < 300, response.get_data(as_text=True)
+    elapsed = time.perf_counter() - start
+    return elapsed / posts * 1000, counter.total / posts
+
+
+def main_benchmark():
+    posts = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    with main.app.app_context():
+        main.db.create_all()
+        counter = StatementCounter()
+        main.db.event.listen(main.db.engine, 'before_cursor_execute', counter)
+    client = main.app.test_client()
+
+    with_rollups = measure(client, counter, posts)
+    update_rollups = main.update_rollups
+    main.update_rollups = lambda readings: None
+    try:
+        without_rollups = measure(client, counter, posts)
+    finally:
+        main.update_rollups = update_rollups
+
+    print_header(f"Single-reading POST /pool/data ({posts} posts)")
+    print(f"{'':<18} {'ms/post':>8} {'SQL/post':>9}")
+    print(f"{'without rollups':<18} {without_rollups[0]:>8.2f} {without_rollups[1]:>9.1f}")
+    print(f"{'with rollups':<18} {with_rollups[0]:>8.2f} {with_rollups[1]:>9.1f}")
+
+
+if __name__ == "__main__":
+    main_benchmark()
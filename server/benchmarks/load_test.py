@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Load test: simulated pool monitors posting to a running server
+
+Each simulated device posts a reading to /pool/data every --interval seconds
+(open loop, like the firmware's post_interval), over one persistent HTTP/1.1
+connection unless --close is given. With --interval 0 every device posts
+back to back, which measures the server's capacity.
+
+Usage:
+  python benchmarks/load_test.py --url http://127.0.0.1:5000 --devices 200 --interval 1
+  python benchmarks/load_test.py --devices 32 --interval 0 --close
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def build_request(host, device_id, close):
+    body = json.dumps({
+        "device_id": device_id,
+        "sensors": {"ph": 7.2, "turbidity": 3.5, "temperature": 26.8},
+        "status": {"water_quality": "optimal", "wifi_rssi": -65, "uptime": 3600}
+    }).encode()
+    head = (
+        f"POST /pool/data HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: {'close' if close else 'keep-alive'}\r\n\r\n"
+    )
+    return head.encode() + body
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns (status, keep_alive)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    length = 0
+    keep_alive = True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection' and value.strip().lower() == 'close':
+            keep_alive = False
+    await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def device(index, args, stats, deadline):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    request = build_request(url.netloc, f"LOAD_{index:05d}", args.close)
+    reader = writer = None
+    # Spread the first posts over one interval, like devices booting at different times
+    await asyncio.sleep(random.random() * args.interval)
+    next_post = time.monotonic()
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+                stats['connections'] += 1
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+            stats['latencies'].append((time.monotonic() - started) * 1000)
+            stats['status'][status] = stats['status'].get(status, 0) + 1
+            if args.close or not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            stats['errors'] += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+        if args.interval:
+            next_post += args.interval
+            await asyncio.sleep(max(0.0, next_post - time.monotonic()))
+    if writer is not None:
+        writer.close()
+
+
+async def run(args):
+    stats = {'latencies': [], 'status': {}, 'errors': 0, 'connections': 0}
+    started = time.monotonic()
+    deadline = started + args.seconds
+    await asyncio.gather(*(device(i, args, stats, deadline) for i in range(args.devices)))
+    elapsed = time.monotonic() - started
+    return stats, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between posts per device (0 = back to back)')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--close', action='store_true', help='open a new connection for every post')
+    args = parser.parse_args()
+
+    stats, elapsed = asyncio.run(run(args))
+    latencies = stats['latencies']
+    offered = args.devices / args.interval if args.interval else None
+
+    print(f"devices={args.devices} interval={args.interval:g}s keep-alive={'no' if args.close else 'yes'} "
+          f"duration={elapsed:.1f}s")
+    if offered:
+        print(f"offered     {offered:>10,.1f} posts/s")
+    print(f"completed   {len(latencies) / elapsed:>10,.1f} posts/s")
+    print(f"latency ms  p50 {percentile(latencies, 0.5):.1f}  p95 {percentile(latencies, 0.95):.1f}  "
+          f"p99 {percentile(latencies, 0.99):.1f}")
+    print(f"status      {dict(sorted(stats['status'].items()))}  errors {stats['errors']}  "
+          f"connections {stats['connections']}")
+
+
+if __name__ == "__main__":
+    main()
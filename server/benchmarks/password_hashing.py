@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /pool/data latency during a login storm
+
+Runs the same workload once with password hashing inline on request threads
+(PASSWORD_HASH_WORKERS=0) and once with the hashing pool, each in its own
+process against a fresh temporary database:
+
+  1. quiet  - one device posting readings back to back
+  2. storm  - the same device while LOGIN_THREADS clients log in repeatedly,
+              each to its own account from its own address
+
+Usage:
+  python benchmarks/password_hashing.py [seconds-per-phase]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from threading import Thread, Event
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MODES = (('inline', '0'), ('pool', '2'))
+LOGIN_THREADS = 8
+
+SAMPLE = {
+    "device_id": "ESP32_POOL_001",
+    "sensors": {"ph": 7.2, "turbidity": 3.5, "temperature": 26.8},
+    "status": {"water_quality": "optimal", "wifi_rssi": -65, "uptime": 3600}
+}
+
+
+def print_header(text):
+    print("\n" + "="*50)
+    print(f" {text}")
+    print("="*50)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def run_mode(seconds):
+    """Child process: measure ingest latency without and with logins, print JSON"""
+    sys.path.insert(0, SERVER_DIR)
+    import main
+
+    main.startup()
+    client = main.app.test_client()
+    for index in range(LOGIN_THREADS):
+        client.post('/api/auth/register', json={'email': f'bench{index}@example.com', 'password': 'secret'})
+
+    def ingest(stop, latencies):
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.post('/pool/data', json=SAMPLE)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    def login(stop, index, counts):
+        login_client = main.app.test_client()
+        address = f'10.0.0.{index + 1}'
+        while not stop.is_set():
+            response = login_client.post(
+                '/api/auth/login', json={'email': f'bench{index}@example.com', 'password': 'secret'},
+                environ_base={'REMOTE_ADDR': address}
+            )
+            counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+    results = {}
+    for phase, logins in (('quiet', 0), ('storm', LOGIN_THREADS)):
+        stop = Event()
+        latencies = []
+        counts = {}
+        threads = [Thread(target=ingest, args=(stop, latencies))]
+        threads += [Thread(target=login, args=(stop, i, counts)) for i in range(logins)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        results[phase] = {
+            'ingest_per_s': len(latencies) / seconds,
+            'p50_ms': percentile(latencies, 0.5),
+            'p99_ms': percentile(latencies, 0.99),
+            'logins_per_s': counts.get(200, 0) / seconds,
+            'rejected': sum(count for status, count in counts.items() if status in (429, 503))
+        }
+    main.password_hasher.stop()
+    print(json.dumps(results))
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        run_mode(float(sys.argv[2]))
+        return
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    results = {}
+    for name, workers in MODES:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+                ARCHIVE_DIR=os.path.join(directory, 'archive'),
+                PASSWORD_HASH_WORKERS=workers,
+                DISPENSER_GENERATION_FILE=os.path.join(directory, 'dispenser.gen'),
+                DEVICE_GENERATION_FILE=os.path.join(directory, 'device.gen'),
+                PRINCIPAL_GENERATION_FILE=os.path.join(directory, 'principal.gen'),
+                RETENTION_INTERVAL='0'
+            )
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', str(seconds)],
+                env=env, cwd=SERVER_DIR, check=True, capture_output=True, text=True
+            ).stdout
+            results[name] = json.loads(output.strip().splitlines()[-1])
+
+    print_header(f"/pool/data during a login storm ({LOGIN_THREADS} login clients, {seconds:g}s per phase)")
+    print(f"{'':<26} {'inline':>10} {'pool':>10}")
+    for phase in ('quiet', 'storm'):
+        for key, label in (('ingest_per_s', 'readings/s'), ('p50_ms', 'ingest p50 ms'),
+                           ('p99_ms', 'ingest p99 ms'), ('logins_per_s', 'logins/s'),
+                           ('rejected', 'logins rejected (429/503)')):
+            if phase == 'quiet' and key in ('logins_per_s', 'rejected'):
+                continue
+            print(f"{phase + ' ' + label:<26} {results['inline'][phase][key]:>10,.1f} {results['pool'][phase][key]:>10,.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark: JSON vs compact binary payload decoding for /pool/data
+
+Measures bytes on the wire and decode throughput (payload bytes -> parsed
+reading dict) for the two formats accepted by the ingest endpoints.
+
+Usage:
+  python benchmarks/payload_decode.py [iterations]
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from main import parse_reading_payload, decode_binary_readings, encode_binary_reading  # noqa: E402
+
+# Same shape the pool-monitor firmware posts today
+SAMPLE = {
+    "device_id": "ESP32_POOL_001",
+    "sensors": {"ph": 7.2, "turbidity": 3.5, "temperature": 26.8},
+    "status": {"water_quality": "optimal", "wifi_rssi": -65, "uptime": 3600}
+}
+
+
+def print_header(text):
+    print("\n" + "="*50)
+    print(f" {text}")
+    print("="*50)
+
+
+def bench(name, fn, payload, iterations):
+    """Run fn(payload) iterations times and report readings/second"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(payload)
+    elapsed = time.perf_counter() - start
+    rate = iterations / elapsed
+    print(f"{name:<8} {len(payload):>5} bytes  {rate:>12,.0f} decodes/s  {elapsed / iterations * 1e6:>7.2f} us/decode")
+    return rate
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    json_body = json.dumps(SAMPLE, separators=(',', ':')).encode('utf-8')
+    binary_body = encode_binary_reading(parse_reading_payload(SAMPLE))
+
+    # Both formats must decode to the same stored values
+    from_json = parse_reading_payload(json.loads(json_body))
+    from_binary = decode_binary_readings(binary_body)[0]
+    for key in ('device_id', 'ph', 'turbidity', 'temperature', 'water_quality', 'wifi_rssi', 'uptime'):
+        assert from_json[key] == from_binary[key], (key, from_json[key], from_binary[key])
+
+    print_header(f"Payload decode ({iterations:,} iterations)")
+    json_rate = bench("json", lambda body: parse_reading_payload(json.loads(body)), json_body, iterations)
+    binary_rate = bench("binary", decode_binary_readings, binary_body, iterations)
+
+    print(f"\nBinary is {len(json_body) / len(binary_body):.1f}x smaller "
+          f"and decodes {binary_rate / json_rate:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request and startup cost of schema management
+
+Before versioned migrations every request ran db.create_all() from a
+before_request hook. This script measures the hot device endpoints with and
+without that hook (re-registered here only for comparison), counting the SQL
+statements each request issues and how many of them touch schema metadata,
+and times startup() on a fresh and on an up-to-date database.
+
+Usage:
+  python benchmarks/request_overhead.py [requests-per-endpoint]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+_directory = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_directory, 'bench.db')}")
+os.environ.setdefault('ARCHIVE_DIR', os.path.join(_directory, 'archive'))
+os.environ.setdefault('RETENTION_INTERVAL', '0')
+os.environ.setdefault('SQLITE_CHECKPOINT_INTERVAL', '0')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main  # noqa: E402
+
+SAMPLE = {
+    "device_id": "ESP32_POOL_001",
+    "sensors": {"ph": 7.2, "turbidity": 3.5, "temperature": 26.8},
+    "status": {"water_quality": "optimal", "wifi_rssi": -65, "uptime": 3600}
+}
+
+ENDPOINTS = (
+    ('POST /pool/data', lambda client: client.post('/pool/data', json=SAMPLE)),
+    ('GET /pool/config', lambda client: client.get('/pool/config?device_id=ESP32_POOL_001')),
+    ('GET /api/dispensing-jobs', lambda client: client.get('/api/dispensing-jobs?device_id=ESP32_POOL_001'))
+)
+
+# Statements that read or change the schema rather than data
+SCHEMA_PREFIXES = ('PRAGMA MAIN.TABLE_INFO', 'PRAGMA TEMP.TABLE_INFO', 'PRAGMA TABLE_INFO',
+                   'SELECT NAME FROM SQLITE_MASTER', 'CREATE ', 'ALTER ')
+
+
+class StatementCounter:
+    def __init__(self):
+        self.total = 0
+        self.schema = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.total += 1
+        if statement.lstrip().upper().startswith(SCHEMA_PREFIXES):
+            self.schema += 1
+
+
+def print_header(text):
+    print("\n" + "="*50)
+    print(f" {text}")
+    print("="*50)
+
+
+def measure(client, counter, requests):
+    results = []
+    for name, call in ENDPOINTS:
+        call(client)  # warm caches
+        counter.total = counter.schema = 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = call(client)
+            assert response.status_code < 500, response.get_data(as_text=True)
+        elapsed = time.perf_counter() - start
+        results.append((name, elapsed / requests * 1000, counter.total / requests, counter.schema / requests))
+    return results
+
+
+def main_benchmark():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+
+    started = time.perf_counter()
+    main.startup()
+    fresh_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    main.startup()
+    current_ms = (time.perf_counter() - started) * 1000
+
+    counter = StatementCounter()
+    with main.app.app_context():
+        main.db.event.listen(main.db.engine, 'before_cursor_execute', counter)
+    client = main.app.test_client()
+
+    after = measure(client, counter, requests)
+
+    # The hook every request used to run
+    def create_tables():
+        main.db.create_all()
+    main.app.before_request_funcs.setdefault(None, []).insert(0, create_tables)
+    before = measure(client, counter, requests)
+
+    print_header(f"Per-request overhead ({requests} requests each)")
+    print(f"{'':<26} {'ms/req':>16} {'SQL/req':>16} {'schema SQL/req':>18}")
+    print(f"{'':<26} {'before':>8}{'after':>8} {'before':>8}{'after':>8} {'before':>9}{'after':>9}")
+    for (name, ms_before, sql_before, schema_before), (_, ms_after, sql_after, schema_after) in zip(before, after):
+        print(f"{name:<26} {ms_before:>8.2f}{ms_after:>8.2f} {sql_before:>8.1f}{sql_after:>8.1f} "
+              f"{schema_before:>9.1f}{schema_after:>9.1f}")
+
+    print_header("Startup")
+    print(f"fresh database (all migrations)   {fresh_ms:>8.1f} ms")
+    print(f"up-to-date database               {current_ms:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark: stock SQLite vs the sqlite-performance engine profile
+
+Runs the same workload against a fresh temporary database once per
+DATABASE_PROFILE (each in its own process, since the profile is read at
+import time):
+
+  1. ingest   - single-reading commits, as posted by one ESP32 at a time
+  2. batch    - 100-reading commits, as written by the write-behind flusher
+  3. mixed    - one writer ingesting while reader threads page through
+                /api/devices/<id>/readings, measuring both sides
+
+Usage:
+  python benchmarks/sqlite_profile.py [seconds-per-phase]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from threading import Thread, Event
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PROFILES = ('default', 'sqlite-performance')
+READER_THREADS = 4
+
+
+def print_header(text):
+    print("\n" + "="*50)
+    print(f" {text}")
+    print("="*50)
+
+
+def reading(device_id, i):
+    return {
+        'device_id': device_id,
+        'timestamp': datetime.utcnow(),
+        'ph': 7.0 + (i % 10) / 10,
+        'turbidity': 3.5,
+        'temperature': 26.8,
+        'water_quality': 'optimal',
+        'wifi_rssi': -65,
+        'uptime': i
+    }
+
+
+def run_profile(seconds):
+    """Child process: run every phase against the configured database, print JSON"""
+    sys.path.insert(0, SERVER_DIR)
+    import main
+
+    with main.app.app_context():
+        main.db.create_all()
+        main.ingest_readings([reading('BENCH_READ', i) for i in range(1000)])
+
+    results = {}
+    with main.app.app_context():
+        count = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            main.ingest_readings([reading('BENCH_SINGLE', count)])
+            count += 1
+        results['ingest'] = count / seconds
+
+        count = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            main.ingest_readings([reading('BENCH_BATCH', count + i) for i in range(100)])
+            count += 100
+        results['batch'] = count / seconds
+
+    stop = Event()
+    writes = [0]
+    reads = [0] * READER_THREADS
+    errors = [0]
+
+    def writer():
+        with main.app.app_context():
+            while not stop.is_set():
+                try:
+                    main.ingest_readings([reading('BENCH_MIXED', writes[0])])
+                    writes[0] += 1
+                except Exception:
+                    main.db.session.rollback()
+                    errors[0] += 1
+
+    def reader(index):
+        client = main.app.test_client()
+        while not stop.is_set():
+            response = client.get('/api/devices/BENCH_READ/readings?limit=100')
+            if response.status_code == 200:
+                reads[index] += 1
+            else:
+                errors[0] += 1
+
+    threads = [Thread(target=writer)] + [Thread(target=reader, args=(i,)) for i in range(READER_THREADS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    results['mixed_writes'] = writes[0] / seconds
+    results['mixed_reads'] = sum(reads) / seconds
+    results['mixed_errors'] = errors[0]
+    print(json.dumps(results))
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        run_profile(float(sys.argv[2]))
+        return
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    results = {}
+    for profile in PROFILES:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+                DATABASE_PROFILE=profile,
+                ARCHIVE_DIR=os.path.join(directory, 'archive')
+            )
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', str(seconds)],
+                env=env, cwd=SERVER_DIR, check=True, capture_output=True, text=True
+            ).stdout
+            results[profile] = json.loads(output.strip().splitlines()[-1])
+
+    print_header(f"SQLite engine profiles ({seconds:g}s per phase)")
+    rows = (
+        ('ingest', 'single-reading commits/s'),
+        ('batch', 'readings/s in 100-row commits'),
+        ('mixed_writes', 'commits/s with readers running'),
+        ('mixed_reads', f'page reads/s ({READER_THREADS} readers)'),
+        ('mixed_errors', 'errors (locked database)')
+    )
+    print(f"{'':<40} {'default':>12} {'performance':>12} {'speedup':>8}")
+    for key, label in rows:
+        before = results['default'][key]
+        after = results['sqlite-performance'][key]
+        speedup = f"{after / before:.1f}x" if before else '-'
+        print(f"{label:<40} {before:>12,.0f} {after:>12,.0f} {speedup:>8}")
+
+
+if __name__ == "__main__":
+    main()
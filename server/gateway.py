@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Asyncio ingestion gateway for device traffic
+
+Serves the two endpoints every device calls, with the same payloads and
+responses as the Flask server:
+
+  POST /pool/data           JSON or compact binary reading
+  GET  /api/dispenser/get   dispenser poll, including ?wait= long-poll
+
+Connections are handled by one event loop, so tens of thousands of devices
+can hold keep-alive connections at the cost of a socket buffer each. Readings
+are validated on the loop and handed to a single database thread that stores
+whatever has queued up since its last commit with ingest_readings (the same
+bulk insert, rollups and alert evaluation as Flask), then answers every
+waiting device. Dispenser polls are answered from the per-process snapshot
+cache; misses are read on a separate thread pool, so polls never queue
+behind a commit. Dashboards and the admin API stay on the Flask server; run
+both against the same database:
+
+  python gateway.py                          # GATEWAY_PORT, default 5001
+  gunicorn -c gunicorn.conf.py wsgi:app      # everything else
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+import main
+
+GATEWAY_HOST = os.getenv('GATEWAY_HOST', '0.0.0.0')
+GATEWAY_PORT = int(os.getenv('GATEWAY_PORT', 5001))
+GATEWAY_QUEUE_SIZE = int(os.getenv('GATEWAY_QUEUE_SIZE', 10000))
+GATEWAY_BATCH_SIZE = int(os.getenv('GATEWAY_BATCH_SIZE', 500))
+GATEWAY_IDLE_TIMEOUT = int(os.getenv('GATEWAY_IDLE_TIMEOUT', 75))  # seconds
+GATEWAY_MAX_BODY = int(os.getenv('GATEWAY_MAX_BODY', 64 * 1024))  # bytes
+GATEWAY_BACKLOG = int(os.getenv('GATEWAY_BACKLOG', 4096))
+GATEWAY_READ_THREADS = int(os.getenv('GATEWAY_READ_THREADS', 2))
+
+
+class GatewayError(Exception):
+    """A request the gateway answers with an error status"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class IngestGateway:
+    """HTTP/1.1 front-end for device requests with a single batched database writer"""
+
+    def __init__(self, queue_size, batch_size, read_threads=GATEWAY_READ_THREADS):
+        self.batch_size = batch_size
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        # Every write runs on this one thread, in an app context
+        self.database = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gateway-db')
+        # Snapshot cache misses are read here, never behind a batch commit
+        self.reads = ThreadPoolExecutor(max_workers=read_threads, thread_name_prefix='gateway-read')
+        self._dispenser_changed = asyncio.Event()
+        self.connections = 0
+        self.requests = 0
+        self.batches = 0
+        self.stored = 0
+        self.failed = 0
+        self.rejected = 0
+        self.snapshot_reads = 0
+
+    # ---------- database threads ----------
+
+    @classmethod
+    def _store(cls, items):
+        """Store a batch of (reading, reported_version); returns a response body or exception per item"""
+        with main.app.app_context():
+            try:
+                reading_ids = main.ingest_readings([reading for reading, _ in items])
+                return [
+                    {
+                        'status': 'success',
+                        'message': 'Data received successfully',
+                        'reading_id': reading_id,
+                        **main.config_sync(reading['device_id'], reported_version)
+                    }
+                    for (reading, reported_version), reading_id in zip(items, reading_ids)
+                ]
+            except Exception as e:
+                main.db.session.rollback()
+                if len(items) == 1:
+                    return [e]
+                print(f"Gateway: error storing batch of {len(items)}: {e}")
+
+        # Retry one by one so a single bad reading does not fail the batch
+        return [cls._store([item])[0] for item in items]
+
+    @staticmethod
+    def _load_dispenser_snapshot(dispenser_id):
+        with main.app.app_context():
+            return main.dispenser_states.get(dispenser_id)
+
+    async def _run_db(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.database, function, *args)
+
+    async def _dispenser_snapshot(self, dispenser_id):
+        """The dispenser's snapshot from the cache, or from the read pool on a miss"""
+        snapshot = main.dispenser_states.cached(dispenser_id)
+        if snapshot is None:
+            self.snapshot_reads += 1
+            snapshot = await asyncio.get_running_loop().run_in_executor(
+                self.reads, self._load_dispenser_snapshot, dispenser_id
+            )
+        return snapshot
+
+    # ---------- background tasks ----------
+
+    async def writer(self):
+        """Commit queued readings in batches: whatever arrived while the last batch was written"""
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                bodies = await self._run_db(self._store, [(reading, version) for reading, version, _ in batch])
+            except Exception as e:
+                print(f"Gateway: error storing batch of {len(batch)}: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            for (reading, _, future), body in zip(batch, bodies):
+                if isinstance(body, Exception):
+                    print(f"Gateway: dropping reading for {reading['device_id']}: {body}")
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(body)
+                    continue
+                self.stored += 1
+                if not future.done():
+                    future.set_result(body)
+
+    async def dispenser_watcher(self):
+        """Wake long-poll waiters when any process bumps the dispenser generation"""
+        generation = main.dispenser_states.generation
+        last = generation.value()
+        while True:
+            await asyncio.sleep(main.DISPENSER_WATCH_INTERVAL_MS / 1000.0)
+            current = generation.value()
+            if current != last:
+                last = current
+                self._dispenser_changed.set()
+                self._dispenser_changed = asyncio.Event()
+
+    # ---------- endpoints ----------
+
+    async def receive_data(self, headers, body):
+        """POST /pool/data"""
+        reported_version = headers.get('x-config-version')
+        content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+        try:
+            if content_type in main.BINARY_READING_CONTENT_TYPES:
+                readings = main.decode_binary_readings(body)
+                if len(readings) != 1:
+                    raise ValueError('Expected exactly one binary reading')
+                reading = readings[0]
+            else:
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    data = None
+                reading = main.parse_reading_payload(data)
+                if data.get('config_version') is not None:
+                    reported_version = data['config_version']
+        except ValueError as e:
+            raise GatewayError(400, str(e))
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((reading, reported_version, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise GatewayError(503, 'Ingest queue is full, retry later',
+                               {'Retry-After': str(main.INGEST_RETRY_AFTER)})
+        try:
+            return 200, await future, {}
+        except Exception as e:
+            raise GatewayError(500, str(e))
+
+    async def get_dispenser_values(self, query):
+        """GET /api/dispenser/get, optionally long-polling with ?wait=<seconds>[&version=<n>]"""
+        dispenser_id = str(query.get('dispenser_id', [None])[0] or main.DEFAULT_DISPENSER_ID)[:50]
+        try:
+            wait = min(float(query.get('wait', ['0'])[0]), main.DISPENSER_LONGPOLL_MAX)
+            known_version = int(query['version'][0]) if 'version' in query else None
+        except ValueError:
+            wait, known_version = 0, None
+
+        if known_version is None:
+            satisfied = main.has_pending_dispense
+        else:
+            def satisfied(snapshot):
+                return snapshot.version != known_version
+
+        deadline = time.monotonic() + wait
+        while True:
+            changed = self._dispenser_changed
+            snapshot = await self._dispenser_snapshot(dispenser_id)
+            remaining = deadline - time.monotonic()
+            if wait <= 0 or satisfied(snapshot) or remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+        return 200, snapshot.values, {
+            'X-Dispenser-Id': snapshot.dispenser_id,
+            'X-Dispenser-Version': str(snapshot.version)
+        }
+
+    async def route(self, method, target, headers, body):
+        url = urlsplit(target)
+        if url.path == '/pool/data':
+            if method != 'POST':
+                raise GatewayError(405, 'Method not allowed')
+            return await self.receive_data(headers, body)
+        if url.path == '/api/dispenser/get':
+            if method != 'GET':
+                raise GatewayError(405, 'Method not allowed')
+            return await self.get_dispenser_values(parse_qs(url.query))
+        if url.path == '/api/gateway/stats':
+            if method != 'GET':
+                raise GatewayError(405, 'Method not allowed')
+            return 200, self.stats(), {}
+        raise GatewayError(404, 'Not found')
+
+    # ---------- HTTP/1.1 ----------
+
+    @staticmethod
+    def _response(status, body, headers, keep_alive):
+        payload = json.dumps(body, sort_keys=True).encode()
+        lines = [
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(payload)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"
+        ]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + payload
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), GATEWAY_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+                self.requests += 1
+                try:
+                    if 'chunked' in headers.get('transfer-encoding', '').lower():
+                        keep_alive = False
+                        raise GatewayError(411, 'Content-Length required')
+                    length = int(headers.get('content-length') or 0)
+                    if length > GATEWAY_MAX_BODY:
+                        keep_alive = False
+                        raise GatewayError(413, 'Payload too large')
+                    body = await reader.readexactly(length) if length else b''
+                    status, body, extra = await self.route(method, target, headers, body)
+                except GatewayError as e:
+                    status, body, extra = e.status, {'error': str(e)}, e.headers
+                except Exception as e:
+                    print(f"Gateway: error handling {method} {target}: {e}")
+                    keep_alive = False
+                    status, body, extra = 500, {'error': str(e)}, {}
+
+                writer.write(self._response(status, body, extra, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def stats(self):
+        return {
+            'connections': self.connections,
+            'requests': self.requests,
+            'queued': self.queue.qsize(),
+            'batches': self.batches,
+            'stored': self.stored,
+            'average_batch': round((self.stored + self.failed) / self.batches, 1) if self.batches else None,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'snapshot_reads': self.snapshot_reads
+        }
+
+
+async def serve(host=GATEWAY_HOST, port=GATEWAY_PORT):
+    gateway = IngestGateway(GATEWAY_QUEUE_SIZE, GATEWAY_BATCH_SIZE)
+    tasks = [asyncio.create_task(gateway.writer()), asyncio.create_task(gateway.dispenser_watcher())]
+    server = await asyncio.start_server(gateway.handle_connection, host, port, backlog=GATEWAY_BACKLOG)
+    print(f"Ingestion gateway listening on {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+        gateway.database.shutdown(wait=True)
+        gateway.reads.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    main.startup()
+    asyncio.run(serve())
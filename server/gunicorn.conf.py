@@ -0,0 +1,55 @@
+"""
+Gunicorn settings for the Pool Monitor API (gunicorn -c gunicorn.conf.py wsgi:app)
+
+Every value can be overridden from the environment (or .env). See the
+"Production Server" section of the README for sizing.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+# Worker processes; each runs its own copy of the in-process caches and workers,
+# kept in agreement through the shared generation files in instance/
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+
+# gthread: a thread pool per worker, idle keep-alive connections are parked in a
+# selector and cost no thread. gevent: one greenlet per connection. Long-poll
+# (?wait=) and SSE streams are only served under gevent (ASYNC_MODE=gevent);
+# under gthread they answer at once or 501 instead of pinning a thread each.
+worker_class = 'gevent' if os.getenv('ASYNC_MODE', '').lower() == 'gevent' else 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Seconds an idle client connection is kept open. Devices and the tunnel
+# reuse connections instead of paying a new handshake per reading; keep
+# this above the tunnel's keepAliveTimeout so the origin never closes first.
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 75))
+
+# Worker heartbeat timeout, and how long a reload (kill -HUP) or stop waits
+# for in-flight requests
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 90))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers after this many requests (0 = never)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+# The app must be imported after fork: startup() starts background threads
+preload_app = False
+
+
+def worker_exit(server, worker):
+    """Commit this worker's write-behind queue before it exits (reload, max_requests, stop)"""
+    import sys
+    main = sys.modules.get('main')
+    if main is not None:
+        main.write_behind.stop()
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
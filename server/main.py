@@ -1,22 +1,65 @@
-from flask import Flask, request, jsonify
+import os
+
+if os.getenv('ASYNC_MODE', '').lower() == 'gevent':
+    # Cooperative sockets and locks, so idle long-poll/SSE clients cost a greenlet each
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, request, jsonify, Response, stream_with_context
+import click
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
-import os
 import json
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
 import jwt
 from functools import wraps
-from threading import Lock
+from contextlib import contextmanager
+from threading import Lock, Thread, Event, Condition, BoundedSemaphore
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+import multiprocessing
+import atexit
+import queue
+import time
+from collections import namedtuple, OrderedDict, deque
+from operator import itemgetter
+import math
+import struct
+import mmap
+import base64
+import csv
+import heapq
+import io
+import sys
+import zlib
+from array import array
+from itertools import accumulate, chain, groupby
+from urllib.parse import quote, unquote
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locks
+    fcntl = None
 
 # Load environment variables
 load_dotenv()
 
 
 app = Flask(__name__)
+
+# Reverse proxies in front of the server (cloudflared, nginx) that append to
+# X-Forwarded-For, so request.remote_addr is the real client; 0 when clients
+# connect directly, otherwise they could spoof their address
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 1))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+
 # Allow all origins explicitly
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}},
+     expose_headers=['X-Next-Cursor', 'X-Dispenser-Id', 'X-Dispenser-Version', 'ETag', 'X-Config-Version'])
 
 # Database configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///pool_monitor.db')
@@ -24,40 +67,145 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
 db = SQLAlchemy(app)
 
-# Dispenser configuration
-DISPENSER_CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'dispenser_config.json')
-file_lock = Lock()
 
-def read_dispenser_config():
-    """Read dispenser configuration from JSON file"""
-    with file_lock:
-        try:
-            with open(DISPENSER_CONFIG_FILE, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            # Create default config if file doesn't exist
-            default_config = {
-                "dispenser1": "0",
-                "dispenser2": "0",
-                "dispenser3": "0",
-                "dispenser4": "0"
-            }
-            with open(DISPENSER_CONFIG_FILE, 'w') as f:
-                json.dump(default_config, f, indent=2)
-            return default_config
-        except json.JSONDecodeError:
+# ==================== DATABASE ENGINE PROFILE ====================
+#
+# DATABASE_PROFILE=sqlite-performance (the default for SQLite files) applies
+# pragmas to every new connection: WAL so dashboard reads never block
+# ingest writes, synchronous=NORMAL so a commit is a WAL append instead of a
+# full fsync, and a larger page cache and memory map. WAL checkpoints run in
+# a background thread instead of inside whichever commit crosses the limit.
+# DATABASE_PROFILE=default leaves SQLite's stock settings alone.
+
+DATABASE_PROFILE = os.getenv('DATABASE_PROFILE', 'sqlite-performance')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_TEMP_STORE = os.getenv('SQLITE_TEMP_STORE', 'MEMORY')
+SQLITE_CHECKPOINT_INTERVAL = int(os.getenv('SQLITE_CHECKPOINT_INTERVAL', 30))  # seconds, 0 disables
+SQLITE_WAL_TRUNCATE_BYTES = int(os.getenv('SQLITE_WAL_TRUNCATE_BYTES', 64 * 1024 * 1024))
+# Safety net for processes without the checkpoint thread (CLI commands)
+SQLITE_WAL_AUTOCHECKPOINT = int(os.getenv('SQLITE_WAL_AUTOCHECKPOINT', 10000))  # pages
+
+SQLITE_PROFILES = {
+    'sqlite-performance': (
+        ('journal_mode', 'WAL'),
+        ('synchronous', SQLITE_SYNCHRONOUS),
+        ('busy_timeout', SQLITE_BUSY_TIMEOUT_MS),
+        ('cache_size', -SQLITE_CACHE_SIZE_KB),
+        ('mmap_size', SQLITE_MMAP_SIZE),
+        ('temp_store', SQLITE_TEMP_STORE),
+        ('wal_autocheckpoint', SQLITE_WAL_AUTOCHECKPOINT)
+    ),
+    'default': ()
+}
+
+if DATABASE_PROFILE not in SQLITE_PROFILES:
+    raise ValueError(f'Unknown DATABASE_PROFILE {DATABASE_PROFILE!r}, expected one of: {", ".join(SQLITE_PROFILES)}')
+
+
+def uses_sqlite_file():
+    """True when the engine is SQLite backed by a file (WAL needs one)"""
+    url = db.engine.url
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def _apply_sqlite_profile(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PROFILES[DATABASE_PROFILE]:
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+with app.app_context():
+    if uses_sqlite_file():
+        db.event.listen(db.engine, 'connect', _apply_sqlite_profile)
+
+
+class SqliteCheckpointer:
+    """Background thread that checkpoints the SQLite WAL every ``interval`` seconds.
+
+    PASSIVE checkpoints never wait for readers or writers; once the WAL file
+    grows past SQLITE_WAL_TRUNCATE_BYTES a TRUNCATE checkpoint resets it.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+        self.checkpoints = 0
+        self.truncations = 0
+        self.busy = 0
+        self.last_wal_pages = None
+        self.last_checkpoint_ms = None
+        self.last_error = None
+
+    def start(self):
+        """Start the checkpoint thread (once per process) when the WAL profile is active"""
+        if not self.interval or DATABASE_PROFILE != 'sqlite-performance':
+            return
+        with app.app_context():
+            if not uses_sqlite_file():
+                return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name='sqlite-checkpoint', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.checkpoint()
+
+    def checkpoint(self):
+        started = time.perf_counter()
+        with app.app_context():
+            try:
+                wal_path = db.engine.url.database + '-wal'
+                mode = 'PASSIVE'
+                if os.path.exists(wal_path) and os.path.getsize(wal_path) > SQLITE_WAL_TRUNCATE_BYTES:
+                    mode = 'TRUNCATE'
+                with db.engine.connect() as connection:
+                    busy, wal_pages, _ = connection.exec_driver_sql(f'PRAGMA wal_checkpoint({mode})').one()
+                error = None
+            except Exception as e:
+                busy, wal_pages, error = 0, None, str(e)
+                print(f"Error checkpointing WAL: {e}")
+
+        with self._lock:
+            self.checkpoints += 1
+            if busy:
+                self.busy += 1
+            elif mode == 'TRUNCATE' and not error:
+                self.truncations += 1
+            self.last_wal_pages = wal_pages
+            self.last_checkpoint_ms = (time.perf_counter() - started) * 1000
+            self.last_error = error
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
             return {
-                "dispenser1": "0",
-                "dispenser2": "0",
-                "dispenser3": "0",
-                "dispenser4": "0"
+                'profile': DATABASE_PROFILE,
+                'checkpoint_interval_seconds': self.interval,
+                'running': self._thread is not None and self._thread.is_alive(),
+                'checkpoints': self.checkpoints,
+                'truncations': self.truncations,
+                'busy': self.busy,
+                'last_wal_pages': self.last_wal_pages,
+                'last_checkpoint_ms': round(self.last_checkpoint_ms, 3) if self.last_checkpoint_ms is not None else None,
+                'last_error': self.last_error
             }
 
-def write_dispenser_config(config):
-    """Write dispenser configuration to JSON file"""
-    with file_lock:
-        with open(DISPENSER_CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=2)
+
+sqlite_checkpointer = SqliteCheckpointer(SQLITE_CHECKPOINT_INTERVAL)
+atexit.register(sqlite_checkpointer.stop)
+
+# Legacy single-dispenser state file, imported by migration 4
+DISPENSER_CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'dispenser_config.json')
 
 
 # ==================== DATABASE MODELS ====================
@@ -78,7 +226,7 @@ class User(db.Model):
     
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, PASSWORD_HASH_METHOD)
     
     def check_password(self, password):
         """Check if provided password matches hash"""
@@ -150,6 +298,11 @@ class SensorReading(db.Model):
     wifi_rssi = db.Column(db.Integer)
     uptime = db.Column(db.Integer)
     
+    __table_args__ = (
+        # Per-device time range queries (dashboard charts, stats, latest)
+        db.Index('ix_pool_sensor_readings_device_timestamp', 'device_id', 'timestamp'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -168,6 +321,53 @@ class SensorReading(db.Model):
         }
 
 
+class SensorRollup(db.Model):
+    """Store per-device sensor aggregates for fixed time buckets"""
+    __tablename__ = 'pool_sensor_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.String(50), nullable=False)
+    resolution = db.Column(db.Integer, nullable=False)  # bucket width in seconds: 60, 3600, 86400
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    reading_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Per-metric count/sum/min/max (count excludes missing values)
+    ph_count = db.Column(db.Integer, nullable=False, default=0)
+    ph_sum = db.Column(db.Float, nullable=False, default=0.0)
+    ph_min = db.Column(db.Float)
+    ph_max = db.Column(db.Float)
+    turbidity_count = db.Column(db.Integer, nullable=False, default=0)
+    turbidity_sum = db.Column(db.Float, nullable=False, default=0.0)
+    turbidity_min = db.Column(db.Float)
+    turbidity_max = db.Column(db.Float)
+    temperature_count = db.Column(db.Integer, nullable=False, default=0)
+    temperature_sum = db.Column(db.Float, nullable=False, default=0.0)
+    temperature_min = db.Column(db.Float)
+    temperature_max = db.Column(db.Float)
+    
+    __table_args__ = (
+        db.UniqueConstraint('device_id', 'resolution', 'bucket_start', name='uq_pool_sensor_rollups_bucket'),
+    )
+
+
+class SensorSketchBin(db.Model):
+    """Store quantile sketch bin counts per device, metric and rollup bucket"""
+    __tablename__ = 'pool_sensor_sketch_bins'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.String(50), nullable=False)
+    resolution = db.Column(db.Integer, nullable=False)  # matches SensorRollup.resolution
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    metric = db.Column(db.String(20), nullable=False)  # ph, turbidity, temperature
+    bin = db.Column(db.Integer, nullable=False)  # QuantileSketch bin key
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('device_id', 'resolution', 'bucket_start', 'metric', 'bin',
+                            name='uq_pool_sensor_sketch_bins_bin'),
+    )
+
+
 class DeviceConfig(db.Model):
     """Store pool device configuration"""
     __tablename__ = 'pool_device_configs'
@@ -248,6 +448,13 @@ class Alert(db.Model):
     value = db.Column(db.Float)
     acknowledged = db.Column(db.Boolean, default=False)
     
+    __table_args__ = (
+        # Per-device alert listing ordered by time
+        db.Index('ix_pool_alerts_device_timestamp', 'device_id', 'timestamp'),
+        # Duplicate suppression: newest unacknowledged alert per device and type
+        db.Index('ix_pool_alerts_dedup', 'device_id', 'acknowledged', 'alert_type', 'timestamp'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -274,20 +481,381 @@ class ChemicalDispenser(db.Model):
     flag = db.Column(db.String(50), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
+    # Set while a dispenser holds the job (flag IN_PROGRESS) through /claim
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # Pending-job polling and claiming by status and device, in time order
+        db.Index('ix_chemical_dispenser_jobs_flag_device_timestamp', 'flag', 'device_id', 'timestamp'),
+        # Expired-lease sweep
+        db.Index('ix_chemical_dispenser_jobs_flag_lease', 'flag', 'lease_expires_at'),
+    )
+    
     def to_dict(self):
+        # float(): rows from UPDATE ... RETURNING can carry SQLite integers
         return {
             'id': self.id,
             'device_id': self.device_id,
-            'hcl': self.hcl,
-            'soda': self.soda,
-            'cl': self.cl,
-            'al': self.al,
+            'hcl': float(self.hcl),
+            'soda': float(self.soda),
+            'cl': float(self.cl),
+            'al': float(self.al),
             'flag': self.flag,
             'timestamp': self.timestamp.isoformat()
         }
 
 
+class DispenserState(db.Model):
+    """Store the pending dispense values of one physical dispenser"""
+    __tablename__ = 'dispenser_states'
+    
+    dispenser_id = db.Column(db.String(50), primary_key=True)
+    # Values are kept as the strings the firmware parses ("0" = idle)
+    dispenser1 = db.Column(db.String(20), nullable=False, default='0')
+    dispenser2 = db.Column(db.String(20), nullable=False, default='0')
+    dispenser3 = db.Column(db.String(20), nullable=False, default='0')
+    dispenser4 = db.Column(db.String(20), nullable=False, default='0')
+    version = db.Column(db.Integer, nullable=False, default=1)  # incremented by every write
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class SchemaMigration(db.Model):
+    """Record of an applied schema migration"""
+    __tablename__ = 'pool_schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    duration_ms = db.Column(db.Float)
+
+
+# ==================== SHARED GENERATION COUNTERS ====================
+#
+# Per-process caches (device configs, dispenser state, alert de-duplication)
+# learn about writes made by other worker processes on the host through a
+# counter in a small memory-mapped file: writers increment it, readers compare
+# one integer.
+
+class SharedGeneration:
+    """A 64-bit counter in a memory-mapped file, shared by processes on one host"""
+
+    _COUNTER = struct.Struct('<Q')
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self._file = None
+        self._map = None
+
+    def _open(self):
+        with self._lock:
+            if self._map is not None:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            handle = open(self.path, 'a+b')
+            if os.path.getsize(self.path) < self._COUNTER.size:
+                handle.write(b'\0' * self._COUNTER.size)
+                handle.flush()
+            self._file = handle
+            self._map = mmap.mmap(handle.fileno(), self._COUNTER.size)
+
+    def value(self):
+        """Current generation; a memory read, no system call"""
+        if self._map is None:
+            self._open()
+        return self._COUNTER.unpack_from(self._map, 0)[0]
+
+    def increment(self):
+        if self._map is None:
+            self._open()
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                value = self._COUNTER.unpack_from(self._map, 0)[0] + 1
+                self._COUNTER.pack_into(self._map, 0, value)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+        return value
+
+
+# ==================== PASSWORD HASHING ====================
+#
+# Password hashing is deliberately slow, so it runs in a small pool of
+# low-priority worker processes instead of on request threads. A burst of
+# logins then queues for the pool rather than competing with /pool/data for
+# CPU. The queue is bounded (503 when full) and each client address and
+# account may only have a few hashes in flight (429 beyond that).
+
+# werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000";
+# hashes made with other parameters are upgraded on the next login
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # 0 hashes inline
+# Hashes queued or running before new ones get 503 at once; a few per worker
+# keeps the longest wait to a few hash times rather than the timeout
+PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 4 * max(PASSWORD_HASH_WORKERS, 1)))
+PASSWORD_HASH_PER_CLIENT = int(os.getenv('PASSWORD_HASH_PER_CLIENT', 2))
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 3))  # seconds a request thread may wait
+PASSWORD_HASH_NICE = int(os.getenv('PASSWORD_HASH_NICE', 10))
+
+
+class PasswordHashingBusy(Exception):
+    """The hashing pool cannot take this request now"""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class PasswordHasher:
+    """Bounded process pool for generate_password_hash/check_password_hash"""
+
+    def __init__(self, method, workers, queue_size, per_client, timeout, nice):
+        self.method = method
+        self.workers = workers
+        self.queue_size = queue_size
+        self.per_client = per_client
+        self.timeout = timeout
+        self.nice = nice
+        self._executor = None
+        self._lock = Lock()
+        self._slots = BoundedSemaphore(queue_size)
+        self._in_flight = {}
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected_busy = 0
+        self.rejected_client = 0
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: never fork a process that holds database connections and threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=os.nice,
+                    initargs=(self.nice,)
+                )
+            return self._executor
+
+    @contextmanager
+    def _client_slot(self, keys):
+        """Cap concurrent hashes per client key (address, account)"""
+        keys = [key for key in keys if key]
+        with self._lock:
+            if any(self._in_flight.get(key, 0) >= self.per_client for key in keys):
+                self.rejected_client += 1
+                raise PasswordHashingBusy('Too many concurrent authentication attempts', 429)
+            for key in keys:
+                self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for key in keys:
+                    remaining = self._in_flight[key] - 1
+                    if remaining:
+                        self._in_flight[key] = remaining
+                    else:
+                        del self._in_flight[key]
+
+    def _run(self, keys, function, *args):
+        if self.workers <= 0:
+            return function(*args)
+        with self._client_slot(keys):
+            if not self._slots.acquire(blocking=False):
+                with self._lock:
+                    self.rejected_busy += 1
+                raise PasswordHashingBusy('Authentication is busy, retry later', 503)
+            try:
+                future = self._pool().submit(function, *args)
+            except Exception:
+                self._slots.release()
+                raise
+            # A job that outlives its request still occupies the pool, so its
+            # slot is only freed once the job itself finishes
+            future.add_done_callback(lambda _: self._slots.release())
+            try:
+                return future.result(timeout=self.timeout)
+            except FuturesTimeoutError:
+                with self._lock:
+                    self.rejected_busy += 1
+                raise PasswordHashingBusy('Authentication timed out, retry later', 503)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def hash(self, password, keys=()):
+        self._count('hashed')
+        return self._run(keys, generate_password_hash, password, self.method)
+
+    def rehash(self, password, keys=()):
+        """Hash a password again with self.method after a successful login"""
+        self._count('rehashed')
+        return self.hash(password, keys)
+
+    def verify(self, password_hash, password, keys=()):
+        self._count('verified')
+        return self._run(keys, check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if a stored hash was made with other parameters than self.method"""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def stop(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'method': self.method,
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'per_client': self.per_client,
+                'in_flight_clients': len(self._in_flight),
+                'hashed': self.hashed,
+                'verified': self.verified,
+                'rehashed': self.rehashed,
+                'rejected_busy': self.rejected_busy,
+                'rejected_client': self.rejected_client
+            }
+
+
+password_hasher = PasswordHasher(
+    PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE,
+    PASSWORD_HASH_PER_CLIENT, PASSWORD_HASH_TIMEOUT, PASSWORD_HASH_NICE
+)
+atexit.register(password_hasher.stop)
+
+
+def _busy_response(e):
+    return jsonify({'error': str(e)}), e.status, {'Retry-After': '1'}
+
+
 # ==================== AUTHENTICATION DECORATOR ====================
+#
+# Verified tokens are cached as lightweight principals, so repeated requests
+# with the same token skip both the signature check and the User lookup.
+# Entries expire after PRINCIPAL_CACHE_TTL seconds (never after the token's
+# own exp) and are dropped when a user's role, active flag or password
+# changes, in every worker on the host through a shared generation counter.
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv('PRINCIPAL_CACHE_SIZE', 1024))
+PRINCIPAL_CACHE_TTL = int(os.getenv('PRINCIPAL_CACHE_TTL', 60))  # seconds
+
+# What protected endpoints get as current_user; load the User row when more is needed
+Principal = namedtuple('Principal', ('id', 'email', 'role', 'is_active'))
+
+# User columns whose change must drop cached principals
+PRINCIPAL_FIELDS = ('role', 'is_active', 'password_hash')
+
+
+class PrincipalCache:
+    """Bounded LRU/TTL cache of verified token -> Principal"""
+
+    def __init__(self, size, ttl, shared_generation):
+        self.size = size
+        self.ttl = ttl
+        self.shared_generation = shared_generation
+        self._shared_seen = None
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, token):
+        """Cached principal for a token, or None; raises ExpiredSignatureError past the token's exp"""
+        if self.size <= 0:
+            return None
+        shared = self.shared_generation.value()
+        now = time.time()
+        with self._lock:
+            if shared != self._shared_seen:
+                # A user changed in another worker
+                self._entries.clear()
+                self._shared_seen = shared
+            entry = self._entries.get(token)
+            if entry is None or entry[2] <= now:
+                self.misses += 1
+                if entry is not None and entry[1] <= now:
+                    del self._entries[token]
+                    raise jwt.ExpiredSignatureError('Signature has expired')
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token, principal, token_exp):
+        if self.size <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._entries[token] = (principal, token_exp, min(now + self.ttl, token_exp))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        """Drop every cached token of these users, here and in other workers"""
+        with self._lock:
+            self.invalidations += 1
+            for token in [token for token, entry in self._entries.items() if entry[0].id in user_ids]:
+                del self._entries[token]
+        shared = self.shared_generation.increment()
+        with self._lock:
+            if self._shared_seen == shared - 1:
+                self._shared_seen = shared
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'invalidations': self.invalidations
+            }
+
+
+principal_cache = PrincipalCache(
+    PRINCIPAL_CACHE_SIZE,
+    PRINCIPAL_CACHE_TTL,
+    SharedGeneration(os.getenv(
+        'PRINCIPAL_GENERATION_FILE', os.path.join(app.instance_path, 'principal.gen')
+    ))
+)
+
+
+@db.event.listens_for(User, 'after_update')
+def _track_principal_change(mapper, connection, target):
+    """Remember users whose role, active flag or password changed in this session"""
+    state = db.inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in PRINCIPAL_FIELDS):
+        state.session.info.setdefault('principal_changes', set()).add(target.id)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _invalidate_changed_principals(session):
+    changed = session.info.pop('principal_changes', None)
+    if changed:
+        principal_cache.invalidate(changed)
+
+
+@db.event.listens_for(db.session, 'after_soft_rollback')
+def _discard_principal_changes(session, previous_transaction):
+    session.info.pop('principal_changes', None)
+
 
 def token_required(f):
     """Decorator to require JWT token for protected routes"""
@@ -302,11 +870,16 @@ def token_required(f):
             if token.startswith('Bearer '):
                 token = token[7:]
             
-            data = jwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
-            
-            if not current_user or not current_user.is_active:
-                return jsonify({'error': 'Token is invalid'}), 401
+            current_user = principal_cache.get(token)
+            if current_user is None:
+                data = jwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
+                user = User.query.get(data['user_id'])
+                
+                if not user or not user.is_active:
+                    return jsonify({'error': 'Token is invalid'}), 401
+                
+                current_user = Principal(user.id, user.email, user.role, user.is_active)
+                principal_cache.put(token, current_user, data.get('exp', time.time() + PRINCIPAL_CACHE_TTL))
                 
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token has expired'}), 401
@@ -346,7 +919,7 @@ def register():
             last_name=data.get('last_name'),
             role=data.get('role', 'user')
         )
-        user.set_password(data['password'])
+        user.password_hash = password_hasher.hash(data['password'], (request.remote_addr,))
         
         db.session.add(user)
         db.session.commit()
@@ -360,6 +933,9 @@ def register():
             'token': token
         }), 201
         
+    except PasswordHashingBusy as e:
+        db.session.rollback()
+        return _busy_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -377,12 +953,17 @@ def login():
         # Find user by email
         user = User.query.filter_by(email=data['email']).first()
         
-        if not user or not user.check_password(data['password']):
+        keys = (request.remote_addr, data['email'])
+        if not user or not password_hasher.verify(user.password_hash, data['password'], keys):
             return jsonify({'error': 'Invalid credentials'}), 401
         
         if not user.is_active:
             return jsonify({'error': 'Account is deactivated'}), 401
         
+        # Upgrade hashes made with older cost parameters
+        if password_hasher.needs_rehash(user.password_hash):
+            user.password_hash = password_hasher.rehash(data['password'], keys)
+        
         # Update last login
         user.last_login = datetime.utcnow()
         db.session.commit()
@@ -396,6 +977,9 @@ def login():
             'token': token
         }), 200
         
+    except PasswordHashingBusy as e:
+        db.session.rollback()
+        return _busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -404,7 +988,8 @@ def login():
 @token_required
 def get_profile(current_user):
     """Get current user profile"""
-    return jsonify(current_user.to_dict()), 200
+    user = User.query.get(current_user.id)
+    return jsonify(user.to_dict()), 200
 
 
 @app.route('/api/auth/profile', methods=['PUT'])
@@ -417,17 +1002,19 @@ def update_profile(current_user):
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
+        user = User.query.get(current_user.id)
+        
         # Update allowed fields
         if 'first_name' in data:
-            current_user.first_name = data['first_name']
+            user.first_name = data['first_name']
         if 'last_name' in data:
-            current_user.last_name = data['last_name']
+            user.last_name = data['last_name']
         
         db.session.commit()
         
         return jsonify({
             'message': 'Profile updated successfully',
-            'user': current_user.to_dict()
+            'user': user.to_dict()
         }), 200
         
     except Exception as e:
@@ -445,16 +1032,22 @@ def change_password(current_user):
         if not data or not data.get('current_password') or not data.get('new_password'):
             return jsonify({'error': 'Current password and new password required'}), 400
         
+        user = User.query.get(current_user.id)
+        keys = (request.remote_addr, user.email)
+        
         # Verify current password
-        if not current_user.check_password(data['current_password']):
+        if not password_hasher.verify(user.password_hash, data['current_password'], keys):
             return jsonify({'error': 'Current password is incorrect'}), 401
         
         # Set new password
-        current_user.set_password(data['new_password'])
+        user.password_hash = password_hasher.hash(data['new_password'], keys)
         db.session.commit()
         
         return jsonify({'message': 'Password changed successfully'}), 200
         
+    except PasswordHashingBusy as e:
+        db.session.rollback()
+        return _busy_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -474,210 +1067,2770 @@ def get_users(current_user):
         return jsonify({'error': str(e)}), 500
 
 
-# ==================== API ENDPOINTS ====================
+# ==================== DEVICE CACHE ====================
 
-@app.route('/pool/data', methods=['POST'])
-def receive_data():
-    """Receive sensor data from ESP32 devices"""
-    try:
-        data = request.get_json()
-        
-        if not data or 'device_id' not in data:
-            return jsonify({'error': 'Invalid data format'}), 400
-        
-        device_id = data['device_id']
-        
-        # Get or create device
-        device = Device.query.filter_by(device_id=device_id).first()
-        if not device:
-            device = Device(device_id=device_id)
-            db.session.add(device)
-            
-            # Create default config for new device
-            config = DeviceConfig(device_id=device_id)
-            db.session.add(config)
-        
-        # Update last seen
-        device.last_seen = datetime.utcnow()
-        
-        # Extract sensor data
-        sensors = data.get('sensors', {})
-        status = data.get('status', {})
-        
-        # Create sensor reading
-        reading = SensorReading(
-            device_id=device_id,
-            ph=sensors.get('ph'),
-            turbidity=sensors.get('turbidity'),
-            temperature=sensors.get('temperature'),
-            water_quality=status.get('water_quality'),
-            wifi_rssi=status.get('wifi_rssi'),
-            uptime=status.get('uptime')
-        )
-        db.session.add(reading)
-        
-        # Check for critical conditions and create alerts
-        config = device.config
-        if config:
-            alerts_to_create = []
-            
-            # Check pH
-            ph = sensors.get('ph')
-            if ph and (ph < config.ph_optimal - 1.0 or ph > config.ph_critical):
-                alerts_to_create.append({
-                    'type': 'ph_critical',
-                    'severity': 'critical',
-                    'message': f'pH level is critical: {ph:.2f}',
-                    'value': ph
-                })
-            
-            # Check turbidity
-            turbidity = sensors.get('turbidity')
-            if turbidity and turbidity > config.turbidity_critical:
-                alerts_to_create.append({
-                    'type': 'turbidity_critical',
-                    'severity': 'critical',
-                    'message': f'Turbidity level is critical: {turbidity:.2f} NTU',
-                    'value': turbidity
-                })
-            
-            # Check temperature
-            temperature = sensors.get('temperature')
-            if temperature and (temperature < config.temp_optimal - 4.0 or temperature > config.temp_critical):
-                alerts_to_create.append({
-                    'type': 'temperature_critical',
-                    'severity': 'critical',
-                    'message': f'Temperature is critical: {temperature:.2f}°C',
-                    'value': temperature
-                })
-            
-            # Create alerts (avoid duplicates within 5 minutes)
-            for alert_data in alerts_to_create:
-                recent_alert = Alert.query.filter_by(
-                    device_id=device_id,
-                    alert_type=alert_data['type'],
-                    acknowledged=False
-                ).filter(
-                    Alert.timestamp > datetime.utcnow() - timedelta(minutes=5)
-                ).first()
-                
-                if not recent_alert:
-                    alert = Alert(
-                        device_id=device_id,
-                        alert_type=alert_data['type'],
-                        severity=alert_data['severity'],
-                        message=alert_data['message'],
-                        value=alert_data['value']
-                    )
-                    db.session.add(alert)
-        
-        db.session.commit()
-        
-        return jsonify({
-            'status': 'success',
-            'message': 'Data received successfully',
-            'reading_id': reading.id
-        }), 200
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error receiving data: {e}")
-        return jsonify({'error': str(e)}), 500
+# Seconds a cached device config is trusted; bounds staleness across worker processes
+DEVICE_CACHE_TTL = int(os.getenv('DEVICE_CACHE_TTL', 300))
 
+DEVICE_CONFIG_FIELDS = (
+    'ph_offset', 'ph_slope', 'turbidity_offset', 'turbidity_slope', 'temp_offset',
+    'ph_optimal', 'ph_acceptable', 'ph_critical',
+    'turbidity_optimal', 'turbidity_acceptable', 'turbidity_critical',
+    'temp_optimal', 'temp_acceptable', 'temp_critical',
+    'post_interval', 'config_interval', 'updated_at'
+)
 
-@app.route('/pool/config', methods=['GET'])
-def get_config():
-    """Send configuration to ESP32 device"""
-    try:
-        device_id = request.args.get('device_id')
-        
-        if not device_id:
-            return jsonify({'error': 'device_id parameter required'}), 400
-        
-        # Get or create device config
-        config = DeviceConfig.query.filter_by(device_id=device_id).first()
-        
-        if not config:
-            # Create default config
-            device = Device.query.filter_by(device_id=device_id).first()
-            if not device:
-                device = Device(device_id=device_id)
-                db.session.add(device)
-            
-            config = DeviceConfig(device_id=device_id)
-            db.session.add(config)
-            db.session.commit()
-        
-        return jsonify(config.to_dict()), 200
-        
-    except Exception as e:
-        print(f"Error getting config: {e}")
-        return jsonify({'error': str(e)}), 500
+# Detached, read-only copy of a DeviceConfig row
+DeviceConfigSnapshot = namedtuple('DeviceConfigSnapshot', DEVICE_CONFIG_FIELDS)
 
 
-# ==================== WEB API ENDPOINTS (for dashboard/admin) ====================
+class DeviceCache:
+    """Process-local cache of known devices and their config values.
 
-@app.route('/api/devices', methods=['GET'])
-def get_devices():
-    """Get all registered devices"""
-    try:
-        devices = Device.query.all()
-        return jsonify([device.to_dict() for device in devices]), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    An entry means the device row and its config row both exist, so the
+    ingest path can skip its SELECTs. Entries are dropped by the config and
+    device update endpoints, in every worker on the host through the shared
+    generation counter, and expire after ``ttl`` seconds.
+    """
 
+    def __init__(self, ttl, shared_generation):
+        self.ttl = ttl
+        self.shared_generation = shared_generation
+        self._shared_seen = None
+        self._entries = {}
+        self._lock = Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
 
-@app.route('/api/devices/<device_id>', methods=['GET'])
-def get_device(device_id):
-    """Get specific device information"""
-    try:
-        device = Device.query.filter_by(device_id=device_id).first()
-        if not device:
-            return jsonify({'error': 'Device not found'}), 404
-        
-        return jsonify(device.to_dict()), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    @property
+    def generation(self):
+        """Counter bumped by every invalidation, used to discard racing loads"""
+        return self._generation
 
+    def get_many(self, device_ids):
+        """Return ({device_id: snapshot} for cached ids, set of missing ids)"""
+        now = time.monotonic()
+        shared = self.shared_generation.value()
+        found = {}
+        missing = set()
+        with self._lock:
+            if shared != self._shared_seen:
+                # Another worker changed a device or config
+                self._entries.clear()
+                self._generation += 1
+                self._shared_seen = shared
+            for device_id in device_ids:
+                entry = self._entries.get(device_id)
+                if entry is not None and entry[1] > now:
+                    found[device_id] = entry[0]
+                else:
+                    missing.add(device_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
 
-@app.route('/api/devices/<device_id>', methods=['PUT'])
-def update_device(device_id):
-    """Update device information"""
-    try:
-        device = Device.query.filter_by(device_id=device_id).first()
-        if not device:
-            return jsonify({'error': 'Device not found'}), 404
-        
-        data = request.get_json()
-        if 'name' in data:
-            device.name = data['name']
-        if 'location' in data:
-            device.location = data['location']
-        
-        db.session.commit()
-        return jsonify(device.to_dict()), 200
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': str(e)}), 500
+    @staticmethod
+    def snapshot(config):
+        """Detached copy of a DeviceConfig row's values"""
+        return DeviceConfigSnapshot(*(getattr(config, field) for field in DEVICE_CONFIG_FIELDS))
+
+    def put(self, device_id, config, generation):
+        """Cache a config row unless an invalidation happened since ``generation``"""
+        return self.store(device_id, self.snapshot(config), generation)
+
+    def store(self, device_id, snapshot, generation):
+        """Cache a snapshot unless an invalidation happened since ``generation``"""
+        with self._lock:
+            if generation == self._generation:
+                self._entries[device_id] = (snapshot, time.monotonic() + self.ttl)
+        return snapshot
+
+    def invalidate(self, device_id=None):
+        """Drop one device (or every device) from this and every other worker's cache"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if device_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(device_id, None)
+        shared = self.shared_generation.increment()
+        with self._lock:
+            # Our own write needs no full clear
+            if self._shared_seen == shared - 1:
+                self._shared_seen = shared
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'invalidations': self.invalidations
+            }
+
+
+device_cache = DeviceCache(
+    DEVICE_CACHE_TTL,
+    SharedGeneration(os.getenv(
+        'DEVICE_GENERATION_FILE', os.path.join(app.instance_path, 'device_config.gen')
+    ))
+)
+
+
+def get_device_configs(device_ids):
+    """Return {device_id: DeviceConfigSnapshot} for devices that have a config"""
+    generation = device_cache.generation
+    configs, missing = device_cache.get_many(device_ids)
+    if missing:
+        for config in DeviceConfig.query.filter(DeviceConfig.device_id.in_(missing)).all():
+            configs[config.device_id] = device_cache.put(config.device_id, config, generation)
+    return configs
+
+
+def config_version(updated_at):
+    """Config version derived from DeviceConfig.updated_at (microseconds since the epoch)"""
+    if updated_at is None:
+        return 0
+    return int((updated_at - datetime(1970, 1, 1)).total_seconds() * 1000000)
+
+
+def snapshot_config_dict(device_id, snapshot):
+    """Same body as DeviceConfig.to_dict(), built from a cached snapshot"""
+    return DeviceConfig(device_id=device_id, **snapshot._asdict()).to_dict()
+
+
+def config_response(device_id, snapshot):
+    """Serve a cached config with an ETag; 304 if the client already has this version"""
+    version = config_version(snapshot.updated_at)
+    if request.if_none_match.contains(str(version)):
+        response = Response(status=304)
+    else:
+        response = jsonify(snapshot_config_dict(device_id, snapshot))
+    response.set_etag(str(version))
+    response.headers['X-Config-Version'] = str(version)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def config_sync(device_id, reported_version):
+    """Config fields for a /pool/data response: the current version, plus the
+    config itself when the version the device reported is stale"""
+    snapshot = get_device_configs([device_id]).get(device_id)
+    if snapshot is None:
+        return {}
+    version = config_version(snapshot.updated_at)
+    sync = {'config_version': version}
+    if reported_version is not None and str(reported_version).strip('"') != str(version):
+        sync['config'] = snapshot_config_dict(device_id, snapshot)
+    return sync
+
+
+# ==================== ALERT DEDUPLICATION ====================
+
+# Unacknowledged alerts of the same type are not repeated within this window
+ALERT_DEDUP_SECONDS = int(os.getenv('ALERT_DEDUP_SECONDS', 300))
+
+# Per-type overrides, e.g. "ph_critical=600,temperature_critical=1800"
+ALERT_DEDUP_WINDOWS = {
+    alert_type.strip(): int(seconds)
+    for alert_type, seconds in (
+        item.split('=', 1) for item in os.getenv('ALERT_DEDUP_WINDOWS', '').split(',') if '=' in item
+    )
+}
+
+# Seconds between full re-reads of the index from the database, as a
+# backstop to the shared generation counter
+ALERT_INDEX_REFRESH = int(os.getenv('ALERT_INDEX_REFRESH', 60))
+
+
+class AlertDedupIndex:
+    """In-memory index of the newest unacknowledged alert per (device_id, alert_type).
+
+    Replaces the per-candidate SQL lookup in the ingest path with a dict
+    probe. The index is loaded from the database on first use, kept in sync
+    by the ingest path and acknowledge_alert, and re-read when another
+    process on the host raises or acknowledges an alert (shared generation
+    counter) or after ``refresh_seconds``. Two workers claiming the same key
+    within the moment between one's commit and its counter bump can still
+    both raise the alert.
+    """
+
+    def __init__(self, default_seconds, windows, refresh_seconds, shared_generation):
+        self.default_window = timedelta(seconds=default_seconds)
+        self.windows = {alert_type: timedelta(seconds=seconds) for alert_type, seconds in windows.items()}
+        self.refresh_seconds = refresh_seconds
+        self.shared_generation = shared_generation
+        self._shared_seen = None
+        self._latest = {}
+        self._lock = Lock()
+        self._loaded_at = None
+        self._recent_claims = None
+        self.reloads = 0
+
+    def window(self, alert_type):
+        return self.windows.get(alert_type, self.default_window)
+
+    def warm(self):
+        """Load the newest unacknowledged alert times from the database"""
+        # Read first: a change committed during the query triggers another load
+        shared = self.shared_generation.value()
+        with self._lock:
+            self._recent_claims = {}
+
+        try:
+            rows = db.session.query(
+                Alert.device_id, Alert.alert_type, db.func.max(Alert.timestamp)
+            ).filter(
+                Alert.acknowledged.is_(False)
+            ).group_by(Alert.device_id, Alert.alert_type).all()
+        except Exception:
+            with self._lock:
+                self._recent_claims = None
+            raise
+
+        with self._lock:
+            latest = {(device_id, alert_type): timestamp for device_id, alert_type, timestamp in rows}
+            # Keep claims made while the query was running
+            for key, timestamp in self._recent_claims.items():
+                if key not in latest or latest[key] < timestamp:
+                    latest[key] = timestamp
+            self._latest = latest
+            self._recent_claims = None
+            self._loaded_at = time.monotonic()
+            self._shared_seen = shared
+            self.reloads += 1
+
+    def _ensure_fresh(self):
+        loaded_at = self._loaded_at
+        if (loaded_at is None or self.shared_generation.value() != self._shared_seen
+                or time.monotonic() - loaded_at > self.refresh_seconds):
+            self.warm()
+
+    def changed(self):
+        """Tell every other process on the host to reload, after alerts were committed or acknowledged"""
+        shared = self.shared_generation.increment()
+        with self._lock:
+            # Our own change is already in this index
+            if self._shared_seen == shared - 1:
+                self._shared_seen = shared
+
+    def claim(self, device_id, alert_type, timestamp):
+        """Reserve an alert slot; returns (claimed, previous) for restore()"""
+        self._ensure_fresh()
+        key = (device_id, alert_type)
+        with self._lock:
+            previous = self._latest.get(key)
+            if previous is not None and timestamp - previous < self.window(alert_type):
+                return False, previous
+            self._latest[key] = timestamp
+            if self._recent_claims is not None:
+                self._recent_claims[key] = timestamp
+            return True, previous
+
+    def restore(self, device_id, alert_type, previous):
+        """Undo a claim whose alert was not committed"""
+        key = (device_id, alert_type)
+        with self._lock:
+            if previous is None:
+                self._latest.pop(key, None)
+            else:
+                self._latest[key] = previous
+
+    def refresh(self, device_id, alert_type):
+        """Re-read one key from the database, e.g. after an acknowledgement"""
+        latest = db.session.query(db.func.max(Alert.timestamp)).filter(
+            Alert.device_id == device_id,
+            Alert.alert_type == alert_type,
+            Alert.acknowledged.is_(False)
+        ).scalar()
+
+        key = (device_id, alert_type)
+        with self._lock:
+            if latest is None:
+                self._latest.pop(key, None)
+            else:
+                self._latest[key] = latest
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._latest),
+                'default_window_seconds': self.default_window.total_seconds(),
+                'windows': {alert_type: window.total_seconds() for alert_type, window in self.windows.items()},
+                'refresh_seconds': self.refresh_seconds,
+                'reloads': self.reloads
+            }
+
+
+alert_index = AlertDedupIndex(
+    ALERT_DEDUP_SECONDS, ALERT_DEDUP_WINDOWS, ALERT_INDEX_REFRESH,
+    SharedGeneration(os.getenv(
+        'ALERT_GENERATION_FILE', os.path.join(app.instance_path, 'alert_index.gen')
+    ))
+)
+
+
+# ==================== LIVE READING STREAM ====================
+#
+# After each commit, ingest_readings (in any worker, or the gateway) encodes
+# the stored readings and new alerts as SSE frames once and appends them to
+# a ring in a memory-mapped file shared by every process on the host. The
+# appender numbers frames under a file lock, after its own commit, so the
+# sequence follows commit order whatever the database. Each process with
+# stream viewers runs one thread that copies new frames out of the ring and
+# hands them to an in-process broker. Dashboards subscribe per device or for
+# the whole fleet over Server-Sent Events, so N viewers of a pool cost one
+# publish instead of N polling queries, and no viewer adds a database read.
+# A slow subscriber loses its oldest queued events rather than blocking
+# ingest. While no process has a subscriber, ingest skips all of this.
+
+READING_STREAM_QUEUE_SIZE = int(os.getenv('READING_STREAM_QUEUE_SIZE', 100))
+READING_STREAM_HEARTBEAT = int(os.getenv('READING_STREAM_HEARTBEAT', 15))  # seconds
+READING_STREAM_REPLAY_MAX = int(os.getenv('READING_STREAM_REPLAY_MAX', 500))
+READING_STREAM_WATCH_INTERVAL_MS = int(os.getenv('READING_STREAM_WATCH_INTERVAL_MS', 100))
+READING_STREAM_LOG_SLOTS = int(os.getenv('READING_STREAM_LOG_SLOTS', 4096))
+READING_STREAM_SLOT_BYTES = int(os.getenv('READING_STREAM_SLOT_BYTES', 1024))
+
+# Subscription topic for every device
+FLEET_TOPIC = '*'
+
+
+def format_sse(event, payload, event_id=None):
+    """Encode one Server-Sent Events frame"""
+    frame = f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    if event_id is not None:
+        frame = f"id: {event_id}\n" + frame
+    return frame
+
+
+class SharedEventLog:
+    """Ring of recent (topic, frame) events in a memory-mapped file, shared by processes on one host.
+
+    The file starts with the last sequence number and the number of
+    subscribers in all processes, followed by ``slots`` fixed-size slots.
+    Each slot holds its sequence number, so a reader can tell when a slot
+    was overwritten while it lagged behind.
+    """
+
+    _HEADER = struct.Struct('<Qq')  # last sequence, subscribers
+    _SLOT = struct.Struct('<QHH')   # sequence, topic length, frame length
+
+    def __init__(self, path, slots, slot_size):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self._lock = Lock()
+        self._file = None
+        self._map = None
+        self.oversized = 0
+
+    def _open(self):
+        with self._lock:
+            if self._map is not None:
+                return
+            size = self._HEADER.size + self.slots * self.slot_size
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            handle = open(self.path, 'a+b')
+            if os.path.getsize(self.path) < size:
+                handle.truncate(size)
+            self._file = handle
+            self._map = mmap.mmap(handle.fileno(), size)
+
+    @contextmanager
+    def _exclusive(self):
+        if self._map is None:
+            self._open()
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def _header(self):
+        if self._map is None:
+            self._open()
+        return self._HEADER.unpack_from(self._map, 0)
+
+    def last_sequence(self):
+        """Sequence number of the newest event; a memory read, no system call"""
+        return self._header()[0]
+
+    def has_subscribers(self):
+        """True if any process on the host has a stream subscriber"""
+        return self._header()[1] > 0
+
+    def add_subscribers(self, delta):
+        with self._exclusive():
+            sequence, subscribers = self._HEADER.unpack_from(self._map, 0)
+            self._HEADER.pack_into(self._map, 0, sequence, max(subscribers + delta, 0))
+
+    def append(self, events):
+        """Append (topic, frame) events; returns the last sequence number"""
+        encoded = []
+        for topic, frame in events:
+            topic, frame = topic.encode(), frame.encode()
+            if self._SLOT.size + len(topic) + len(frame) > self.slot_size:
+                self.oversized += 1
+                continue
+            encoded.append((topic, frame))
+
+        with self._exclusive():
+            sequence, subscribers = self._HEADER.unpack_from(self._map, 0)
+            for topic, frame in encoded:
+                sequence += 1
+                offset = self._HEADER.size + (sequence % self.slots) * self.slot_size
+                self._SLOT.pack_into(self._map, offset, sequence, len(topic), len(frame))
+                start = offset + self._SLOT.size
+                self._map[start:start + len(topic)] = topic
+                self._map[start + len(topic):start + len(topic) + len(frame)] = frame
+            # Published last: readers never look past it
+            self._HEADER.pack_into(self._map, 0, sequence, subscribers)
+        return sequence
+
+    def read_since(self, after):
+        """Return ([(topic, frame)], last sequence, number of events lost) for events after ``after``"""
+        last = self.last_sequence()
+        first = max(after + 1, last - self.slots + 1)
+        lost = first - (after + 1)
+        events = []
+        for sequence in range(first, last + 1):
+            offset = self._HEADER.size + (sequence % self.slots) * self.slot_size
+            stored, topic_length, frame_length = self._SLOT.unpack_from(self._map, offset)
+            start = offset + self._SLOT.size
+            topic = bytes(self._map[start:start + topic_length])
+            frame = bytes(self._map[start + topic_length:start + topic_length + frame_length])
+            # Overwritten by a writer that lapped us, before or during the copy
+            if stored != sequence or self._SLOT.unpack_from(self._map, offset)[0] != sequence:
+                lost += 1
+                continue
+            events.append((topic.decode(), frame.decode()))
+        return events, last, lost
+
+
+reading_event_log = SharedEventLog(
+    os.getenv('READING_STREAM_LOG_FILE', os.path.join(app.instance_path, 'reading_stream.log')),
+    READING_STREAM_LOG_SLOTS, READING_STREAM_SLOT_BYTES
+)
+
+
+class ReadingBroker:
+    """Fan out reading and alert events to per-device and fleet subscribers"""
+
+    def __init__(self, queue_size, shared_log):
+        self.queue_size = queue_size
+        self.shared_log = shared_log
+        self._lock = Lock()
+        self._topics = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, topic):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(subscriber)
+        # Tells ingest in every process to publish
+        self.shared_log.add_subscribers(1)
+        return subscriber
+
+    def unsubscribe(self, topic, subscriber):
+        with self._lock:
+            subscribers = self._topics.get(topic)
+            if subscribers is None or subscriber not in subscribers:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._topics[topic]
+        self.shared_log.add_subscribers(-1)
+
+    def has_subscribers(self, device_ids):
+        """True if an event for any of these devices would reach someone in this process"""
+        topics = self._topics
+        return bool(topics) and (FLEET_TOPIC in topics or any(device_id in topics for device_id in device_ids))
+
+    def publish(self, device_id, frame):
+        """Queue a pre-encoded frame for the device's and the fleet's subscribers"""
+        with self._lock:
+            subscribers = list(self._topics.get(device_id, ())) + list(self._topics.get(FLEET_TOPIC, ()))
+            self.published += 1
+        dropped = 0
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(frame)
+            except queue.Full:
+                # Drop the oldest event so the viewer stays current
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    subscriber.put_nowait(frame)
+                except queue.Full:
+                    pass
+                dropped += 1
+        with self._lock:
+            self.dropped += dropped
+            self.delivered += len(subscribers)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'topics': len(self._topics),
+                'subscribers': sum(len(subscribers) for subscribers in self._topics.values()),
+                'published': self.published,
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+                'queue_size': self.queue_size
+            }
+
+
+reading_broker = ReadingBroker(READING_STREAM_QUEUE_SIZE, reading_event_log)
+
+
+class ReadingTail:
+    """Copy events from the shared log into this process's broker"""
+
+    def __init__(self, broker, shared_log, interval_ms):
+        self.broker = broker
+        self.shared_log = shared_log
+        self.interval = interval_ms / 1000.0
+        self._lock = Lock()
+        self._wake = Event()
+        self._stop = False
+        self._thread = None
+        self.last_sequence = None
+        self.lost = 0
+
+    def start(self):
+        """Start the tail thread on first subscription (once per process)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                # Only events from now on; viewers get history by query
+                self.last_sequence = self.shared_log.last_sequence()
+                self._thread = Thread(target=self._run, name='reading-tail', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Deliver now rather than at the next interval, after this process appended"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.poll()
+
+    def poll(self):
+        events, self.last_sequence, lost = self.shared_log.read_since(self.last_sequence)
+        self.lost += lost
+        for topic, frame in events:
+            if self.broker.has_subscribers((topic,)):
+                self.broker.publish(topic, frame)
+
+    def stop(self):
+        self._stop = True
+        self._wake.set()
+
+    def stats(self):
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'watch_interval_ms': self.interval * 1000,
+            'last_sequence': self.last_sequence,
+            'lost': self.lost,
+            'oversized': self.shared_log.oversized
+        }
+
+
+reading_tail = ReadingTail(reading_broker, reading_event_log, READING_STREAM_WATCH_INTERVAL_MS)
+atexit.register(reading_tail.stop)
+
+
+def publish_ingested(readings, reading_ids, alerts):
+    """Publish committed readings and alerts to live stream subscribers in every process"""
+    events = [
+        (reading['device_id'], format_sse('reading', SensorReading(id=reading_id, **reading).to_dict(), reading_id))
+        for reading, reading_id in zip(readings, reading_ids)
+    ]
+    events += [(alert['device_id'], format_sse('alert', alert)) for alert in alerts]
+    reading_event_log.append(events)
+    reading_tail.wake()
+
+
+# ==================== SENSOR INGESTION ====================
+
+# Maximum number of readings accepted by a single batch request
+INGEST_MAX_BATCH_SIZE = int(os.getenv('INGEST_MAX_BATCH_SIZE', 1000))
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 string or epoch seconds into a naive UTC datetime"""
+    if isinstance(value, bool):
+        raise ValueError(f'Invalid timestamp: {value}')
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    return parsed
+
+
+def _optional_number(values, key, cast):
+    """Read an optional numeric field from a payload section"""
+    value = values.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f'Invalid value for {key}: {value}')
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid value for {key}: {value}')
+
+
+def parse_reading_payload(data):
+    """Validate a device payload and map it onto SensorReading columns"""
+    if not isinstance(data, dict) or 'device_id' not in data:
+        raise ValueError('Invalid data format')
+
+    sensors = data.get('sensors') or {}
+    status = data.get('status') or {}
+    if not isinstance(sensors, dict) or not isinstance(status, dict):
+        raise ValueError('Invalid data format')
+
+    reading = {
+        'device_id': str(data['device_id']),
+        'ph': _optional_number(sensors, 'ph', float),
+        'turbidity': _optional_number(sensors, 'turbidity', float),
+        'temperature': _optional_number(sensors, 'temperature', float),
+        'water_quality': status.get('water_quality'),
+        'wifi_rssi': _optional_number(status, 'wifi_rssi', int),
+        'uptime': _optional_number(status, 'uptime', int),
+        'timestamp': datetime.utcnow()
+    }
+
+    # Buffered devices and gateways may report when the reading was taken
+    if data.get('timestamp') is not None:
+        reading['timestamp'] = parse_timestamp(data['timestamp'])
+
+    return reading
+
+
+# No lower thresholds are configured: readings this far below the optimal
+# value are critical
+LOW_CRITICAL_MARGINS = {'ph': ('ph_optimal', 1.0), 'temperature': ('temp_optimal', 4.0)}
+
+
+def low_critical_limit(config, metric):
+    """Value below which a metric is critical, or None if it has no lower limit"""
+    if metric not in LOW_CRITICAL_MARGINS:
+        return None
+    optimal, margin = LOW_CRITICAL_MARGINS[metric]
+    return getattr(config, optimal) - margin
+
+
+def evaluate_alert_conditions(config, reading):
+    """Return the alerts a reading should raise under the given thresholds"""
+    alerts = []
+
+    # Check pH
+    ph = reading.get('ph')
+    if ph and (ph < low_critical_limit(config, 'ph') or ph > config.ph_critical):
+        alerts.append({
+            'type': 'ph_critical',
+            'severity': 'critical',
+            'message': f'pH level is critical: {ph:.2f}',
+            'value': ph
+        })
+
+    # Check turbidity
+    turbidity = reading.get('turbidity')
+    if turbidity and turbidity > config.turbidity_critical:
+        alerts.append({
+            'type': 'turbidity_critical',
+            'severity': 'critical',
+            'message': f'Turbidity level is critical: {turbidity:.2f} NTU',
+            'value': turbidity
+        })
+
+    # Check temperature
+    temperature = reading.get('temperature')
+    if temperature and (temperature < low_critical_limit(config, 'temperature') or temperature > config.temp_critical):
+        alerts.append({
+            'type': 'temperature_critical',
+            'severity': 'critical',
+            'message': f'Temperature is critical: {temperature:.2f}°C',
+            'value': temperature
+        })
+
+    return alerts
+
+
+def ingest_readings(readings):
+    """Store parsed readings and raise their alerts in a single transaction.
+
+    Known devices come from the device cache, so steady-state ingest runs
+    no SELECTs; unknown devices are looked up (and created) in one query.
+    Readings are written with one bulk INSERT and alert deduplication is
+    answered by the in-memory alert index. Returns the new reading ids in
+    input order.
+    """
+    if not readings:
+        return []
+
+    now = datetime.utcnow()
+    device_ids = {reading['device_id'] for reading in readings}
+    generation = device_cache.generation
+    configs, missing = device_cache.get_many(device_ids)
+    loaded = {}
+
+    # Update last seen. Writing first takes SQLite's write lock up front: with
+    # several worker processes, a transaction that reads before its first
+    # write can fail with "database is locked" instead of waiting.
+    db.session.execute(
+        db.update(Device).where(Device.device_id.in_(device_ids)).values(last_seen=now),
+        execution_options={'synchronize_session': False}
+    )
+
+    if missing:
+        # Get or create devices
+        known_devices = {
+            device_id for (device_id,) in
+            db.session.query(Device.device_id).filter(Device.device_id.in_(missing))
+        }
+        for device_id in missing - known_devices:
+            db.session.add(Device(device_id=device_id, last_seen=now))
+
+        rows = {
+            config.device_id: config
+            for config in DeviceConfig.query.filter(DeviceConfig.device_id.in_(missing)).all()
+        }
+        for device_id in missing - rows.keys():
+            # Create default config for new device
+            config = DeviceConfig(device_id=device_id)
+            db.session.add(config)
+            rows[device_id] = config
+
+        db.session.flush()
+        # Cached only once committed: a rolled back device must be created again
+        loaded = {device_id: device_cache.snapshot(config) for device_id, config in rows.items()}
+        configs.update(loaded)
+
+    # Bulk insert sensor readings
+    reading_ids = db.session.scalars(
+        db.insert(SensorReading).returning(SensorReading.id, sort_by_parameter_order=True),
+        readings
+    ).all()
+
+    update_rollups(readings)
+
+    # Check for critical conditions and create alerts
+    candidates = []
+    for reading in readings:
+        for alert_data in evaluate_alert_conditions(configs[reading['device_id']], reading):
+            candidates.append((reading['device_id'], alert_data, reading['timestamp']))
+
+    # Avoid duplicates within the dedup window
+    claims = []
+    alerts = []
+    try:
+        for device_id, alert_data, timestamp in candidates:
+            claimed, previous = alert_index.claim(device_id, alert_data['type'], timestamp)
+            if not claimed:
+                continue
+            claims.append((device_id, alert_data['type'], previous))
+
+            alert = Alert(
+                device_id=device_id,
+                timestamp=timestamp,
+                alert_type=alert_data['type'],
+                severity=alert_data['severity'],
+                message=alert_data['message'],
+                value=alert_data['value'],
+                acknowledged=False
+            )
+            db.session.add(alert)
+            alerts.append(alert)
+
+        publish = reading_event_log.has_subscribers()
+        if publish and alerts:
+            # Assign ids now; after commit the objects are expired
+            db.session.flush()
+            alerts = [alert.to_dict() for alert in alerts]
+        db.session.commit()
+    except Exception:
+        for device_id, alert_type, previous in reversed(claims):
+            alert_index.restore(device_id, alert_type, previous)
+        raise
+
+    if claims:
+        alert_index.changed()
+    for device_id, snapshot in loaded.items():
+        device_cache.store(device_id, snapshot, generation)
+
+    if publish:
+        publish_ingested(readings, reading_ids, alerts)
+
+    return reading_ids
+
+
+# ==================== SENSOR ROLLUPS ====================
+
+ROLLUP_METRICS = ('ph', 'turbidity', 'temperature')
+
+# Bucket widths in seconds, finest first
+ROLLUP_RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def floor_bucket(timestamp, resolution):
+    """Start of the bucket of ``resolution`` seconds containing timestamp"""
+    width = timedelta(seconds=resolution)
+    return EPOCH + ((timestamp - EPOCH) // width) * width
+
+
+def ceil_bucket(timestamp, resolution):
+    start = floor_bucket(timestamp, resolution)
+    return start if start == timestamp else start + timedelta(seconds=resolution)
+
+
+class MetricAggregate:
+    """Running count/sum/min/max for one metric, mergeable across partials"""
+
+    __slots__ = ('count', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        if value is None:
+            return
+        self.add_partial(1, value, value, value)
+
+    def add_partial(self, count, total, minimum, maximum):
+        if not count:
+            return
+        self.count += count
+        self.total += total
+        if self.minimum is None or minimum < self.minimum:
+            self.minimum = minimum
+        if self.maximum is None or maximum > self.maximum:
+            self.maximum = maximum
+
+    def to_dict(self):
+        return {
+            'avg': self.total / self.count if self.count else None,
+            'min': self.minimum,
+            'max': self.maximum
+        }
+
+
+class SensorAggregate:
+    """Reading count plus a MetricAggregate per rollup metric"""
+
+    def __init__(self):
+        self.reading_count = 0
+        self.metrics = {metric: MetricAggregate() for metric in ROLLUP_METRICS}
+
+    def add_reading(self, reading):
+        self.reading_count += 1
+        for metric in ROLLUP_METRICS:
+            self.metrics[metric].add(reading.get(metric))
+
+    def merge_row(self, reading_count, *metric_values):
+        """Merge a (count, then count/sum/min/max per metric) result row"""
+        self.reading_count += reading_count or 0
+        for index, metric in enumerate(ROLLUP_METRICS):
+            count, total, minimum, maximum = metric_values[index * 4:index * 4 + 4]
+            self.metrics[metric].add_partial(count or 0, total or 0.0, minimum, maximum)
+
+    def to_dict(self):
+        data = {'count': self.reading_count}
+        for metric in ROLLUP_METRICS:
+            data[metric] = self.metrics[metric].to_dict()
+        return data
+
+
+def _rollup_delta_rows(readings):
+    """Aggregate readings into one row per (device, resolution, bucket)"""
+    buckets = {}
+    for reading in readings:
+        for resolution in ROLLUP_RESOLUTIONS.values():
+            key = (reading['device_id'], resolution, floor_bucket(reading['timestamp'], resolution))
+            aggregate = buckets.get(key)
+            if aggregate is None:
+                aggregate = buckets[key] = SensorAggregate()
+            aggregate.add_reading(reading)
+
+    rows = []
+    for (device_id, resolution, bucket_start), aggregate in buckets.items():
+        row = {
+            'device_id': device_id,
+            'resolution': resolution,
+            'bucket_start': bucket_start,
+            'reading_count': aggregate.reading_count
+        }
+        for metric, values in aggregate.metrics.items():
+            row[f'{metric}_count'] = values.count
+            row[f'{metric}_sum'] = values.total
+            row[f'{metric}_min'] = values.minimum
+            row[f'{metric}_max'] = values.maximum
+        rows.append(row)
+    return rows
+
+
+def _merged_rollup_values(existing, incoming):
+    """SET clause folding incoming bucket values into an existing rollup row"""
+    def lesser(a, b):
+        return db.case((a.is_(None), b), (b.is_(None), a), (b < a, b), else_=a)
+
+    def greater(a, b):
+        return db.case((a.is_(None), b), (b.is_(None), a), (b > a, b), else_=a)
+
+    values = {'reading_count': existing['reading_count'] + incoming['reading_count']}
+    for metric in ROLLUP_METRICS:
+        values[f'{metric}_count'] = existing[f'{metric}_count'] + incoming[f'{metric}_count']
+        values[f'{metric}_sum'] = existing[f'{metric}_sum'] + incoming[f'{metric}_sum']
+        values[f'{metric}_min'] = lesser(existing[f'{metric}_min'], incoming[f'{metric}_min'])
+        values[f'{metric}_max'] = greater(existing[f'{metric}_max'], incoming[f'{metric}_max'])
+    return values
+
+
+# Compiled ON CONFLICT statements by (table, dialect, columns)
+_upsert_statements = {}
+
+
+def _upsert_statement(table, key_columns, columns, merged_values, dialect):
+    """ON CONFLICT upsert of ``columns`` as a reusable text statement.
+
+    SQLAlchemy does not cache compiled dialect insert constructs, and
+    building and compiling one took longer than the writes themselves on
+    every ingest; the SQL is the same each time, so it is compiled once.
+    """
+    cache_key = (table.name, dialect.name, columns)
+    statement = _upsert_statements.get(cache_key)
+    if statement is None:
+        if dialect.name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        stmt = upsert(table).values({column: db.bindparam(column) for column in columns})
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_=merged_values(table.c, stmt.excluded)
+        )
+        # Named parameters so the SQL can be reused as text with typed binds
+        sql = str(stmt.compile(dialect=type(dialect)(paramstyle='named')))
+        statement = db.text(sql).bindparams(
+            *(db.bindparam(column, type_=table.c[column].type) for column in columns)
+        )
+        _upsert_statements[cache_key] = statement
+    return statement
+
+
+def _upsert_rows(table, key_columns, rows, merged_values):
+    """INSERT rows, folding each into an existing row with the same key columns"""
+    dialect = db.session.get_bind().dialect
+    if dialect.name in ('sqlite', 'postgresql'):
+        statement = _upsert_statement(table, tuple(key_columns), tuple(rows[0]), merged_values, dialect)
+        db.session.execute(statement, rows)
+        return
+
+    # Portable fallback: update the row, insert it when it does not exist yet
+    for row in rows:
+        incoming = {key: db.literal(value, type_=table.c[key].type) for key, value in row.items()}
+        result = db.session.execute(
+            table.update().where(
+                *(table.c[column] == row[column] for column in key_columns)
+            ).values(merged_values(table.c, incoming))
+        )
+        if result.rowcount == 0:
+            db.session.execute(table.insert(), row)
+
+
+def update_rollups(readings):
+    """Fold a batch of parsed readings into the rollup and sketch tables (no commit)"""
+    rows = _rollup_delta_rows(readings)
+    if not rows:
+        return
+
+    _upsert_rows(
+        SensorRollup.__table__, ['device_id', 'resolution', 'bucket_start'], rows, _merged_rollup_values
+    )
+
+    bins = _sketch_delta_rows(readings)
+    if bins:
+        _upsert_rows(
+            SensorSketchBin.__table__, ['device_id', 'resolution', 'bucket_start', 'metric', 'bin'], bins,
+            lambda existing, incoming: {'count': existing['count'] + incoming['count']}
+        )
+
+
+def _rollup_source_columns():
+    """Rollup table columns in SensorAggregate.merge_row order"""
+    table = SensorRollup.__table__
+    columns = [table.c.reading_count]
+    for metric in ROLLUP_METRICS:
+        columns += [table.c[f'{metric}_{part}'] for part in ('count', 'sum', 'min', 'max')]
+    return columns
+
+
+def _rollup_columns(source):
+    """Aggregate expressions over rollup rows, in SensorAggregate.merge_row order"""
+    columns = [db.func.sum(source.reading_count)]
+    for metric in ROLLUP_METRICS:
+        columns += [
+            db.func.sum(getattr(source, f'{metric}_count')),
+            db.func.sum(getattr(source, f'{metric}_sum')),
+            db.func.min(getattr(source, f'{metric}_min')),
+            db.func.max(getattr(source, f'{metric}_max'))
+        ]
+    return columns
+
+
+def _raw_columns():
+    """Aggregate expressions over raw readings, in SensorAggregate.merge_row order"""
+    columns = [db.func.count(SensorReading.id)]
+    for metric in ROLLUP_METRICS:
+        column = getattr(SensorReading, metric)
+        columns += [db.func.count(column), db.func.sum(column), db.func.min(column), db.func.max(column)]
+    return columns
+
+
+def plan_rollup_ranges(start, end, resolutions=None):
+    """Split [start, end) into the coarsest aligned rollup ranges plus raw edges.
+
+    Returns (resolution, range_start, range_end) tuples; resolution None
+    means the range must be read from raw readings. Raw edges are always
+    shorter than the finest rollup bucket used, and resolutions pruned
+    before ``start`` (ROLLUP_RETENTION_DAYS) are not used.
+    """
+    if resolutions is None:
+        resolutions = sorted(
+            (resolution for resolution in ROLLUP_RESOLUTIONS.values() if rollups_kept_since(resolution, start)),
+            reverse=True
+        )
+    if start >= end:
+        return []
+    if not resolutions:
+        return [(None, start, end)]
+
+    resolution = resolutions[0]
+    inner_start = ceil_bucket(start, resolution)
+    inner_end = floor_bucket(end, resolution)
+    if inner_start >= inner_end:
+        return plan_rollup_ranges(start, end, resolutions[1:])
+
+    return (
+        plan_rollup_ranges(start, inner_start, resolutions[1:])
+        + [(resolution, inner_start, inner_end)]
+        + plan_rollup_ranges(inner_end, end, resolutions[1:])
+    )
+
+
+def aggregate_devices(device_ids, start, end, use_rollups=True):
+    """Aggregate readings of several devices over [start, end) inside the database.
+
+    Each planned range is one grouped aggregate query covering every
+    device, so memory and query count do not grow with the window length
+    or the number of rows. Returns {device_id: SensorAggregate}.
+    """
+    aggregates = {device_id: SensorAggregate() for device_id in device_ids}
+    plan = plan_rollup_ranges(start, end) if use_rollups else [(None, start, end)]
+
+    for resolution, range_start, range_end in plan:
+        if resolution is None:
+            query = db.session.query(SensorReading.device_id, *_raw_columns()).filter(
+                SensorReading.device_id.in_(device_ids),
+                SensorReading.timestamp >= range_start,
+                SensorReading.timestamp < range_end
+            ).group_by(SensorReading.device_id)
+            # Raw ranges older than the retention window live in the archive
+            for device_id in device_ids:
+                for reading in reading_archive.scan(device_id, range_start, range_end):
+                    aggregates[device_id].add_reading(reading)
+        else:
+            query = db.session.query(SensorRollup.device_id, *_rollup_columns(SensorRollup)).filter(
+                SensorRollup.device_id.in_(device_ids),
+                SensorRollup.resolution == resolution,
+                SensorRollup.bucket_start >= range_start,
+                SensorRollup.bucket_start < range_end
+            ).group_by(SensorRollup.device_id)
+
+        for device_id, *row in query:
+            aggregates[device_id].merge_row(*row)
+
+    return aggregates
+
+
+def aggregate_window(device_id, start, end, use_rollups=True):
+    """Aggregate a device's readings over [start, end) using rollups where possible"""
+    return aggregate_devices([device_id], start, end, use_rollups)[device_id]
+
+
+def rebuild_rollups(device_id=None, since=None, until=None, chunk_size=5000):
+    """Recompute rollups from raw readings for whole days in [since, until).
+
+    Buckets in the range are deleted and rebuilt in one transaction per
+    device from the archive and the hot table. Returns the number of raw
+    readings processed.
+    """
+    until = floor_bucket(until or datetime.utcnow(), ROLLUP_RESOLUTIONS['1d'])
+    since = floor_bucket(since, ROLLUP_RESOLUTIONS['1d']) if since else None
+
+    if device_id:
+        device_ids = [device_id]
+    else:
+        device_ids = [row[0] for row in db.session.query(SensorReading.device_id).distinct()]
+        device_ids += [d for d in reading_archive.device_ids() if d not in device_ids]
+
+    columns = [SensorReading.device_id, SensorReading.timestamp] + [getattr(SensorReading, m) for m in ROLLUP_METRICS]
+    processed = 0
+    for current_device in device_ids:
+        rollups = SensorRollup.query.filter(
+            SensorRollup.device_id == current_device,
+            SensorRollup.bucket_start < until
+        )
+        sketch_bins = SensorSketchBin.query.filter(
+            SensorSketchBin.device_id == current_device,
+            SensorSketchBin.bucket_start < until
+        )
+        readings = db.select(*columns).where(
+            SensorReading.device_id == current_device,
+            SensorReading.timestamp < until
+        )
+        if since:
+            rollups = rollups.filter(SensorRollup.bucket_start >= since)
+            sketch_bins = sketch_bins.filter(SensorSketchBin.bucket_start >= since)
+            readings = readings.where(SensorReading.timestamp >= since)
+        rollups.delete(synchronize_session=False)
+        sketch_bins.delete(synchronize_session=False)
+
+        rows = db.session.execute(readings.execution_options(yield_per=chunk_size))
+        batch = []
+        for reading in chain(
+            reading_archive.scan(current_device, since, until),
+            (dict(zip(('device_id', 'timestamp') + ROLLUP_METRICS, row)) for row in rows)
+        ):
+            batch.append(reading)
+            if len(batch) >= chunk_size:
+                update_rollups(batch)
+                processed += len(batch)
+                batch = []
+        update_rollups(batch)
+        processed += len(batch)
+        db.session.commit()
+
+    return processed
+
+
+# ==================== QUANTILE SKETCHES ====================
+
+# Relative accuracy of stored quantiles; changing it requires rebuild-rollups
+SKETCH_RELATIVE_ACCURACY = float(os.getenv('SKETCH_RELATIVE_ACCURACY', 0.005))
+
+# Bin key for values too close to zero to index logarithmically
+SKETCH_ZERO_BIN = 1 << 30
+SKETCH_MIN_VALUE = 1e-9
+
+
+class QuantileSketch:
+    """Mergeable DDSketch-style quantile sketch.
+
+    Values fall into logarithmic bins whose width is a fixed fraction of the
+    value, so any quantile is returned within ``relative_accuracy`` of the
+    true value. Bins are plain counters, which makes sketches mergeable by
+    adding counts - that is how the database combines rollup buckets
+    (SUM(count) GROUP BY bin). Positive values use even bin keys, negative
+    values odd ones.
+    """
+
+    def __init__(self, relative_accuracy=SKETCH_RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.count = 0
+
+    def key(self, value):
+        if abs(value) < SKETCH_MIN_VALUE:
+            return SKETCH_ZERO_BIN
+        index = math.ceil(math.log(abs(value)) / self.log_gamma)
+        return 2 * index if value > 0 else 2 * index + 1
+
+    def value(self, key):
+        """Representative value of a bin (within relative accuracy of its members)"""
+        if key == SKETCH_ZERO_BIN:
+            return 0.0
+        index, negative = divmod(key, 2)
+        magnitude = 2 * self.gamma ** index / (self.gamma + 1)
+        return -magnitude if negative else magnitude
+
+    def add(self, value, count=1):
+        if value is None:
+            return
+        key = self.key(value)
+        self.bins[key] = self.bins.get(key, 0) + count
+        self.count += count
+
+    def add_bin(self, key, count):
+        self.bins[key] = self.bins.get(key, 0) + count
+        self.count += count
+
+    def merge(self, other):
+        for key, count in other.bins.items():
+            self.add_bin(key, count)
+
+    def _ordered(self):
+        """(value, count) pairs in ascending value order"""
+        return sorted((self.value(key), count) for key, count in self.bins.items())
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self._ordered():
+            seen += count
+            if seen > rank:
+                return value
+        return self._ordered()[-1][0]
+
+    def bounds(self, key):
+        """(low, high) value range covered by a bin"""
+        if key == SKETCH_ZERO_BIN:
+            return -SKETCH_MIN_VALUE, SKETCH_MIN_VALUE
+        index, negative = divmod(key, 2)
+        low, high = self.gamma ** (index - 1), self.gamma ** index
+        return (-high, -low) if negative else (low, high)
+
+    def count_at_most(self, threshold):
+        """Approximate number of values <= threshold.
+
+        The bin straddling the threshold is split assuming its values are
+        spread evenly, which keeps the error well below one bin width.
+        """
+        total = 0.0
+        for key, count in self.bins.items():
+            low, high = self.bounds(key)
+            if high <= threshold:
+                total += count
+            elif low < threshold:
+                total += count * (threshold - low) / (high - low)
+        return total
+
+    def histogram(self, minimum, maximum, bins=10):
+        """Equal-width histogram between minimum and maximum"""
+        if not self.count or minimum is None or maximum is None:
+            return []
+        width = (maximum - minimum) / bins if maximum > minimum else 0
+        counts = [0] * bins
+        for value, count in self._ordered():
+            index = int((value - minimum) / width) if width else 0
+            counts[min(max(index, 0), bins - 1)] += count
+        return [
+            {'lower': minimum + width * i, 'upper': minimum + width * (i + 1), 'count': counts[i]}
+            for i in range(bins)
+        ]
+
+
+def _sketch_delta_rows(readings):
+    """Count readings per (device, resolution, bucket, metric, sketch bin)"""
+    sketch = QuantileSketch()
+    counts = {}
+    for reading in readings:
+        buckets = [
+            (resolution, floor_bucket(reading['timestamp'], resolution))
+            for resolution in ROLLUP_RESOLUTIONS.values()
+        ]
+        for metric in ROLLUP_METRICS:
+            value = reading.get(metric)
+            if value is None:
+                continue
+            key = sketch.key(value)
+            for resolution, bucket_start in buckets:
+                row_key = (reading['device_id'], resolution, bucket_start, metric, key)
+                counts[row_key] = counts.get(row_key, 0) + 1
+
+    return [
+        {'device_id': device_id, 'resolution': resolution, 'bucket_start': bucket_start,
+         'metric': metric, 'bin': key, 'count': count}
+        for (device_id, resolution, bucket_start, metric, key), count in counts.items()
+    ]
+
+
+def sketch_window(device_ids, start, end):
+    """Merge the stored sketches of several devices over [start, end).
+
+    Whole buckets are merged inside the database; the raw edges of the
+    window are streamed and added value by value. Returns
+    {device_id: {metric: QuantileSketch}}.
+    """
+    sketches = {
+        device_id: {metric: QuantileSketch() for metric in ROLLUP_METRICS}
+        for device_id in device_ids
+    }
+
+    for resolution, range_start, range_end in plan_rollup_ranges(start, end):
+        if resolution is None:
+            rows = db.session.execute(
+                db.select(SensorReading.device_id, *(getattr(SensorReading, m) for m in ROLLUP_METRICS)).where(
+                    SensorReading.device_id.in_(device_ids),
+                    SensorReading.timestamp >= range_start,
+                    SensorReading.timestamp < range_end
+                ).execution_options(yield_per=1000)
+            )
+            for device_id, *values in rows:
+                for metric, value in zip(ROLLUP_METRICS, values):
+                    sketches[device_id][metric].add(value)
+            for device_id in device_ids:
+                for reading in reading_archive.scan(device_id, range_start, range_end):
+                    for metric in ROLLUP_METRICS:
+                        sketches[device_id][metric].add(reading[metric])
+            continue
+
+        rows = db.session.query(
+            SensorSketchBin.device_id, SensorSketchBin.metric, SensorSketchBin.bin,
+            db.func.sum(SensorSketchBin.count)
+        ).filter(
+            SensorSketchBin.device_id.in_(device_ids),
+            SensorSketchBin.resolution == resolution,
+            SensorSketchBin.bucket_start >= range_start,
+            SensorSketchBin.bucket_start < range_end
+        ).group_by(SensorSketchBin.device_id, SensorSketchBin.metric, SensorSketchBin.bin)
+        for device_id, metric, key, count in rows:
+            sketches[device_id][metric].add_bin(key, count)
+
+    return sketches
+
+
+# Threshold columns per metric, as upper bounds of the bands
+BAND_THRESHOLDS = {
+    'ph': ('ph_optimal', 'ph_acceptable', 'ph_critical'),
+    'turbidity': ('turbidity_optimal', 'turbidity_acceptable', 'turbidity_critical'),
+    'temperature': ('temp_optimal', 'temp_acceptable', 'temp_critical')
+}
+
+
+def distribution_summary(metric, sketch, aggregate, config, percentiles, histogram_bins):
+    """Percentiles, histogram and time per threshold band for one metric"""
+    def clamp(value):
+        # Bin representatives may fall just outside the exact min/max
+        if value is None or aggregate.minimum is None:
+            return value
+        return min(max(value, aggregate.minimum), aggregate.maximum)
+
+    summary = {
+        'percentiles': {f'p{p:g}': clamp(sketch.quantile(p / 100.0)) for p in percentiles},
+        'histogram': sketch.histogram(aggregate.minimum, aggregate.maximum, histogram_bins)
+    }
+    if config is None or not sketch.count:
+        return summary
+
+    optimal, acceptable, critical = (getattr(config, name) for name in BAND_THRESHOLDS[metric])
+    at_most_optimal = sketch.count_at_most(optimal)
+    at_most_acceptable = sketch.count_at_most(acceptable)
+    at_most_critical = sketch.count_at_most(critical)
+
+    # Each reading stands for one post interval of wall time
+    hours_per_reading = (config.post_interval or 0) / 3600000.0
+    bands = [
+        ('optimal', None, optimal, at_most_optimal),
+        ('acceptable', optimal, acceptable, at_most_acceptable - at_most_optimal),
+        ('warning', acceptable, critical, at_most_critical - at_most_acceptable),
+        ('critical', critical, None, sketch.count - at_most_critical)
+    ]
+
+    # Same lower limit as evaluate_alert_conditions, so low readings are not optimal
+    low = low_critical_limit(config, metric)
+    if low is not None:
+        below = sketch.count_at_most(low)
+        bands[0] = ('optimal', low, optimal, at_most_optimal - below)
+        bands.insert(0, ('critical_low', None, low, below))
+    summary['bands'] = [
+        {
+            'band': name,
+            'above': lower,
+            'at_most': upper,
+            'readings': round(count),
+            'fraction': count / sketch.count,
+            'hours': count * hours_per_reading
+        }
+        for name, lower, upper, count in bands
+    ]
+    return summary
+
+
+# ==================== BINARY PAYLOAD FORMAT ====================
+#
+# Compact alternative to the JSON payload for constrained devices, selected
+# by Content-Type. Each record is little-endian:
+#
+#   uint8   format version (1)
+#   uint8   device_id length N
+#   N bytes device_id (UTF-8)
+#   uint32  timestamp, epoch seconds (0 = use server time)
+#   float32 ph, turbidity, temperature (NaN = missing)
+#   uint8   water_quality code (see WATER_QUALITY_CODES, 255 = missing)
+#   int16   wifi_rssi (-32768 = missing)
+#   uint32  uptime in seconds (0xFFFFFFFF = missing)
+#
+# /pool/data takes exactly one record, /pool/data/batch takes records
+# back to back in one body.
+
+BINARY_READING_CONTENT_TYPES = ('application/x-pool-reading', 'application/octet-stream')
+BINARY_READING_VERSION = 1
+
+WATER_QUALITY_CODES = {'optimal': 1, 'acceptable': 2, 'poor': 3, 'critical': 4}
+WATER_QUALITY_NAMES = {code: name for name, code in WATER_QUALITY_CODES.items()}
+
+_BINARY_HEADER = struct.Struct('<BB')
+_BINARY_BODY = struct.Struct('<IfffBhI')
+_MISSING_QUALITY = 0xFF
+_MISSING_RSSI = -0x8000
+_MISSING_UPTIME = 0xFFFFFFFF
+
+
+def is_binary_payload(req):
+    """True when the request body uses the compact binary reading format"""
+    return req.mimetype in BINARY_READING_CONTENT_TYPES
+
+
+def _binary_float(value):
+    # float32 keeps ~7 significant digits; drop the conversion noise
+    return None if math.isnan(value) else round(value, 4)
+
+
+def decode_binary_readings(body):
+    """Decode back-to-back binary records into parsed readings"""
+    readings = []
+    offset = 0
+    size = len(body)
+    while offset < size:
+        if size - offset < _BINARY_HEADER.size:
+            raise ValueError('Truncated binary reading')
+        version, id_length = _BINARY_HEADER.unpack_from(body, offset)
+        if version != BINARY_READING_VERSION:
+            raise ValueError(f'Unsupported binary reading version: {version}')
+        offset += _BINARY_HEADER.size
+
+        if size - offset < id_length + _BINARY_BODY.size:
+            raise ValueError('Truncated binary reading')
+        device_id = bytes(body[offset:offset + id_length]).decode('utf-8')
+        offset += id_length
+
+        timestamp, ph, turbidity, temperature, quality, rssi, uptime = _BINARY_BODY.unpack_from(body, offset)
+        offset += _BINARY_BODY.size
+
+        if not device_id:
+            raise ValueError('Invalid data format')
+        readings.append({
+            'device_id': device_id,
+            'ph': _binary_float(ph),
+            'turbidity': _binary_float(turbidity),
+            'temperature': _binary_float(temperature),
+            'water_quality': WATER_QUALITY_NAMES.get(quality),
+            'wifi_rssi': None if rssi == _MISSING_RSSI else rssi,
+            'uptime': None if uptime == _MISSING_UPTIME else uptime,
+            'timestamp': datetime.utcfromtimestamp(timestamp) if timestamp else datetime.utcnow()
+        })
+    return readings
+
+
+def encode_binary_reading(reading):
+    """Encode a parsed reading dict (parse_reading_payload shape) as one binary record"""
+    device_id = reading['device_id'].encode('utf-8')
+    if len(device_id) > 0xFF:
+        raise ValueError('device_id too long for binary format')
+
+    quality = reading.get('water_quality')
+    if quality is not None and quality not in WATER_QUALITY_CODES:
+        raise ValueError(f'Unknown water_quality: {quality}')
+
+    timestamp = reading.get('timestamp')
+    nan = float('nan')
+    return _BINARY_HEADER.pack(BINARY_READING_VERSION, len(device_id)) + device_id + _BINARY_BODY.pack(
+        int((timestamp - datetime(1970, 1, 1)).total_seconds()) if timestamp else 0,
+        nan if reading.get('ph') is None else reading['ph'],
+        nan if reading.get('turbidity') is None else reading['turbidity'],
+        nan if reading.get('temperature') is None else reading['temperature'],
+        _MISSING_QUALITY if quality is None else WATER_QUALITY_CODES[quality],
+        _MISSING_RSSI if reading.get('wifi_rssi') is None else reading['wifi_rssi'],
+        _MISSING_UPTIME if reading.get('uptime') is None else reading['uptime']
+    )
+
+
+# ==================== READING ARCHIVE ====================
+#
+# Raw readings older than RETENTION_DAYS are moved out of
+# pool_sensor_readings into compressed columnar segment files, one
+# directory per device and month:
+#
+#   ARCHIVE_DIR/<device_id>/<YYYY-MM>/<first timestamp>-<first id>.seg
+#
+# A segment is a JSON header followed by one zlib-compressed column per
+# field; ids and timestamps are delta-encoded. Rollups and sketches
+# outlive the raw rows, so statistics over archived periods still come
+# from SQL; only fine resolutions are pruned, per ROLLUP_RETENTION_DAYS.
+# Raw reads (readings endpoint, stats edges, source=raw, rebuild-rollups)
+# merge the archive in transparently.
+
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', 90))  # 0 disables archiving
+RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', 3600))  # seconds between background runs
+RETENTION_SEGMENT_ROWS = int(os.getenv('RETENTION_SEGMENT_ROWS', 50000))
+RETENTION_DELETE_CHUNK = int(os.getenv('RETENTION_DELETE_CHUNK', 500))
+RETENTION_PAUSE_MS = int(os.getenv('RETENTION_PAUSE_MS', 50))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(os.path.dirname(__file__), 'archive'))
+
+# Rollup buckets and their sketch bins older than this many days are
+# deleted, per resolution, e.g. "1m=30,1h=365" (0 or absent keeps them)
+ROLLUP_RETENTION_DAYS = {
+    ROLLUP_RESOLUTIONS[name.strip()]: int(days)
+    for name, days in (
+        item.split('=', 1) for item in os.getenv('ROLLUP_RETENTION_DAYS', '1m=30').split(',') if '=' in item
+    )
+}
+
+ARCHIVE_MAGIC = b'PRA1'
+_ARCHIVE_PREFIX = struct.Struct('<4sI')
+
+# Column layout: 'delta' int64 deltas, 'float' float64 with NaN for missing,
+# 'int' float64 (exact for these ranges) with NaN for missing, 'text'
+# uint16 codes into a per-segment dictionary
+ARCHIVE_COLUMNS = (
+    ('id', 'delta'),
+    ('timestamp', 'delta'),  # microseconds since EPOCH
+    ('ph', 'float'),
+    ('turbidity', 'float'),
+    ('temperature', 'float'),
+    ('water_quality', 'text'),
+    ('wifi_rssi', 'int'),
+    ('uptime', 'int')
+)
+ARCHIVE_FIELDS = tuple(name for name, kind in ARCHIVE_COLUMNS)
+
+
+def _month_start(timestamp):
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(timestamp):
+    return _month_start(_month_start(timestamp) + timedelta(days=32))
+
+
+def _pack_column(typecode, values):
+    data = array(typecode, values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return zlib.compress(data.tobytes(), 6)
+
+
+def _unpack_column(typecode, blob):
+    data = array(typecode)
+    data.frombytes(zlib.decompress(blob))
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data
+
+
+def encode_archive_segment(device_id, readings):
+    """Encode one device's readings (dicts with ARCHIVE_FIELDS) as a segment"""
+    header = {
+        'device_id': device_id,
+        'rows': len(readings),
+        'start': min(r['timestamp'] for r in readings).isoformat(),
+        'end': max(r['timestamp'] for r in readings).isoformat(),
+        'columns': []
+    }
+    blobs = []
+    for name, kind in ARCHIVE_COLUMNS:
+        values = [reading[name] for reading in readings]
+        column = {'name': name}
+        if kind == 'delta':
+            if name == 'timestamp':
+                values = [(value - EPOCH) // timedelta(microseconds=1) for value in values]
+            blob = _pack_column('q', [b - a for a, b in zip([0] + values, values)])
+        elif kind == 'text':
+            dictionary = list(dict.fromkeys(values))
+            codes = {value: code for code, value in enumerate(dictionary)}
+            column['dictionary'] = dictionary
+            blob = _pack_column('H', [codes[value] for value in values])
+        else:
+            blob = _pack_column('d', [math.nan if value is None else value for value in values])
+        column['size'] = len(blob)
+        header['columns'].append(column)
+        blobs.append(blob)
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    return _ARCHIVE_PREFIX.pack(ARCHIVE_MAGIC, len(header_bytes)) + header_bytes + b''.join(blobs)
+
+
+def _read_segment_header(f):
+    magic, length = _ARCHIVE_PREFIX.unpack(f.read(_ARCHIVE_PREFIX.size))
+    if magic != ARCHIVE_MAGIC:
+        raise ValueError(f'Not an archive segment: {f.name}')
+    header = json.loads(f.read(length))
+    header['start'] = datetime.fromisoformat(header['start'])
+    header['end'] = datetime.fromisoformat(header['end'])
+    return header
+
+
+def decode_archive_segment(header, body):
+    """Decode the column blobs following a segment header into reading dicts"""
+    kinds = dict(ARCHIVE_COLUMNS)
+    columns = {}
+    offset = 0
+    for column in header['columns']:
+        name = column['name']
+        blob = body[offset:offset + column['size']]
+        offset += column['size']
+        kind = kinds[name]
+        if kind == 'delta':
+            values = list(accumulate(_unpack_column('q', blob)))
+            if name == 'timestamp':
+                values = [EPOCH + timedelta(microseconds=value) for value in values]
+        elif kind == 'text':
+            dictionary = column['dictionary']
+            values = [dictionary[code] for code in _unpack_column('H', blob)]
+        elif kind == 'int':
+            values = [None if math.isnan(value) else int(value) for value in _unpack_column('d', blob)]
+        else:
+            values = [None if math.isnan(value) else value for value in _unpack_column('d', blob)]
+        columns[name] = values
+
+    device_id = header['device_id']
+    return [
+        dict(zip(ARCHIVE_FIELDS, row), device_id=device_id)
+        for row in zip(*(columns[name] for name in ARCHIVE_FIELDS))
+    ]
+
+
+class ReadingArchive:
+    """Per-device, per-month directories of archived reading segments.
+
+    A segment is written to a temporary file and renamed into place with a
+    ``.moving`` marker beside it; the marker is removed once the segment's
+    rows are gone from the hot table, so an interrupted move is finished
+    by ``pending()`` instead of archiving the same rows twice.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _device_dir(self, device_id):
+        return os.path.join(self.root, quote(device_id, safe='').replace('.', '%2E'))
+
+    def device_ids(self):
+        if not os.path.isdir(self.root):
+            return []
+        return [unquote(name) for name in sorted(os.listdir(self.root))
+                if os.path.isdir(os.path.join(self.root, name))]
+
+    def segments(self, device_id, start=None, end=None):
+        """Segment paths of months overlapping [start, end), oldest month first"""
+        device_dir = self._device_dir(device_id)
+        if not os.path.isdir(device_dir):
+            return []
+        paths = []
+        for month in sorted(os.listdir(device_dir)):
+            month_start = datetime.strptime(month, '%Y-%m')
+            if (end is not None and month_start >= end) or (start is not None and _next_month(month_start) <= start):
+                continue
+            month_dir = os.path.join(device_dir, month)
+            paths += [os.path.join(month_dir, name) for name in sorted(os.listdir(month_dir)) if name.endswith('.seg')]
+        return paths
+
+    def write(self, device_id, readings):
+        """Write one device-month of readings as a new segment; returns its path"""
+        first = min(readings, key=lambda r: (r['timestamp'], r['id']))
+        month_dir = os.path.join(self._device_dir(device_id), first['timestamp'].strftime('%Y-%m'))
+        os.makedirs(month_dir, exist_ok=True)
+        path = os.path.join(month_dir, f"{first['timestamp']:%Y%m%dT%H%M%S}-{first['id']}.seg")
+
+        with open(path + '.tmp', 'wb') as f:
+            f.write(encode_archive_segment(device_id, readings))
+            f.flush()
+            os.fsync(f.fileno())
+        # Marker first: a visible segment without it means its rows are gone from SQL
+        open(path + '.moving', 'wb').close()
+        os.replace(path + '.tmp', path)
+        return path
+
+    def finish(self, path):
+        """Mark a segment's move as complete"""
+        os.remove(path + '.moving')
+
+    def pending(self):
+        """Segments whose move was interrupted, with their reading ids"""
+        pending = []
+        for device_id in self.device_ids():
+            device_dir = self._device_dir(device_id)
+            for month in os.listdir(device_dir):
+                month_dir = os.path.join(device_dir, month)
+                for name in os.listdir(month_dir):
+                    if not name.endswith('.moving'):
+                        continue
+                    path = os.path.join(month_dir, name[:-len('.moving')])
+                    if os.path.exists(path):
+                        pending.append((path, [reading['id'] for reading in self.read_segment(path)]))
+                    else:
+                        # Crashed before the rename: the rows never left SQL
+                        if os.path.exists(path + '.tmp'):
+                            os.remove(path + '.tmp')
+                        os.remove(path + '.moving')
+        return pending
+
+    def read_segment(self, path, start=None, end=None):
+        """Readings of one segment within [start, end), or [] if it does not overlap"""
+        with open(path, 'rb') as f:
+            header = _read_segment_header(f)
+            if (end is not None and header['start'] >= end) or (start is not None and header['end'] < start):
+                return []
+            readings = decode_archive_segment(header, f.read())
+        if start is not None or end is not None:
+            readings = [
+                r for r in readings
+                if (start is None or r['timestamp'] >= start) and (end is None or r['timestamp'] < end)
+            ]
+        return readings
+
+    def scan(self, device_id, start=None, end=None):
+        """Yield archived readings in [start, end) in (timestamp, id) order.
+
+        Segments are decoded one at a time; only segments whose time ranges
+        overlap (late readings archived by a later run) are merged together.
+        """
+        headers = []
+        for path in self.segments(device_id, start, end):
+            with open(path, 'rb') as f:
+                header = _read_segment_header(f)
+            if (end is None or header['start'] < end) and (start is None or header['end'] >= start):
+                headers.append((header['start'], header['end'], path))
+        headers.sort()
+
+        group = []
+        group_end = None
+        for segment_start, segment_end, path in headers:
+            if group and segment_start > group_end:
+                yield from self._read_group(group, start, end)
+                group = []
+            group_end = segment_end if not group else max(group_end, segment_end)
+            group.append(path)
+        if group:
+            yield from self._read_group(group, start, end)
+
+    def _read_group(self, paths, start, end):
+        readings = []
+        for path in paths:
+            readings += self.read_segment(path, start, end)
+        if len(paths) > 1:
+            readings.sort(key=lambda r: (r['timestamp'], r['id']))
+        return readings
+
+    def read(self, device_id, start=None, end=None, newest_first=False, limit=None):
+        """Archived readings of a device in [start, end), ordered by timestamp.
+
+        With newest_first and a limit, months are read newest first and
+        reading stops once enough rows are collected.
+        """
+        if not newest_first or limit is None:
+            readings = list(self.scan(device_id, start, end))
+            readings.sort(key=lambda r: (r['timestamp'], r['id']), reverse=newest_first)
+            return readings[:limit] if limit is not None else readings
+
+        months = {}
+        for path in self.segments(device_id, start, end):
+            months.setdefault(os.path.dirname(path), []).append(path)
+        readings = []
+        for month_dir in sorted(months, reverse=True):
+            for path in months[month_dir]:
+                readings += self.read_segment(path, start, end)
+            # Months do not overlap, so older months cannot beat what we have
+            if len(readings) >= limit:
+                break
+        readings.sort(key=lambda r: (r['timestamp'], r['id']), reverse=True)
+        return readings[:limit]
+
+    def newest(self, device_id):
+        """Latest archived timestamp of a device, or None"""
+        paths = self.segments(device_id)
+        if not paths:
+            return None
+        newest_month = os.path.dirname(paths[-1])
+        newest = None
+        for path in paths:
+            if os.path.dirname(path) != newest_month:
+                continue
+            with open(path, 'rb') as f:
+                end = _read_segment_header(f)['end']
+            newest = end if newest is None or end > newest else newest
+        return newest
+
+    def stats(self):
+        segments = 0
+        size = 0
+        devices = self.device_ids()
+        for device_id in devices:
+            for path in self.segments(device_id):
+                segments += 1
+                size += os.path.getsize(path)
+        return {'path': self.root, 'devices': len(devices), 'segments': segments, 'bytes': size}
+
+
+reading_archive = ReadingArchive(ARCHIVE_DIR)
+
+
+def _delete_readings(ids, chunk_size, pause_ms):
+    """Delete readings by id in small transactions so ingest can interleave"""
+    for i in range(0, len(ids), chunk_size):
+        SensorReading.query.filter(SensorReading.id.in_(ids[i:i + chunk_size])).delete(synchronize_session=False)
+        db.session.commit()
+        if pause_ms:
+            time.sleep(pause_ms / 1000.0)
+
+
+def archive_readings(cutoff, device_id=None, segment_rows=None, delete_chunk=None, pause_ms=None):
+    """Move raw readings older than cutoff from the hot table into the archive.
+
+    Readings are copied one device-month segment at a time; once a segment
+    is on disk its rows are deleted in chunks of ``delete_chunk`` with a
+    short pause between transactions. Returns (readings archived, segments
+    written).
+    """
+    segment_rows = segment_rows or RETENTION_SEGMENT_ROWS
+    delete_chunk = delete_chunk or RETENTION_DELETE_CHUNK
+    pause_ms = RETENTION_PAUSE_MS if pause_ms is None else pause_ms
+
+    os.makedirs(reading_archive.root, exist_ok=True)
+    with open(os.path.join(reading_archive.root, '.lock'), 'wb') as lock_file:
+        # One archiver at a time across processes (CLI, workers)
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                print("Archive already running in another process, skipping")
+                return 0, 0
+
+        for path, ids in reading_archive.pending():
+            _delete_readings(ids, delete_chunk, pause_ms)
+            reading_archive.finish(path)
+
+        if device_id:
+            device_ids = [device_id]
+        else:
+            device_ids = [row[0] for row in db.session.query(SensorReading.device_id).filter(
+                SensorReading.timestamp < cutoff
+            ).distinct()]
+
+        columns = [getattr(SensorReading, name) for name in ARCHIVE_FIELDS]
+        archived = 0
+        segments = 0
+        for current_device in device_ids:
+            while True:
+                oldest = db.session.query(db.func.min(SensorReading.timestamp)).filter(
+                    SensorReading.device_id == current_device,
+                    SensorReading.timestamp < cutoff
+                ).scalar()
+                if oldest is None:
+                    break
+
+                # One segment never spans months, so month directories stay disjoint
+                rows = db.session.execute(
+                    db.select(*columns).where(
+                        SensorReading.device_id == current_device,
+                        SensorReading.timestamp < min(_next_month(oldest), cutoff)
+                    ).order_by(SensorReading.timestamp, SensorReading.id).limit(segment_rows)
+                ).all()
+                db.session.commit()
+
+                readings = [dict(zip(ARCHIVE_FIELDS, row), device_id=current_device) for row in rows]
+                path = reading_archive.write(current_device, readings)
+                _delete_readings([reading['id'] for reading in readings], delete_chunk, pause_ms)
+                reading_archive.finish(path)
+                archived += len(readings)
+                segments += 1
+
+    return archived, segments
+
+
+def rollups_kept_since(resolution, start):
+    """True when no bucket of ``resolution`` at or after start has been pruned"""
+    days = ROLLUP_RETENTION_DAYS.get(resolution)
+    return not days or start >= datetime.utcnow() - timedelta(days=days)
+
+
+def prune_rollups(now=None, delete_chunk=None, pause_ms=None):
+    """Delete rollup buckets and sketch bins past their resolution's retention.
+
+    Rows are selected per device through the (device, resolution, bucket)
+    unique indexes and deleted in transactions of ``delete_chunk`` rows, like
+    archived readings. Returns the number of rows deleted.
+    """
+    now = now or datetime.utcnow()
+    delete_chunk = delete_chunk or RETENTION_DELETE_CHUNK
+    pause_ms = RETENTION_PAUSE_MS if pause_ms is None else pause_ms
+
+    device_ids = [row[0] for row in db.session.query(Device.device_id)]
+    deleted = 0
+    for resolution, days in ROLLUP_RETENTION_DAYS.items():
+        if not days:
+            continue
+        cutoff = now - timedelta(days=days)
+        for model in (SensorRollup, SensorSketchBin):
+            for device_id in device_ids:
+                while True:
+                    ids = [row[0] for row in db.session.query(model.id).filter(
+                        model.device_id == device_id,
+                        model.resolution == resolution,
+                        model.bucket_start < cutoff
+                    ).limit(delete_chunk)]
+                    if not ids:
+                        break
+                    model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+                    db.session.commit()
+                    deleted += len(ids)
+                    if pause_ms:
+                        time.sleep(pause_ms / 1000.0)
+        db.session.commit()
+    return deleted
+
+
+class RetentionWorker:
+    """Background thread that archives expired readings and prunes fine rollups every ``interval`` seconds"""
+
+    def __init__(self, days, interval):
+        self.days = days
+        self.interval = interval
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+        self.runs = 0
+        self.archived = 0
+        self.segments = 0
+        self.rollups_pruned = 0
+        self.last_run = None
+        self.last_duration_ms = None
+        self.last_error = None
+
+    def start(self):
+        """Start the worker thread (once per process) if retention is enabled"""
+        if not (self.days or any(ROLLUP_RETENTION_DAYS.values())) or not self.interval:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name='reading-retention', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        started = time.perf_counter()
+        cutoff = datetime.utcnow() - timedelta(days=self.days)
+        archived = segments = pruned = 0
+        error = None
+        with app.app_context():
+            try:
+                if self.days:
+                    archived, segments = archive_readings(cutoff)
+                pruned = prune_rollups()
+            except Exception as e:
+                db.session.rollback()
+                error = str(e)
+                print(f"Error archiving readings: {e}")
+
+        with self._lock:
+            self.runs += 1
+            self.archived += archived
+            self.segments += segments
+            self.rollups_pruned += pruned
+            self.last_run = datetime.utcnow()
+            self.last_duration_ms = (time.perf_counter() - started) * 1000
+            self.last_error = error
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'retention_days': self.days,
+                'interval_seconds': self.interval,
+                'running': self._thread is not None and self._thread.is_alive(),
+                'runs': self.runs,
+                'archived': self.archived,
+                'segments_written': self.segments,
+                'rollup_retention_days': {
+                    name: ROLLUP_RETENTION_DAYS.get(resolution, 0) for name, resolution in ROLLUP_RESOLUTIONS.items()
+                },
+                'rollups_pruned': self.rollups_pruned,
+                'last_run': self.last_run.isoformat() if self.last_run else None,
+                'last_duration_ms': round(self.last_duration_ms, 3) if self.last_duration_ms is not None else None,
+                'last_error': self.last_error,
+                'archive': reading_archive.stats()
+            }
+
+
+retention_worker = RetentionWorker(RETENTION_DAYS, RETENTION_INTERVAL)
+atexit.register(retention_worker.stop)
+
+
+# ==================== DOWNSAMPLING ====================
+#
+# Reduce a long series to a fixed number of points in one streaming pass
+# over time-ordered samples. Buckets are equal slices of the requested time
+# range, so the input never has to be counted or held in memory.
+
+DOWNSAMPLE_MAX_POINTS = int(os.getenv('DOWNSAMPLE_MAX_POINTS', 5000))
+
+
+class LTTBDownsampler:
+    """Largest-Triangle-Three-Buckets over time buckets.
+
+    Keeps the first and last samples and, for each bucket in between, the
+    sample forming the largest triangle with the previously selected point
+    and the average of the next non-empty bucket. Holds two buckets of
+    samples at a time.
+    """
+
+    def __init__(self):
+        self.selected = []
+        self.current = None
+        self.pending = None
+
+    @staticmethod
+    def bucket_count(points):
+        return max(points - 2, 1)
+
+    def add_bucket(self, samples):
+        """Add the (t, value) samples of the next non-empty bucket, in time order"""
+        if not self.selected:
+            self.selected.append(samples[0])
+            samples = samples[1:]
+            if not samples:
+                return
+        if self.current is None:
+            self.current = samples
+        elif self.pending is None:
+            self.pending = samples
+        else:
+            self._select(self._average(self.pending))
+            self.current, self.pending = self.pending, samples
+
+    @staticmethod
+    def _average(samples):
+        return (sum(t for t, _ in samples) / len(samples), sum(v for _, v in samples) / len(samples))
+
+    def _select(self, next_point):
+        (ax, ay), (cx, cy) = self.selected[-1], next_point
+        # Twice the triangle area; the constant factor does not change the argmax
+        self.selected.append(max(
+            self.current,
+            key=lambda point: abs((ax - cx) * (point[1] - ay) - (ax - point[0]) * (cy - ay))
+        ))
+
+    def finish(self):
+        """Return the selected (t, value) samples in time order"""
+        last_bucket = self.pending or self.current
+        if not last_bucket:
+            return self.selected
+        last = last_bucket.pop()
+        if self.current and self.pending:
+            self._select(self._average(self.pending))
+            self.current = self.pending
+        if self.current:
+            self._select(last)
+        return self.selected + [last]
+
+
+class MinMaxDownsampler:
+    """Keep the minimum and maximum sample of each time bucket, in time order"""
+
+    def __init__(self):
+        self.selected = []
+
+    @staticmethod
+    def bucket_count(points):
+        return max(points // 2, 1)
+
+    def add_bucket(self, samples):
+        """Add the (t, value) samples of the next non-empty bucket, in time order"""
+        minimum = min(samples, key=itemgetter(1))
+        maximum = max(samples, key=itemgetter(1))
+        if minimum is maximum:
+            self.selected.append(minimum)
+        else:
+            self.selected += sorted((minimum, maximum))
+
+    def finish(self):
+        """Return the selected (t, value) samples in time order"""
+        return self.selected
+
+
+DOWNSAMPLERS = {
+    'lttb': LTTBDownsampler,
+    'minmax': MinMaxDownsampler
+}
+
+
+def downsample_readings(device_id, start, end, points, method='lttb'):
+    """Downsample each metric of a device's readings in [start, end) to about ``points`` samples.
+
+    Rows are grouped into time buckets as they stream in, so only one
+    bucket of readings is held at a time. Returns
+    ({metric: [(epoch seconds, value), ...]}, readings scanned).
+    """
+    sampler_class = DOWNSAMPLERS[method]
+    range_start = (start - EPOCH).total_seconds()
+    width = max((end - start).total_seconds(), 1e-6) / sampler_class.bucket_count(points)
+    samplers = [sampler_class() for _ in ROLLUP_METRICS]
+
+    rows = (
+        ((row[1] - EPOCH).total_seconds(),) + row[2:]
+        for row in iter_device_readings(device_id, start, end, fields=READINGS_COLUMNAR_FIELDS)
+    )
+    scanned = 0
+    for _, bucket in groupby(rows, key=lambda row: int((row[0] - range_start) // width)):
+        bucket = list(bucket)
+        scanned += len(bucket)
+        for position, sampler in enumerate(samplers, 1):
+            samples = [(row[0], row[position]) for row in bucket if row[position] is not None]
+            if samples:
+                sampler.add_bucket(samples)
+
+    return {metric: sampler.finish() for metric, sampler in zip(ROLLUP_METRICS, samplers)}, scanned
+
+
+# ==================== WRITE-BEHIND INGESTION ====================
+
+# When enabled, /pool/data queues readings and returns before they are committed.
+# A 202 is not durable: readings still queued in a worker are lost if it is
+# killed (SIGKILL, OOM, power loss), and a reading that cannot be written is
+# dropped after the device has been answered. Both show in /api/ingest/stats.
+INGEST_WRITE_BEHIND = os.getenv('INGEST_WRITE_BEHIND', 'False').lower() == 'true'
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 10000))
+INGEST_FLUSH_SIZE = int(os.getenv('INGEST_FLUSH_SIZE', 500))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv('INGEST_FLUSH_INTERVAL_MS', 200))
+INGEST_RETRY_AFTER = int(os.getenv('INGEST_RETRY_AFTER', 1))
+# Seconds a stopping worker waits for its queue to be committed; keep below
+# gunicorn's graceful_timeout
+INGEST_EXIT_FLUSH_TIMEOUT = float(os.getenv('INGEST_EXIT_FLUSH_TIMEOUT', 20))
+
+
+class WriteBehindBuffer:
+    """Bounded in-process queue of readings flushed in group commits.
+
+    A single background thread drains the queue and writes up to
+    ``flush_size`` readings per transaction, or whatever has arrived once
+    ``flush_interval_ms`` has passed since the first queued reading.
+    """
+
+    _STOP = object()
+
+    def __init__(self, maxsize, flush_size, flush_interval_ms, exit_timeout=INGEST_EXIT_FLUSH_TIMEOUT):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.exit_timeout = exit_timeout
+        self._lock = Lock()
+        self._thread = None
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.lost_at_exit = 0
+        # Acknowledged readings that could not be written, newest last
+        self.recent_failures = deque(maxlen=20)
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def _ensure_started(self):
+        """Start the flusher thread on first use (once per process)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name='ingest-flusher', daemon=True)
+                self._thread.start()
+
+    def put(self, reading):
+        """Queue a parsed reading; returns False when the queue is full"""
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(reading)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is self._STOP:
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while len(batch) < self.flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch):
+        """Write one group of readings, isolating bad rows on failure"""
+        started = time.perf_counter()
+        written = 0
+        with app.app_context():
+            try:
+                ingest_readings(batch)
+                written = len(batch)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error flushing {len(batch)} queued readings: {e}")
+                # Retry one by one so a single bad reading does not lose the group
+                for reading in batch:
+                    try:
+                        ingest_readings([reading])
+                        written += 1
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Dropping queued reading for {reading['device_id']}: {e}")
+                        with self._lock:
+                            self.recent_failures.append({
+                                'device_id': reading['device_id'],
+                                'timestamp': reading['timestamp'].isoformat(),
+                                'error': str(e),
+                                'dropped_at': datetime.utcnow().isoformat()
+                            })
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.written += written
+            self.failed += len(batch) - written
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+
+    def stop(self, timeout=None):
+        """Flush whatever is queued and stop the flusher thread (at worker exit)"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        deadline = time.monotonic() + (self.exit_timeout if timeout is None else timeout)
+        try:
+            self.queue.put(self._STOP, timeout=max(deadline - time.monotonic(), 0))
+        except queue.Full:
+            pass
+        else:
+            self._thread.join(max(deadline - time.monotonic(), 0))
+        if self._thread.is_alive():
+            lost = self.queue.qsize()
+            with self._lock:
+                self.lost_at_exit += lost
+            print(f"Write-behind: {lost} queued readings not committed before exit")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': INGEST_WRITE_BEHIND,
+                'queue_depth': self.queue.qsize(),
+                'queue_capacity': self.queue.maxsize,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'lost_at_exit': self.lost_at_exit,
+                'recent_failures': list(self.recent_failures),
+                'flushes': self.flushes,
+                'flush_size': self.flush_size,
+                'flush_interval_ms': self.flush_interval * 1000,
+                'last_flush_ms': round(self.last_flush_ms, 3),
+                'max_flush_ms': round(self.max_flush_ms, 3),
+                'avg_flush_ms': round(self.total_flush_ms / self.flushes, 3) if self.flushes else None
+            }
+
+
+write_behind = WriteBehindBuffer(INGEST_QUEUE_SIZE, INGEST_FLUSH_SIZE, INGEST_FLUSH_INTERVAL_MS)
+atexit.register(write_behind.stop)
+
+
+# ==================== API ENDPOINTS ====================
+
+@app.route('/pool/data', methods=['POST'])
+def receive_data():
+    """Receive sensor data from ESP32 devices"""
+    try:
+        # The config version the device is running, to piggyback config changes
+        reported_version = request.headers.get('X-Config-Version')
+        try:
+            if is_binary_payload(request):
+                readings = decode_binary_readings(request.get_data())
+                if len(readings) != 1:
+                    raise ValueError('Expected exactly one binary reading')
+                reading = readings[0]
+            else:
+                data = request.get_json(silent=True)
+                reading = parse_reading_payload(data)
+                if data.get('config_version') is not None:
+                    reported_version = data['config_version']
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if INGEST_WRITE_BEHIND:
+            if not write_behind.put(reading):
+                return jsonify({'error': 'Ingest queue is full, retry later'}), 503, \
+                    {'Retry-After': str(INGEST_RETRY_AFTER)}
+            # Acknowledged before the commit: see the loss window above INGEST_WRITE_BEHIND
+            return jsonify({
+                'status': 'queued',
+                'message': 'Data queued for storage',
+                **config_sync(reading['device_id'], reported_version)
+            }), 202
+
+        reading_ids = ingest_readings([reading])
+
+        return jsonify({
+            'status': 'success',
+            'message': 'Data received successfully',
+            'reading_id': reading_ids[0],
+            **config_sync(reading['device_id'], reported_version)
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error receiving data: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/pool/data/batch', methods=['POST'])
+def receive_data_batch():
+    """Receive a batch of sensor readings from one or many devices"""
+    try:
+        binary = is_binary_payload(request)
+        if binary:
+            # Binary records carry no per-item errors: the body decodes or it does not
+            try:
+                items = decode_binary_readings(request.get_data())
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            reported_versions = {}
+        else:
+            data = request.get_json(silent=True)
+            # Accept either a bare array or {"readings": [...], "config_versions": {...}}
+            items = data.get('readings') if isinstance(data, dict) else data
+            reported_versions = data.get('config_versions') if isinstance(data, dict) else None
+            if not isinstance(reported_versions, dict):
+                reported_versions = {}
+
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Invalid data format'}), 400
+
+        if len(items) > INGEST_MAX_BATCH_SIZE:
+            return jsonify({'error': f'Batch too large (max {INGEST_MAX_BATCH_SIZE} readings)'}), 413
+
+        results = []
+        accepted = []
+        for index, item in enumerate(items):
+            try:
+                accepted.append((index, item if binary else parse_reading_payload(item)))
+                results.append({'index': index, 'status': 'accepted'})
+            except ValueError as e:
+                results.append({'index': index, 'status': 'rejected', 'error': str(e)})
+
+        reading_ids = ingest_readings([reading for _, reading in accepted])
+        for (index, _), reading_id in zip(accepted, reading_ids):
+            results[index]['reading_id'] = reading_id
+
+        config_versions = {}
+        configs = {}
+        for device_id in {reading['device_id'] for _, reading in accepted}:
+            sync = config_sync(device_id, reported_versions.get(device_id))
+            if sync:
+                config_versions[device_id] = sync['config_version']
+            if 'config' in sync:
+                configs[device_id] = sync['config']
+
+        body = {
+            'status': 'success' if len(accepted) == len(items) else 'partial',
+            'accepted': len(accepted),
+            'rejected': len(items) - len(accepted),
+            'results': results,
+            'config_versions': config_versions
+        }
+        if configs:
+            body['configs'] = configs
+        return jsonify(body), 200 if accepted else 400
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error receiving batch data: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/ingest/stats', methods=['GET'])
+def get_ingest_stats():
+    """Get ingestion pipeline counters"""
+    return jsonify({
+        'write_behind': write_behind.stats(),
+        'device_cache': device_cache.stats(),
+        'alert_index': alert_index.stats(),
+        'retention': retention_worker.stats(),
+        'database': sqlite_checkpointer.stats(),
+        'dispenser_states': dispenser_states.stats(),
+        'dispenser_waiters': dispenser_notifier.stats(),
+        'reading_stream': {**reading_broker.stats(), 'tail': reading_tail.stats()},
+        'principal_cache': principal_cache.stats(),
+        'password_hashing': password_hasher.stats(),
+        'dispensing_leases': lease_sweeper.stats()
+    }), 200
+
+
+@app.route('/pool/config', methods=['GET'])
+def get_config():
+    """Send configuration to ESP32 device"""
+    try:
+        device_id = request.args.get('device_id')
+        
+        if not device_id:
+            return jsonify({'error': 'device_id parameter required'}), 400
+        
+        # Known devices are answered from the device cache, usually with a 304
+        snapshot = get_device_configs([device_id]).get(device_id)
+        if snapshot:
+            return config_response(device_id, snapshot)
+        
+        # Get or create device config
+        config = DeviceConfig.query.filter_by(device_id=device_id).first()
+        
+        if not config:
+            # Create default config
+            device = Device.query.filter_by(device_id=device_id).first()
+            if not device:
+                device = Device(device_id=device_id)
+                db.session.add(device)
+            
+            config = DeviceConfig(device_id=device_id)
+            db.session.add(config)
+            db.session.commit()
+        
+        snapshot = device_cache.put(device_id, config, device_cache.generation)
+        return config_response(device_id, snapshot)
+        
+    except Exception as e:
+        print(f"Error getting config: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+# ==================== WEB API ENDPOINTS (for dashboard/admin) ====================
+
+@app.route('/api/devices', methods=['GET'])
+def get_devices():
+    """Get all registered devices"""
+    try:
+        devices = Device.query.all()
+        return jsonify([device.to_dict() for device in devices]), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/devices/<device_id>', methods=['GET'])
+def get_device(device_id):
+    """Get specific device information"""
+    try:
+        device = Device.query.filter_by(device_id=device_id).first()
+        if not device:
+            return jsonify({'error': 'Device not found'}), 404
+        
+        return jsonify(device.to_dict()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/devices/<device_id>', methods=['PUT'])
+def update_device(device_id):
+    """Update device information"""
+    try:
+        device = Device.query.filter_by(device_id=device_id).first()
+        if not device:
+            return jsonify({'error': 'Device not found'}), 404
+        
+        data = request.get_json()
+        if 'name' in data:
+            device.name = data['name']
+        if 'location' in data:
+            device.location = data['location']
+        
+        db.session.commit()
+        device_cache.invalidate(device_id)
+        return jsonify(device.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+def encode_readings_cursor(timestamp, reading_id, start_time):
+    """Opaque keyset cursor pointing just past a reading (newest-first order)"""
+    position = {
+        'timestamp': timestamp.isoformat(),
+        'id': reading_id,
+        'start': start_time.isoformat() if start_time else None
+    }
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_readings_cursor(cursor):
+    """Return (timestamp, id, start_time) from a cursor; raises ValueError"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        start_time = datetime.fromisoformat(position['start']) if position['start'] else None
+        return datetime.fromisoformat(position['timestamp']), int(position['id']), start_time
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+# Columns fetched for a readings page; ?format=columnar pages are far cheaper and may be larger
+READINGS_FIELDS = ('id', 'timestamp', 'device_id', 'ph', 'turbidity', 'temperature',
+                   'water_quality', 'wifi_rssi', 'uptime')
+READINGS_COLUMNAR_FIELDS = ('id', 'timestamp') + ROLLUP_METRICS
+READINGS_COLUMNAR_MAX_ROWS = 10000
+
+
+def _columnar_readings(device_id, rows):
+    """Parallel arrays, oldest first, from newest-first (id, timestamp, metrics...) rows"""
+    rows = rows[::-1]
+    columns = list(zip(*rows)) if rows else [()] * len(READINGS_COLUMNAR_FIELDS)
+    data = {
+        'device_id': device_id,
+        'count': len(rows),
+        'timestamps': [int((timestamp - EPOCH).total_seconds()) for timestamp in columns[1]]
+    }
+    for index, metric in enumerate(ROLLUP_METRICS, 2):
+        data[metric] = list(columns[index])
+    return data
+
+
+def _time_range_args(default_hours=None):
+    """Read ?start=&end= (ISO 8601 or epoch seconds) or ?hours=; raises ValueError"""
+    start_time = parse_timestamp(request.args['start']) if 'start' in request.args else None
+    end_time = parse_timestamp(request.args['end']) if 'end' in request.args else None
+    hours = request.args.get('hours', default_hours, type=int)
+    if hours and start_time is None:
+        start_time = (end_time or datetime.utcnow()) - timedelta(hours=hours)
+    return start_time, end_time
+
+
+def _downsampled_readings(device_id, points):
+    """Response for ?points=N: each metric reduced to about N samples over the range"""
+    method = request.args.get('downsample', 'lttb')
+    if method not in DOWNSAMPLERS:
+        return jsonify({'error': f'downsample must be one of: {", ".join(DOWNSAMPLERS)}'}), 400
+    if not 3 <= points <= DOWNSAMPLE_MAX_POINTS:
+        return jsonify({'error': f'points must be between 3 and {DOWNSAMPLE_MAX_POINTS}'}), 400
+    try:
+        start_time, end_time = _time_range_args(default_hours=24)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    end_time = end_time or datetime.utcnow()
+    if start_time is None or start_time >= end_time:
+        return jsonify({'error': 'start must be before end'}), 400
+    
+    series, scanned = downsample_readings(device_id, start_time, end_time, points, method)
+    return jsonify({
+        'device_id': device_id,
+        'downsample': method,
+        'points': points,
+        'start': start_time.isoformat(),
+        'end': end_time.isoformat(),
+        'source_readings': scanned,
+        'series': {
+            metric: {
+                'timestamps': [int(t) for t, _ in samples],
+                'values': [value for _, value in samples]
+            }
+            for metric, samples in series.items()
+        }
+    }), 200
 
 
 @app.route('/api/devices/<device_id>/readings', methods=['GET'])
 def get_readings(device_id):
-    """Get sensor readings for a device"""
+    """Get sensor readings for a device, newest first, one keyset page at a time"""
     try:
-        # Get query parameters - limit to maximum 100 records
-        limit = min(request.args.get('limit', 100, type=int), 100)
+        points = request.args.get('points', type=int)
+        if points is not None:
+            return _downsampled_readings(device_id, points)
+        
+        columnar = request.args.get('format') == 'columnar'
+        # Get query parameters - limit to maximum 100 records (columnar pages are far cheaper)
+        max_rows = READINGS_COLUMNAR_MAX_ROWS if columnar else 100
+        # A negative LIMIT means no limit at all to SQLite
+        limit = min(max(request.args.get('limit', 100, type=int), 0), max_rows)
         hours = request.args.get('hours', type=int)
+        cursor = request.args.get('cursor')
         
         query = SensorReading.query.filter_by(device_id=device_id)
         
-        if hours:
+        start_time = None
+        before = None
+        if cursor:
+            # The cursor carries the original window so later pages do not drift
+            try:
+                before_timestamp, before_id, start_time = decode_readings_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            before = (before_timestamp, before_id)
+            query = query.filter(db.or_(
+                SensorReading.timestamp < before_timestamp,
+                db.and_(SensorReading.timestamp == before_timestamp, SensorReading.id < before_id)
+            ))
+        elif hours:
             start_time = datetime.utcnow() - timedelta(hours=hours)
+        
+        if start_time:
             query = query.filter(SensorReading.timestamp >= start_time)
         
-        readings = query.order_by(SensorReading.timestamp.desc()).limit(limit).all()
+        # Plain column rows, no ORM objects; id and timestamp lead for the keyset
+        fields = READINGS_COLUMNAR_FIELDS if columnar else READINGS_FIELDS
+        rows = [tuple(row) for row in query.with_entities(*(getattr(SensorReading, name) for name in fields))
+                .order_by(SensorReading.timestamp.desc(), SensorReading.id.desc())
+                .limit(limit)]
+        
+        # Fall through to the archive when the hot table cannot fill the page
+        newest_archived = reading_archive.newest(device_id)
+        if newest_archived and limit and (len(rows) < limit or rows[-1][1] <= newest_archived):
+            end_time = before[0] + timedelta(microseconds=1) if before else None
+            archived = reading_archive.read(device_id, start_time, end_time, newest_first=True, limit=limit + 1)
+            merged = {row[0]: row for row in rows}
+            for reading in archived:
+                if before is None or (reading['timestamp'], reading['id']) < before:
+                    merged.setdefault(reading['id'], tuple(reading[name] for name in fields))
+            rows = sorted(merged.values(), key=lambda row: (row[1], row[0]), reverse=True)[:limit]
+        
+        if columnar:
+            response = jsonify(_columnar_readings(device_id, rows))
+        else:
+            response = jsonify([SensorReading(**dict(zip(fields, row))).to_dict() for row in rows])
+        if rows and len(rows) == limit:
+            response.headers['X-Next-Cursor'] = encode_readings_cursor(rows[-1][1], rows[-1][0], start_time)
+        return response, 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Rows per chunk written to an export stream
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_FIELDS = ('id', 'device_id', 'timestamp', 'ph', 'turbidity', 'temperature',
+                 'water_quality', 'wifi_rssi', 'uptime')
+
+
+def iter_device_readings(device_id, start=None, end=None, chunk_size=EXPORT_CHUNK_ROWS, fields=EXPORT_FIELDS):
+    """Yield a device's readings in [start, end) as field tuples, oldest first.
+
+    Archived and hot rows are merged lazily; hot rows are fetched with
+    yield_per, so memory stays flat however long the range is. ``fields``
+    must include id and timestamp.
+    """
+    # Core table columns skip ORM row processing
+    table = SensorReading.__table__
+    query = db.select(*(table.c[name] for name in fields)).where(table.c.device_id == device_id)
+    if start:
+        query = query.where(table.c.timestamp >= start)
+    if end:
+        query = query.where(table.c.timestamp < end)
+    query = query.order_by(table.c.timestamp, table.c.id).execution_options(yield_per=chunk_size)
+
+    hot = (tuple(row) for row in db.session.execute(query))
+    if not reading_archive.segments(device_id, start, end):
+        return hot
+    archived = (tuple(reading[name] for name in fields) for reading in reading_archive.scan(device_id, start, end))
+    # (timestamp, id) is the sort key; both sources are already in that order
+    sort_key = itemgetter(fields.index('timestamp'), fields.index('id'))
+    return heapq.merge(archived, hot, key=sort_key)
+
+
+def _export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow((row[0], row[1], row[2].isoformat()) + row[3:])
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _export_ndjson(rows):
+    lines = []
+    for row in rows:
+        record = dict(zip(EXPORT_FIELDS, row))
+        record['timestamp'] = row[2].isoformat()
+        lines.append(json.dumps(record, separators=(',', ':')))
+        if len(lines) >= EXPORT_CHUNK_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', _export_ndjson),
+    'csv': ('text/csv', _export_csv)
+}
+
+
+@app.route('/api/devices/<device_id>/readings/export', methods=['GET'])
+def export_readings(device_id):
+    """Stream all readings of a device in a time range as NDJSON or CSV"""
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'format must be one of: {", ".join(EXPORT_FORMATS)}'}), 400
+        
+        try:
+            start_time, end_time = _time_range_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify([reading.to_dict() for reading in readings]), 200
+        mimetype, writer = EXPORT_FORMATS[export_format]
+        rows = iter_device_readings(device_id, start_time, end_time)
+        response = Response(stream_with_context(writer(rows)), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="{device_id}_readings.{export_format}"'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -689,6 +3842,10 @@ def get_latest_reading(device_id):
         reading = SensorReading.query.filter_by(device_id=device_id)\
             .order_by(SensorReading.timestamp.desc()).first()
         
+        if not reading:
+            archived = reading_archive.read(device_id, newest_first=True, limit=1)
+            reading = SensorReading(**archived[0]) if archived else None
+        
         if not reading:
             return jsonify({'error': 'No readings found'}), 404
         
@@ -697,15 +3854,84 @@ def get_latest_reading(device_id):
         return jsonify({'error': str(e)}), 500
 
 
+def _stream_events(topic, subscriber, initial_frames):
+    """SSE response that sends initial_frames, then the subscriber's live events"""
+    # The connection goes back to the pool while the stream idles
+    db.session.close()
+
+    def events():
+        try:
+            yield from initial_frames
+            while True:
+                try:
+                    yield subscriber.get(timeout=READING_STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            reading_broker.unsubscribe(topic, subscriber)
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/devices/<device_id>/stream', methods=['GET'])
+def stream_device_readings(device_id):
+    """Server-Sent Events stream of a device's new readings and alerts"""
+    if not LONG_WAITS_ENABLED:
+        return jsonify({'error': LONG_WAITS_DISABLED_MESSAGE}), 501
+    try:
+        last_event_id = request.headers.get('Last-Event-ID', request.args.get('after_id'))
+        if last_event_id is not None and not str(last_event_id).isdigit():
+            return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+        
+        # Subscribe before querying so no reading falls between the two; a
+        # reading committed meanwhile may be sent twice with the same id
+        reading_tail.start()
+        subscriber = reading_broker.subscribe(device_id)
+        try:
+            if last_event_id is not None:
+                # Resume: replay what the client missed while disconnected
+                missed = SensorReading.query.filter(
+                    SensorReading.device_id == device_id,
+                    SensorReading.id > int(last_event_id)
+                ).order_by(SensorReading.id).limit(READING_STREAM_REPLAY_MAX).all()
+            else:
+                latest = SensorReading.query.filter_by(device_id=device_id)\
+                    .order_by(SensorReading.timestamp.desc()).first()
+                missed = [latest] if latest else []
+            frames = [format_sse('reading', reading.to_dict(), reading.id) for reading in missed]
+        except Exception:
+            reading_broker.unsubscribe(device_id, subscriber)
+            raise
+        
+        return _stream_events(device_id, subscriber, frames)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/readings/stream', methods=['GET'])
+def stream_fleet_readings():
+    """Server-Sent Events stream of new readings and alerts from every device"""
+    if not LONG_WAITS_ENABLED:
+        return jsonify({'error': LONG_WAITS_DISABLED_MESSAGE}), 501
+    try:
+        reading_tail.start()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return _stream_events(FLEET_TOPIC, reading_broker.subscribe(FLEET_TOPIC), [])
+
+
 @app.route('/api/devices/<device_id>/config', methods=['GET'])
 def get_device_config(device_id):
-    """Get device configuration"""
+    """Get device configuration (supports If-None-Match)"""
     try:
-        config = DeviceConfig.query.filter_by(device_id=device_id).first()
-        if not config:
+        snapshot = get_device_configs([device_id]).get(device_id)
+        if not snapshot:
             return jsonify({'error': 'Configuration not found'}), 404
         
-        return jsonify(config.to_dict()), 200
+        return config_response(device_id, snapshot)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -758,6 +3984,7 @@ def create_device_config(device_id):
         
         db.session.add(config)
         db.session.commit()
+        device_cache.invalidate(device_id)
         
         return jsonify(config.to_dict()), 201
     except Exception as e:
@@ -831,6 +4058,7 @@ def update_device_config(device_id):
         
         config.updated_at = datetime.utcnow()
         db.session.commit()
+        device_cache.invalidate(device_id)
         
         return jsonify(config.to_dict()), 200
     except Exception as e:
@@ -869,6 +4097,8 @@ def acknowledge_alert(alert_id):
         
         alert.acknowledged = True
         db.session.commit()
+        alert_index.refresh(alert.device_id, alert.alert_type)
+        alert_index.changed()
         
         return jsonify(alert.to_dict()), 200
     except Exception as e:
@@ -876,49 +4106,302 @@ def acknowledge_alert(alert_id):
         return jsonify({'error': str(e)}), 500
 
 
+# Limits for one multi-device statistics request
+STATS_MAX_DEVICES = 100
+STATS_MAX_WINDOWS = 10
+
+
+def _statistics_payload(hours, aggregate, distributions=None):
+    stats = {
+        'period_hours': hours,
+        'total_readings': aggregate.reading_count,
+        'ph': aggregate.metrics['ph'].to_dict(),
+        'turbidity': aggregate.metrics['turbidity'].to_dict(),
+        'temperature': aggregate.metrics['temperature'].to_dict()
+    }
+    if distributions:
+        for metric, summary in distributions.items():
+            stats[metric].update(summary)
+    return stats
+
+
+def _distribution_options():
+    """Read ?distribution=true&percentiles=..&bins=.., or None when not requested"""
+    if request.args.get('distribution', 'false').lower() != 'true':
+        return None
+    percentiles = [float(p) for p in _list_arg('percentiles')] or [50, 95, 99]
+    if any(p < 0 or p > 100 for p in percentiles):
+        raise ValueError('percentiles must be between 0 and 100')
+    bins = min(max(request.args.get('bins', 10, type=int), 1), 100)
+    return percentiles, bins
+
+
+def _device_distributions(device_ids, start, end, aggregates, options):
+    """Distribution summaries per device and metric from the stored sketches"""
+    percentiles, bins = options
+    sketches = sketch_window(device_ids, start, end)
+    configs = get_device_configs(device_ids)
+    return {
+        device_id: {
+            metric: distribution_summary(
+                metric, sketches[device_id][metric], aggregates[device_id].metrics[metric],
+                configs.get(device_id), percentiles, bins
+            )
+            for metric in ROLLUP_METRICS
+        }
+        for device_id in device_ids
+    }
+
+
+def _list_arg(name):
+    """Read a repeated or comma-separated query parameter"""
+    values = []
+    for value in request.args.getlist(name):
+        values += [item.strip() for item in value.split(',') if item.strip()]
+    return values
+
+
 @app.route('/api/stats/<device_id>', methods=['GET'])
 def get_statistics(device_id):
     """Get statistics for a device"""
     try:
         hours = request.args.get('hours', 24, type=int)
-        start_time = datetime.utcnow() - timedelta(hours=hours)
+        use_rollups = request.args.get('source', 'rollup') != 'raw'
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(hours=hours)
         
-        readings = SensorReading.query.filter_by(device_id=device_id)\
-            .filter(SensorReading.timestamp >= start_time).all()
+        # Whole buckets come from the rollup tables, only the edges from raw rows
+        aggregate = aggregate_window(device_id, start_time, end_time, use_rollups)
         
-        if not readings:
+        if not aggregate.reading_count:
             return jsonify({'error': 'No data available'}), 404
         
-        # Calculate statistics
-        ph_values = [r.ph for r in readings if r.ph is not None]
-        turbidity_values = [r.turbidity for r in readings if r.turbidity is not None]
-        temp_values = [r.temperature for r in readings if r.temperature is not None]
+        try:
+            options = _distribution_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        stats = {
-            'period_hours': hours,
-            'total_readings': len(readings),
-            'ph': {
-                'avg': sum(ph_values) / len(ph_values) if ph_values else None,
-                'min': min(ph_values) if ph_values else None,
-                'max': max(ph_values) if ph_values else None
-            },
-            'turbidity': {
-                'avg': sum(turbidity_values) / len(turbidity_values) if turbidity_values else None,
-                'min': min(turbidity_values) if turbidity_values else None,
-                'max': max(turbidity_values) if turbidity_values else None
-            },
-            'temperature': {
-                'avg': sum(temp_values) / len(temp_values) if temp_values else None,
-                'min': min(temp_values) if temp_values else None,
-                'max': max(temp_values) if temp_values else None
-            }
-        }
+        distributions = None
+        if options:
+            distributions = _device_distributions(
+                [device_id], start_time, end_time, {device_id: aggregate}, options
+            )[device_id]
+        
+        return jsonify(_statistics_payload(hours, aggregate, distributions)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/stats', methods=['GET'])
+def get_statistics_multi():
+    """Get statistics for several devices and windows in one call"""
+    try:
+        device_ids = list(dict.fromkeys(_list_arg('device_id')))
+        if not device_ids:
+            return jsonify({'error': 'device_id parameter required'}), 400
+        if len(device_ids) > STATS_MAX_DEVICES:
+            return jsonify({'error': f'Too many devices (max {STATS_MAX_DEVICES})'}), 400
+        
+        try:
+            windows = list(dict.fromkeys(int(hours) for hours in _list_arg('hours'))) or [24]
+        except ValueError:
+            return jsonify({'error': 'hours must be integers'}), 400
+        if len(windows) > STATS_MAX_WINDOWS:
+            return jsonify({'error': f'Too many windows (max {STATS_MAX_WINDOWS})'}), 400
+        
+        try:
+            options = _distribution_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        use_rollups = request.args.get('source', 'rollup') != 'raw'
+        end_time = datetime.utcnow()
+        
+        devices = {device_id: {} for device_id in device_ids}
+        for hours in windows:
+            start_time = end_time - timedelta(hours=hours)
+            aggregates = aggregate_devices(device_ids, start_time, end_time, use_rollups)
+            distributions = {}
+            if options:
+                distributions = _device_distributions(device_ids, start_time, end_time, aggregates, options)
+            for device_id, aggregate in aggregates.items():
+                devices[device_id][str(hours)] = _statistics_payload(
+                    hours, aggregate, distributions.get(device_id)
+                )
+        
+        return jsonify({
+            'windows': windows,
+            'devices': devices
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Upper bound on buckets returned by one history request
+HISTORY_MAX_BUCKETS = 5000
+
+
+@app.route('/api/devices/<device_id>/history', methods=['GET'])
+def get_history(device_id):
+    """Get bucketed sensor history for a device from the rollup tables"""
+    try:
+        hours = request.args.get('hours', 24, type=int)
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(hours=hours)
+        
+        # Default to the finest resolution that fits in a chart-sized response
+        resolution_name = request.args.get('resolution')
+        if resolution_name is None:
+            resolution_name = next(
+                (name for name, seconds in ROLLUP_RESOLUTIONS.items() if hours * 3600 / seconds <= 500),
+                '1d'
+            )
+        if resolution_name not in ROLLUP_RESOLUTIONS:
+            return jsonify({'error': f'resolution must be one of: {", ".join(ROLLUP_RESOLUTIONS)}'}), 400
+        
+        resolution = ROLLUP_RESOLUTIONS[resolution_name]
+        if hours * 3600 / resolution > HISTORY_MAX_BUCKETS:
+            return jsonify({'error': f'Too many buckets, use a coarser resolution (max {HISTORY_MAX_BUCKETS})'}), 400
+        
+        rollups = SensorRollup.query.filter(
+            SensorRollup.device_id == device_id,
+            SensorRollup.resolution == resolution,
+            SensorRollup.bucket_start >= floor_bucket(start_time, resolution),
+            SensorRollup.bucket_start < end_time
+        ).order_by(SensorRollup.bucket_start).all()
         
-        return jsonify(stats), 200
+        buckets = []
+        for rollup in rollups:
+            aggregate = SensorAggregate()
+            aggregate.merge_row(*(getattr(rollup, column.name) for column in _rollup_source_columns()))
+            bucket = aggregate.to_dict()
+            bucket['bucket_start'] = rollup.bucket_start.isoformat()
+            buckets.append(bucket)
+        
+        return jsonify({
+            'device_id': device_id,
+            'resolution': resolution_name,
+            'period_hours': hours,
+            'buckets': buckets
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+# ==================== DISPENSING JOB LEASES ====================
+#
+# Dispensers claim jobs instead of listing PENDING rows and marking them one
+# by one: a single UPDATE ... RETURNING moves the device's oldest pending
+# jobs to IN_PROGRESS with a lease, so two pollers can never receive the same
+# job. A job whose lease expires before it is completed goes back to PENDING
+# (LeaseSweeper), to be claimed again.
+
+DISPENSING_LEASE_SECONDS = int(os.getenv('DISPENSING_LEASE_SECONDS', 300))
+DISPENSING_LEASE_MAX_SECONDS = int(os.getenv('DISPENSING_LEASE_MAX_SECONDS', 3600))
+DISPENSING_CLAIM_MAX = int(os.getenv('DISPENSING_CLAIM_MAX', 100))
+DISPENSING_SWEEP_INTERVAL = int(os.getenv('DISPENSING_SWEEP_INTERVAL', 30))  # seconds, 0 disables
+
+
+def claim_dispensing_jobs(device_id, limit, lease_seconds, owner):
+    """Atomically lease up to ``limit`` of the device's oldest PENDING jobs; returns (jobs, expires_at)"""
+    expires_at = datetime.utcnow() + timedelta(seconds=lease_seconds)
+    # Walks ix_chemical_dispenser_jobs_flag_device_timestamp. Selecting and
+    # flagging happen in one statement: SQLite serializes writers, and on
+    # PostgreSQL SKIP LOCKED makes concurrent claims pass over each other's rows
+    candidates = db.select(ChemicalDispenser.id).where(
+        ChemicalDispenser.flag == 'PENDING',
+        ChemicalDispenser.device_id == device_id
+    ).order_by(ChemicalDispenser.timestamp, ChemicalDispenser.id).limit(limit).with_for_update(skip_locked=True)
+
+    claimed = db.session.scalars(
+        db.update(ChemicalDispenser).where(
+            ChemicalDispenser.id.in_(candidates.scalar_subquery())
+        ).values(
+            flag='IN_PROGRESS', lease_owner=owner, lease_expires_at=expires_at
+        ).returning(ChemicalDispenser),
+        execution_options={'synchronize_session': False, 'populate_existing': True}
+    ).all()
+    # RETURNING order is unspecified
+    jobs = [job.to_dict() for job in sorted(claimed, key=lambda job: (job.timestamp, job.id))]
+    db.session.commit()
+    return jobs, expires_at
+
+
+def reclaim_expired_leases(now=None):
+    """Return IN_PROGRESS jobs whose lease has expired to PENDING; returns the number reclaimed"""
+    result = db.session.execute(
+        db.update(ChemicalDispenser).where(
+            ChemicalDispenser.flag == 'IN_PROGRESS',
+            ChemicalDispenser.lease_expires_at < (now or datetime.utcnow())
+        ).values(flag='PENDING', lease_owner=None, lease_expires_at=None),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+class LeaseSweeper:
+    """Background thread that reclaims expired dispensing job leases every ``interval`` seconds"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+        self.runs = 0
+        self.reclaimed = 0
+        self.last_error = None
+
+    def start(self):
+        """Start the sweeper thread (once per process) if sweeping is enabled"""
+        if not self.interval:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name='lease-sweeper', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        reclaimed = 0
+        error = None
+        with app.app_context():
+            try:
+                reclaimed = reclaim_expired_leases()
+            except Exception as e:
+                db.session.rollback()
+                error = str(e)
+                print(f"Error reclaiming dispensing job leases: {e}")
+        if reclaimed:
+            print(f"Reclaimed {reclaimed} expired dispensing job lease(s)")
+
+        with self._lock:
+            self.runs += 1
+            self.reclaimed += reclaimed
+            self.last_error = error
+        return reclaimed
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'interval_seconds': self.interval,
+                'running': self._thread is not None and self._thread.is_alive(),
+                'runs': self.runs,
+                'reclaimed': self.reclaimed,
+                'last_error': self.last_error
+            }
+
+
+lease_sweeper = LeaseSweeper(DISPENSING_SWEEP_INTERVAL)
+atexit.register(lease_sweeper.stop)
+
+
 # ==================== CHEMICAL DISPENSER ENDPOINTS ====================
 
 @app.route('/api/dispensing-jobs', methods=['POST'])
@@ -978,6 +4461,70 @@ def get_chemical_data():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/dispensing-jobs/claim', methods=['POST'])
+def claim_chemical_jobs():
+    """Atomically lease the next PENDING jobs of a device"""
+    try:
+        data = request.get_json(silent=True) or {}
+        device_id = data.get('device_id') or request.args.get('device_id')
+        if not device_id:
+            return jsonify({'error': 'device_id required'}), 400
+        
+        try:
+            limit = min(max(int(data.get('limit', 1)), 1), DISPENSING_CLAIM_MAX)
+            lease_seconds = min(max(int(data.get('lease_seconds', DISPENSING_LEASE_SECONDS)), 1),
+                                DISPENSING_LEASE_MAX_SECONDS)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'limit and lease_seconds must be integers'}), 400
+        owner = str(data.get('owner') or device_id)[:100]
+        
+        jobs, expires_at = claim_dispensing_jobs(str(device_id), limit, lease_seconds, owner)
+        return jsonify({
+            'jobs': jobs,
+            'lease_owner': owner,
+            'lease_expires_at': expires_at.isoformat()
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/dispensing-jobs/<int:record_id>/complete', methods=['POST'])
+def complete_chemical_job(record_id):
+    """Mark a claimed job COMPLETED (or another final flag) if the caller still holds its lease"""
+    try:
+        data = request.get_json(silent=True) or {}
+        owner = data.get('owner')
+        if not owner:
+            return jsonify({'error': 'owner required (the lease_owner returned by claim)'}), 400
+        flag = data.get('flag', 'COMPLETED')
+        if flag in ('PENDING', 'IN_PROGRESS'):
+            return jsonify({'error': f'Invalid final flag: {flag}'}), 400
+        
+        job = db.session.scalars(
+            db.update(ChemicalDispenser).where(
+                ChemicalDispenser.id == record_id,
+                ChemicalDispenser.flag == 'IN_PROGRESS',
+                ChemicalDispenser.lease_owner == str(owner)[:100]
+            )
+            .values(flag=flag, lease_owner=None, lease_expires_at=None)
+            .returning(ChemicalDispenser),
+            execution_options={'synchronize_session': False, 'populate_existing': True}
+        ).first()
+        result = job.to_dict() if job else None
+        db.session.commit()
+        
+        if result is None:
+            if not db.session.get(ChemicalDispenser, record_id):
+                return jsonify({'error': 'Record not found'}), 404
+            return jsonify({'error': 'Job is not leased by this owner (lease expired or already completed)'}), 409
+        
+        return jsonify(result), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/dispensing-jobs/<int:record_id>', methods=['PUT'])
 def update_chemical_data(record_id):
     """Update chemical dispensing job data"""
@@ -1003,6 +4550,10 @@ def update_chemical_data(record_id):
             chemical_data.al = float(data['al'])
         if 'flag' in data:
             chemical_data.flag = data['flag']
+            if data['flag'] != 'IN_PROGRESS':
+                # Settled outside /claim: drop any lease so the sweeper leaves it alone
+                chemical_data.lease_owner = None
+                chemical_data.lease_expires_at = None
         if 'timestamp' in data:
             chemical_data.timestamp = datetime.strptime(data['timestamp'], '%Y-%m-%d %H:%M:%S')
         
@@ -1088,17 +4639,297 @@ def get_all_chemical_jobs():
         return jsonify({'error': str(e)}), 500
 
 
+# ==================== DISPENSER STATE ====================
+#
+# Each physical dispenser has one row in dispenser_states holding its four
+# dispenserN values and a version that every write increments. Polls are
+# answered from a per-process snapshot. Writers bump a generation counter in
+# a small memory-mapped file shared by every worker on the host, so a poll
+# only compares one integer in memory to know its snapshot is current.
+
+DEFAULT_DISPENSER_ID = os.getenv('DEFAULT_DISPENSER_ID', 'default')
+# Upper bound on snapshot age, for workers on other hosts sharing one database
+DISPENSER_STATE_TTL = int(os.getenv('DISPENSER_STATE_TTL', 60))
+DISPENSER_FIELDS = ('dispenser1', 'dispenser2', 'dispenser3', 'dispenser4')
+
+DispenserSnapshot = namedtuple('DispenserSnapshot', ('dispenser_id', 'values', 'version', 'updated_at'))
+
+
+class DispenserStateStore:
+    """Versioned dispenser state in the database behind a per-process snapshot"""
+
+    def __init__(self, generation, ttl):
+        self.generation = generation
+        self.ttl = ttl
+        self._lock = Lock()
+        self._snapshots = {}
+        self._seen_generation = None
+        self._loaded_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @staticmethod
+    def _snapshot(row):
+        return DispenserSnapshot(
+            row.dispenser_id, {field: getattr(row, field) for field in DISPENSER_FIELDS},
+            row.version, row.updated_at
+        )
+
+    def cached(self, dispenser_id, generation=None):
+        """Current snapshot if this process holds one, else None; never touches the database"""
+        if generation is None:
+            generation = self.generation.value()
+        with self._lock:
+            if generation != self._seen_generation or time.monotonic() - self._loaded_at > self.ttl:
+                # Some worker wrote since we loaded: drop every snapshot
+                self._snapshots = {}
+                self._seen_generation = generation
+                self._loaded_at = time.monotonic()
+            snapshot = self._snapshots.get(dispenser_id)
+            if snapshot is not None:
+                self.hits += 1
+            return snapshot
+
+    def get(self, dispenser_id):
+        """Current state of a dispenser; version 0 with all zeros if it was never set"""
+        generation = self.generation.value()
+        snapshot = self.cached(dispenser_id, generation)
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            self.misses += 1
+
+        table = DispenserState.__table__
+        row = db.session.execute(db.select(*table.c).where(table.c.dispenser_id == dispenser_id)).first()
+        if row is None:
+            snapshot = DispenserSnapshot(dispenser_id, {field: '0' for field in DISPENSER_FIELDS}, 0, None)
+        else:
+            snapshot = self._snapshot(row)
+        with self._lock:
+            # Keep it only if no write happened while we were reading
+            if self._seen_generation == generation:
+                self._snapshots[dispenser_id] = snapshot
+        return snapshot
+
+    def set(self, dispenser_id, values):
+        """Atomically update some dispenserN values and bump the version; returns the new snapshot"""
+        table = DispenserState.__table__
+        now = datetime.utcnow()
+        update = db.update(table).where(table.c.dispenser_id == dispenser_id).values(
+            version=table.c.version + 1, updated_at=now, **values
+        ).returning(*table.c)
+
+        row = db.session.execute(update).first()
+        if row is None:
+            initial = {field: '0' for field in DISPENSER_FIELDS}
+            initial.update(values)
+            try:
+                row = db.session.execute(db.insert(table).values(
+                    dispenser_id=dispenser_id, version=1, updated_at=now, **initial
+                ).returning(*table.c)).first()
+            except IntegrityError:
+                # Another worker created it first; apply ours on top
+                db.session.rollback()
+                row = db.session.execute(update).first()
+        db.session.commit()
+
+        snapshot = self._snapshot(row)
+        generation = self.generation.increment()
+        with self._lock:
+            self.writes += 1
+            if generation == (self._seen_generation or 0) + 1:
+                # Only our write happened since the last load: keep the other snapshots
+                self._seen_generation = generation
+            else:
+                self._snapshots = {}
+                self._seen_generation = generation
+                self._loaded_at = time.monotonic()
+            self._snapshots[dispenser_id] = snapshot
+        return snapshot
+
+    def stats(self):
+        with self._lock:
+            return {
+                'snapshots': len(self._snapshots),
+                'generation': self._seen_generation,
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes
+            }
+
+
+dispenser_states = DispenserStateStore(
+    SharedGeneration(os.getenv(
+        'DISPENSER_GENERATION_FILE', os.path.join(app.instance_path, 'dispenser_state.gen')
+    )),
+    DISPENSER_STATE_TTL
+)
+
+
+def _dispenser_id_arg(data=None):
+    """Dispenser id from the query string or JSON body, defaulting to DEFAULT_DISPENSER_ID"""
+    dispenser_id = request.args.get('dispenser_id') or (data or {}).get('dispenser_id') or DEFAULT_DISPENSER_ID
+    return str(dispenser_id)[:50]
+
+
+def _dispenser_response(body, snapshot, status=200):
+    response = jsonify(body)
+    response.headers['X-Dispenser-Id'] = snapshot.dispenser_id
+    response.headers['X-Dispenser-Version'] = str(snapshot.version)
+    return response, status
+
+
+# ==================== DISPENSER CHANGE NOTIFICATION ====================
+#
+# Long-poll and SSE requests wait on one Condition per process instead of
+# polling. Writes in this process notify it directly; writes in other
+# workers are seen by a single watcher thread that reads the shared
+# generation counter every DISPENSER_WATCH_INTERVAL_MS.
+#
+# A waiting request holds its worker for the whole wait. Under gevent that
+# is a greenlet; under threads it is one of a handful of OS threads, and a
+# few idle dispensers would starve every other request. So waits are only
+# served when sockets are cooperative (ASYNC_MODE=gevent or a gevent
+# worker): otherwise ?wait= answers at once and streams are refused.
+
+DISPENSER_LONGPOLL_MAX = int(os.getenv('DISPENSER_LONGPOLL_MAX', 60))  # seconds
+DISPENSER_SSE_HEARTBEAT = int(os.getenv('DISPENSER_SSE_HEARTBEAT', 15))  # seconds
+DISPENSER_WATCH_INTERVAL_MS = int(os.getenv('DISPENSER_WATCH_INTERVAL_MS', 100))
+
+
+def _sockets_cooperative():
+    """True when gevent has patched sockets in this process"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+# Checked once at import: gunicorn's gevent worker patches before loading the app
+LONG_WAITS_ENABLED = _sockets_cooperative()
+LONG_WAITS_DISABLED_MESSAGE = 'Streaming requires ASYNC_MODE=gevent; poll without ?wait= instead'
+
+
+class DispenserChangeNotifier:
+    """Wake every waiter of this process when the dispenser generation changes"""
+
+    def __init__(self, generation, interval_ms):
+        self.generation = generation
+        self.interval = interval_ms / 1000.0
+        self._condition = Condition()
+        self._lock = Lock()
+        self._thread = None
+        self._stop = Event()
+        self.waiting = 0
+        self.notifications = 0
+
+    def _ensure_started(self):
+        """Start the watcher thread on first use (once per process)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name='dispenser-watcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        last = self.generation.value()
+        while not self._stop.wait(self.interval):
+            current = self.generation.value()
+            if current != last:
+                last = current
+                self.notify()
+
+    def stop(self):
+        self._stop.set()
+        self.notify()
+
+    def notify(self):
+        with self._condition:
+            self.notifications += 1
+            self._condition.notify_all()
+
+    def wait(self, generation, timeout):
+        """Block until the generation moves past ``generation`` or timeout; returns True if it moved"""
+        self._ensure_started()
+        with self._condition:
+            # Checked under the lock: a write between our read and here cannot be missed
+            if self.generation.value() == generation:
+                self.waiting += 1
+                try:
+                    self._condition.wait(timeout)
+                finally:
+                    self.waiting -= 1
+        return self.generation.value() != generation
+
+    def stats(self):
+        return {
+            'waiting': self.waiting,
+            'notifications': self.notifications,
+            'watcher_running': self._thread is not None and self._thread.is_alive()
+        }
+
+
+dispenser_notifier = DispenserChangeNotifier(dispenser_states.generation, DISPENSER_WATCH_INTERVAL_MS)
+atexit.register(dispenser_notifier.stop)
+
+
+def set_dispenser_state(dispenser_id, values):
+    """Write dispenser values and wake this process's waiters"""
+    snapshot = dispenser_states.set(dispenser_id, values)
+    dispenser_notifier.notify()
+    return snapshot
+
+
+def wait_for_dispenser(dispenser_id, satisfied, timeout):
+    """Return the dispenser's snapshot once satisfied(snapshot) or when timeout expires"""
+    deadline = time.monotonic() + timeout
+    while True:
+        generation = dispenser_states.generation.value()
+        snapshot = dispenser_states.get(dispenser_id)
+        remaining = deadline - time.monotonic()
+        if satisfied(snapshot) or remaining <= 0:
+            return snapshot
+        # Never hold a pooled connection while idle
+        db.session.close()
+        dispenser_notifier.wait(generation, remaining)
+
+
+def has_pending_dispense(snapshot):
+    """True when any dispenserN value asks for dosing"""
+    return any(value not in ('0', '', None) for value in snapshot.values.values())
+
+
 # ==================== DISPENSER API ENDPOINTS ====================
 
 @app.route('/api/dispenser/get', methods=['GET'])
 def get_dispenser_values():
-    """Get current dispenser values from JSON file"""
+    """Get current dispenser values, optionally long-polling for a change"""
     try:
-        config = read_dispenser_config()
-        print(f"Dispenser GET request: {config}")
-        return jsonify(config), 200
+        dispenser_id = _dispenser_id_arg()
+        wait = min(request.args.get('wait', 0, type=float), DISPENSER_LONGPOLL_MAX)
+        if wait <= 0 or not LONG_WAITS_ENABLED:
+            # Hot poll path: no logging, no disk I/O while the snapshot is current
+            snapshot = dispenser_states.get(dispenser_id)
+            response, status = _dispenser_response(snapshot.values, snapshot)
+            if wait > 0:
+                # Threaded server: answer now rather than park a worker thread
+                response.headers['X-Long-Poll'] = 'disabled'
+            return response, status
+        
+        # ?version=N waits for any newer version; without it, for pending work
+        known_version = request.args.get('version', type=int)
+        if known_version is None:
+            satisfied = has_pending_dispense
+        else:
+            def satisfied(snapshot):
+                return snapshot.version != known_version
+        snapshot = wait_for_dispenser(dispenser_id, satisfied, wait)
+        return _dispenser_response(snapshot.values, snapshot)
     except Exception as e:
-        print(f"Error reading dispenser config: {str(e)}")
+        print(f"Error reading dispenser state: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -1106,20 +4937,16 @@ def get_dispenser_values():
 def reset_dispenser_values():
     """Reset all dispenser values to zero"""
     try:
-        config = {
-            "dispenser1": "0",
-            "dispenser2": "0",
-            "dispenser3": "0",
-            "dispenser4": "0"
-        }
-        write_dispenser_config(config)
-        print(f"Dispenser RESET: All values set to 0")
-        return jsonify({
+        dispenser_id = _dispenser_id_arg(request.get_json(silent=True))
+        snapshot = set_dispenser_state(dispenser_id, {field: '0' for field in DISPENSER_FIELDS})
+        print(f"Dispenser RESET {dispenser_id}: All values set to 0 (version {snapshot.version})")
+        return _dispenser_response({
             'message': 'Dispenser values reset successfully',
-            'config': config
-        }), 200
+            'config': snapshot.values
+        }, snapshot)
     except Exception as e:
-        print(f"Error resetting dispenser config: {str(e)}")
+        db.session.rollback()
+        print(f"Error resetting dispenser state: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -1131,29 +4958,71 @@ def set_dispenser_values():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Read current config
-        config = read_dispenser_config()
-        
-        # Update provided values
-        if 'dispenser1' in data:
-            config['dispenser1'] = str(data['dispenser1'])
-        if 'dispenser2' in data:
-            config['dispenser2'] = str(data['dispenser2'])
-        if 'dispenser3' in data:
-            config['dispenser3'] = str(data['dispenser3'])
-        if 'dispenser4' in data:
-            config['dispenser4'] = str(data['dispenser4'])
+        # Update provided values only
+        values = {field: str(data[field]) for field in DISPENSER_FIELDS if field in data}
+        if not values:
+            return jsonify({'error': f'Provide at least one of: {", ".join(DISPENSER_FIELDS)}'}), 400
         
-        # Write updated config
-        write_dispenser_config(config)
-        print(f"Dispenser SET: {config}")
+        dispenser_id = _dispenser_id_arg(data)
+        snapshot = set_dispenser_state(dispenser_id, values)
+        print(f"Dispenser SET {dispenser_id}: {snapshot.values} (version {snapshot.version})")
         
-        return jsonify({
+        return _dispenser_response({
             'message': 'Dispenser values updated successfully',
-            'config': config
-        }), 200
+            'config': snapshot.values
+        }, snapshot)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error setting dispenser state: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/dispenser/stream', methods=['GET'])
+def stream_dispenser_values():
+    """Server-Sent Events stream of a dispenser's state, one event per version"""
+    if not LONG_WAITS_ENABLED:
+        return jsonify({'error': LONG_WAITS_DISABLED_MESSAGE}), 501
+    dispenser_id = _dispenser_id_arg()
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('version'))
+    try:
+        last_version = int(last_event_id) if last_event_id is not None else None
+    except ValueError:
+        last_version = None
+    
+    def events():
+        version = last_version
+        while True:
+            generation = dispenser_states.generation.value()
+            snapshot = dispenser_states.get(dispenser_id)
+            if snapshot.version != version:
+                version = snapshot.version
+                yield f"id: {version}\nevent: state\ndata: {json.dumps(snapshot.values)}\n\n"
+            db.session.close()
+            if not dispenser_notifier.wait(generation, DISPENSER_SSE_HEARTBEAT):
+                # Keeps tunnels and proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+    
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/dispensers', methods=['GET'])
+def get_dispensers():
+    """List the state of every dispenser"""
+    try:
+        states = DispenserState.query.order_by(DispenserState.dispenser_id).all()
+        return jsonify([
+            {
+                'dispenser_id': state.dispenser_id,
+                'version': state.version,
+                'updated_at': state.updated_at.isoformat() if state.updated_at else None,
+                'values': {field: getattr(state, field) for field in DISPENSER_FIELDS}
+            }
+            for state in states
+        ]), 200
     except Exception as e:
-        print(f"Error setting dispenser config: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -1172,33 +5041,218 @@ def index():
             'users': '/api/users (GET - Admin only)',
             # Device endpoints
             'device_data': '/pool/data (POST)',
+            'device_data_batch': '/pool/data/batch (POST)',
+            'ingest_stats': '/api/ingest/stats (GET)',
             'device_config': '/pool/config (GET)',
             'devices': '/api/devices (GET)',
-            'device_readings': '/api/devices/<device_id>/readings (GET)',
+            'device_readings': '/api/devices/<device_id>/readings (GET) - keyset paging via ?cursor=<X-Next-Cursor>',
+            'device_readings_export': '/api/devices/<device_id>/readings/export?format=ndjson|csv (GET)',
+            'device_stream': '/api/devices/<device_id>/stream (GET, Server-Sent Events)',
+            'fleet_stream': '/api/readings/stream (GET, Server-Sent Events)',
+            'device_history': '/api/devices/<device_id>/history (GET)',
+            'device_stats': '/api/stats/<device_id> (GET)',
+            'multi_device_stats': '/api/stats?device_id=<id>,<id>&hours=24,168 (GET)',
             'create_config': '/api/devices/<device_id>/config (POST)',
             # Chemical dispensing jobs
             'dispensing_jobs_create': '/api/dispensing-jobs (POST)',
             'dispensing_jobs_pending': '/api/dispensing-jobs (GET) - supports ?device_id=<id>',
             'dispensing_jobs_by_device': '/api/dispensing-jobs/<device_id> (GET) - device specific',
             'dispensing_jobs_all_tracking': '/api/dispensing-jobs/all (GET)',
-            'dispensing_jobs_update': '/api/dispensing-jobs/<id> (PUT)'
+            'dispensing_jobs_update': '/api/dispensing-jobs/<id> (PUT)',
+            'dispensing_jobs_claim': '/api/dispensing-jobs/claim (POST) - atomically lease the next PENDING jobs',
+            'dispensing_jobs_complete': '/api/dispensing-jobs/<id>/complete (POST)',
+            # Dispenser state (optional ?dispenser_id=<id>)
+            'dispenser_get': '/api/dispenser/get (GET) - long-poll with ?wait=<seconds>[&version=<n>]',
+            'dispenser_stream': '/api/dispenser/stream (GET, Server-Sent Events)',
+            'dispenser_set': '/api/dispenser/set (POST)',
+            'dispenser_reset': '/api/dispenser/reset (POST)',
+            'dispensers': '/api/dispensers (GET)'
         }
     }), 200
 
 
 # ==================== DATABASE INITIALIZATION ====================
+#
+# Schema changes are versioned migrations, applied once per process by
+# startup() (python main.py) or explicitly with `flask --app main upgrade-db`,
+# and recorded in pool_schema_migrations. Requests never touch schema
+# metadata. A fresh database gets today's models from migration 1, so later
+# migrations must be idempotent (check before adding a column or table).
+# Append new migrations; never edit or renumber applied ones.
 
-@app.before_request
-def create_tables():
-    """Create database tables before first request"""
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a schema migration function under a version number"""
+    def register(migrate):
+        MIGRATIONS.append((version, description, migrate))
+        return migrate
+    return register
+
+
+@migration(1, 'Create tables')
+def _create_tables():
     db.create_all()
 
 
-if __name__ == '__main__':
+def create_missing_indexes():
+    """Create model indexes the database lacks, skipping those on columns a later migration adds"""
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if index.name not in existing and all(column.name in columns for column in index.columns):
+                index.create(db.engine)
+                print(f"Created index {index.name}")
+
+
+@migration(2, 'Add composite indexes for hot query shapes')
+def _create_composite_indexes():
+    # db.create_all() only creates whole tables, so indexes added to models
+    # later never reach a deployed pool_monitor.db
+    create_missing_indexes()
+
+
+@migration(3, 'Backfill sensor rollups and quantile sketches')
+def _backfill_rollups():
+    # Only databases that predate the rollup tables have readings but no rollups
+    if db.session.query(SensorRollup.id).first() or not db.session.query(SensorReading.id).first():
+        return
+    processed = rebuild_rollups(until=datetime.utcnow() + timedelta(days=1))
+    print(f"Backfilled rollups from {processed} readings")
+
+
+@migration(4, 'Move dispenser state from dispenser_config.json into dispenser_states')
+def _import_dispenser_config():
+    DispenserState.__table__.create(db.engine, checkfirst=True)
+    if db.session.get(DispenserState, DEFAULT_DISPENSER_ID) or not os.path.exists(DISPENSER_CONFIG_FILE):
+        return
+    try:
+        with open(DISPENSER_CONFIG_FILE, 'r') as f:
+            config = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Skipping {DISPENSER_CONFIG_FILE}: {e}")
+        return
+    db.session.add(DispenserState(
+        dispenser_id=DEFAULT_DISPENSER_ID,
+        version=1,
+        **{field: str(config.get(field, '0')) for field in DISPENSER_FIELDS}
+    ))
+    db.session.commit()
+    print(f"Imported {DISPENSER_CONFIG_FILE} as dispenser {DEFAULT_DISPENSER_ID}")
+
+
+@migration(5, 'Add lease columns to chemical_dispenser_jobs')
+def _add_dispensing_leases():
+    table = ChemicalDispenser.__table__
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns(table.name)}
+    with db.engine.begin() as connection:
+        for column in (table.c.lease_owner, table.c.lease_expires_at):
+            if column.name not in columns:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                connection.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"Added column {table.name}.{column.name}")
+    create_missing_indexes()
+
+
+@contextmanager
+def _migration_lock():
+    """Serialize migrations between processes starting at the same time"""
+    os.makedirs(app.instance_path, exist_ok=True)
+    with open(os.path.join(app.instance_path, '.migrate.lock'), 'wb') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def applied_migrations():
+    """Versions recorded in pool_schema_migrations"""
+    if not db.inspect(db.engine).has_table(SchemaMigration.__tablename__):
+        return set()
+    return {version for (version,) in db.session.query(SchemaMigration.version)}
+
+
+def upgrade_database():
+    """Apply pending migrations in version order; returns the applied (version, description) pairs"""
+    with _migration_lock():
+        SchemaMigration.__table__.create(db.engine, checkfirst=True)
+        done = applied_migrations()
+        applied = []
+        for version, description, migrate in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version in done:
+                continue
+            started = time.perf_counter()
+            migrate()
+            db.session.add(SchemaMigration(
+                version=version,
+                description=description,
+                duration_ms=(time.perf_counter() - started) * 1000
+            ))
+            db.session.commit()
+            print(f"Applied migration {version}: {description}")
+            applied.append((version, description))
+        return applied
+
+
+def startup():
+    """Prepare this process to serve: migrate the schema, warm caches, start background workers"""
+    started = time.perf_counter()
     with app.app_context():
-        db.create_all()
-        print("Database tables created successfully!")
+        applied = upgrade_database()
+        alert_index.warm()
+    retention_worker.start()
+    sqlite_checkpointer.start()
+    lease_sweeper.start()
+    state = f"applied {len(applied)} migration(s)" if applied else "schema up to date"
+    print(f"Startup: {state} in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return applied
+
 
+@app.cli.command('upgrade-db')
+@click.option('--status', is_flag=True, help='List applied and pending migrations without applying them')
+def upgrade_db_command(status):
+    """Apply pending schema migrations (flask --app main upgrade-db)"""
+    if status:
+        done = applied_migrations()
+        for version, description, _ in sorted(MIGRATIONS, key=lambda m: m[0]):
+            print(f"{version:>4}  {'applied' if version in done else 'pending':<8} {description}")
+        return
+    if not upgrade_database():
+        print("Database schema is up to date")
+
+
+@app.cli.command('rebuild-rollups')
+@click.option('--device-id', help='Only rebuild this device')
+@click.option('--days', type=int, help='Only rebuild the last N whole days')
+def rebuild_rollups_command(device_id, days):
+    """Recompute rollup tables from raw readings (flask --app main rebuild-rollups)"""
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    started = time.perf_counter()
+    processed = rebuild_rollups(device_id=device_id, since=since)
+    print(f"Rebuilt rollups from {processed} readings in {time.perf_counter() - started:.1f}s")
+
+
+@app.cli.command('archive-readings')
+@click.option('--days', type=int, default=RETENTION_DAYS, show_default=True,
+              help='Archive readings older than N days')
+@click.option('--device-id', help='Only archive this device')
+def archive_readings_command(days, device_id):
+    """Move old raw readings into the columnar archive (flask --app main archive-readings)"""
+    if days <= 0:
+        print("Retention is disabled (RETENTION_DAYS=0), pass --days to archive anyway")
+        return
+    started = time.perf_counter()
+    archived, segments = archive_readings(datetime.utcnow() - timedelta(days=days), device_id=device_id)
+    print(f"Archived {archived} readings into {segments} segments in {time.perf_counter() - started:.1f}s")
+    pruned = prune_rollups()
+    print(f"Pruned {pruned} rollup and sketch rows past ROLLUP_RETENTION_DAYS")
+
+
+if __name__ == '__main__':
+    startup()
+    with app.app_context():
         # === MOCK DATA INSERTION ===
         # Check if mock user exists
         if not User.query.filter_by(email='mockuser@example.com').first():
@@ -1246,6 +5300,11 @@ if __name__ == '__main__':
     
     print(f"\n=== Pool Monitor API Server ===")
     print(f"Running on port {port}")
-    print(f"Debug mode: {debug}\n")
+    print(f"Debug mode: {debug}")
+    print(f"Async mode: {os.getenv('ASYNC_MODE') or 'threads'}\n")
     
-    app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
+    if os.getenv('ASYNC_MODE', '').lower() == 'gevent':
+        from gevent.pywsgi import WSGIServer
+        WSGIServer(('0.0.0.0', port), app).serve_forever()
+    else:
+        app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
\ No newline at end of file
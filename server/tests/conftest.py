@@ -0,0 +1,61 @@
+"""
+Shared fixtures: every test session runs main.py against a fresh SQLite
+database in a temporary directory, with background workers disabled
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+_directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_directory, 'test.db')}"
+os.environ['ARCHIVE_DIR'] = os.path.join(_directory, 'archive')
+for _name in ('DEVICE', 'PRINCIPAL', 'DISPENSER', 'ALERT'):
+    os.environ[f'{_name}_GENERATION_FILE'] = os.path.join(_directory, f'{_name.lower()}.gen')
+os.environ['READING_STREAM_LOG_FILE'] = os.path.join(_directory, 'reading_stream.log')
+os.environ['RETENTION_INTERVAL'] = '0'
+os.environ['SQLITE_CHECKPOINT_INTERVAL'] = '0'
+os.environ['DISPENSING_SWEEP_INTERVAL'] = '0'
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main  # noqa: E402
+
+
+@pytest.fixture(scope='session', autouse=True)
+def database():
+    main.startup()
+    yield
+
+
+@pytest.fixture
+def app_context():
+    with main.app.app_context():
+        yield
+        main.db.session.remove()
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+@pytest.fixture
+def make_reading():
+    def make_reading(device_id, **values):
+        reading = {
+            'device_id': device_id,
+            'timestamp': datetime.utcnow(),
+            'ph': 7.2,
+            'turbidity': 3.5,
+            'temperature': 26.8,
+            'water_quality': 'optimal',
+            'wifi_rssi': -65,
+            'uptime': 3600
+        }
+        reading.update(values)
+        return reading
+    return make_reading
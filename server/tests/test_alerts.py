@@ -0,0 +1,47 @@
+"""
+Alert de-duplication across worker processes
+"""
+
+import os
+import subprocess
+import sys
+
+import main
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+LOW_PH_IN_OTHER_PROCESS = """
+from datetime import datetime
+import main
+with main.app.app_context():
+    main.ingest_readings([{
+        'device_id': 'TEST_ALERT_SHARED', 'timestamp': datetime.utcnow(),
+        'ph': 5.0, 'turbidity': 3.5, 'temperature': 26.8,
+        'water_quality': 'critical', 'wifi_rssi': -65, 'uptime': 1
+    }])
+"""
+
+
+def alert_count(device_id):
+    return main.Alert.query.filter_by(device_id=device_id, alert_type='ph_critical').count()
+
+
+def test_alert_raised_by_another_process_is_not_repeated(app_context, make_reading):
+    main.alert_index.warm()
+
+    subprocess.run([sys.executable, '-c', LOW_PH_IN_OTHER_PROCESS],
+                   cwd=SERVER_DIR, env=os.environ, check=True, capture_output=True)
+    assert alert_count('TEST_ALERT_SHARED') == 1
+
+    main.ingest_readings([make_reading('TEST_ALERT_SHARED', ph=5.0)])
+    assert alert_count('TEST_ALERT_SHARED') == 1
+
+
+def test_acknowledged_alert_can_be_raised_again(client, app_context, make_reading):
+    main.ingest_readings([make_reading('TEST_ALERT_ACK', ph=5.0)])
+    alert = main.Alert.query.filter_by(device_id='TEST_ALERT_ACK').one()
+
+    assert client.post(f'/api/alerts/{alert.id}/acknowledge').status_code == 200
+    main.ingest_readings([make_reading('TEST_ALERT_ACK', ph=5.0)])
+
+    assert alert_count('TEST_ALERT_ACK') == 2
@@ -0,0 +1,64 @@
+"""
+Batch ingestion: per-item results and one transaction per batch
+"""
+
+import uuid
+
+import main
+
+
+def reading(device_id, ph=7.2):
+    return {
+        'device_id': device_id,
+        'sensors': {'ph': ph, 'turbidity': 3.5, 'temperature': 26.8},
+        'status': {'water_quality': 'optimal', 'wifi_rssi': -65, 'uptime': 3600}
+    }
+
+
+def new_device():
+    return f'TEST_BATCH_{uuid.uuid4().hex[:8]}'
+
+
+def test_valid_items_are_stored_and_invalid_ones_reported(client, app_context):
+    first, second = new_device(), new_device()
+
+    response = client.post('/pool/data/batch', json={'readings': [
+        reading(first), {'sensors': {'ph': 7.0}}, reading(second), reading(first, ph='acid')
+    ]})
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body['status'], body['accepted'], body['rejected']) == ('partial', 2, 2)
+    assert [result['status'] for result in body['results']] == ['accepted', 'rejected', 'accepted', 'rejected']
+    assert body['results'][0]['reading_id'] and body['results'][2]['reading_id']
+    assert 'reading_id' not in body['results'][1]
+    assert main.SensorReading.query.filter_by(device_id=first).count() == 1
+    assert main.Device.query.filter_by(device_id=second).count() == 1
+
+
+def test_bare_array_is_accepted(client):
+    response = client.post('/pool/data/batch', json=[reading(new_device()), reading(new_device())])
+
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'success'
+
+
+def test_batch_without_valid_items_is_rejected(client):
+    assert client.post('/pool/data/batch', json=[{'sensors': {}}]).status_code == 400
+    assert client.post('/pool/data/batch', json=[]).status_code == 400
+    assert client.post('/pool/data/batch', json={'readings': 'nope'}).status_code == 400
+
+
+def test_oversized_batch_is_refused(client):
+    response = client.post('/pool/data/batch', json=[{}] * (main.INGEST_MAX_BATCH_SIZE + 1))
+
+    assert response.status_code == 413
+
+
+def test_repeated_alert_in_one_batch_is_raised_once(client, app_context):
+    device_id = new_device()
+
+    client.post('/pool/data/batch', json=[reading(device_id, ph=9.5) for _ in range(3)])
+
+    alerts = main.Alert.query.filter_by(device_id=device_id).all()
+    assert [alert.alert_type for alert in alerts] == ['ph_critical']
@@ -0,0 +1,83 @@
+"""
+Compact binary payload: decoding and the ingest endpoints
+"""
+
+import struct
+import uuid
+from datetime import datetime
+
+import pytest
+
+import main
+
+CONTENT_TYPE = 'application/x-pool-reading'
+
+
+def parsed(device_id, **values):
+    reading = {
+        'device_id': device_id, 'ph': 7.25, 'turbidity': 3.5, 'temperature': 26.8,
+        'water_quality': 'acceptable', 'wifi_rssi': -65, 'uptime': 3600,
+        'timestamp': datetime(2024, 5, 1, 12, 30)
+    }
+    reading.update(values)
+    return reading
+
+
+def test_record_round_trips():
+    reading = parsed('ESP32_POOL_001')
+
+    assert main.decode_binary_readings(main.encode_binary_reading(reading)) == [reading]
+
+
+def test_missing_values_round_trip_as_none():
+    reading = parsed('ESP32_POOL_001', ph=None, water_quality=None, wifi_rssi=None, uptime=None)
+
+    (decoded,) = main.decode_binary_readings(main.encode_binary_reading(reading))
+
+    assert (decoded['ph'], decoded['water_quality'], decoded['wifi_rssi'], decoded['uptime']) == (None, None, None, None)
+    assert decoded['temperature'] == 26.8
+
+
+def test_zero_timestamp_means_server_time():
+    body = main.encode_binary_reading(parsed('ESP32_POOL_001', timestamp=None))
+
+    (decoded,) = main.decode_binary_readings(body)
+
+    assert abs((datetime.utcnow() - decoded['timestamp']).total_seconds()) < 5
+
+
+@pytest.mark.parametrize('body', [
+    b'\x01',                                     # header cut short
+    b'\x02\x01A' + b'\x00' * 20,                  # unknown version
+    main.encode_binary_reading(parsed('ESP32_POOL_001'))[:-1],   # body cut short
+    struct.pack('<BB', 1, 0) + b'\x00' * 20,      # empty device_id
+])
+def test_malformed_records_are_rejected(body):
+    with pytest.raises(ValueError):
+        main.decode_binary_readings(body)
+
+
+def test_binary_post_is_stored(client, app_context):
+    device_id = f'TEST_BINARY_{uuid.uuid4().hex[:8]}'
+
+    response = client.post('/pool/data', data=main.encode_binary_reading(parsed(device_id)), content_type=CONTENT_TYPE)
+
+    assert response.status_code == 200
+    stored = main.db.session.get(main.SensorReading, response.get_json()['reading_id'])
+    assert (stored.device_id, stored.ph, stored.water_quality) == (device_id, 7.25, 'acceptable')
+
+
+def test_binary_batch_stores_every_record(client, app_context):
+    device_id = f'TEST_BINARY_{uuid.uuid4().hex[:8]}'
+    body = b''.join(main.encode_binary_reading(parsed(device_id, uptime=uptime)) for uptime in range(3))
+
+    response = client.post('/pool/data/batch', data=body, content_type=CONTENT_TYPE)
+
+    assert response.get_json()['accepted'] == 3
+    assert main.SensorReading.query.filter_by(device_id=device_id).count() == 3
+
+
+def test_binary_post_with_two_records_is_rejected(client):
+    body = main.encode_binary_reading(parsed('ESP32_POOL_001')) * 2
+
+    assert client.post('/pool/data', data=body, content_type=CONTENT_TYPE).status_code == 400
@@ -0,0 +1,69 @@
+"""
+Columnar reading pages: parallel arrays, larger limits and cursors
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def base():
+    return datetime.utcnow().replace(microsecond=0) - timedelta(hours=1)
+
+
+def ingest_series(make_reading, device_id, base, count):
+    main.ingest_readings([
+        make_reading(device_id, timestamp=base + timedelta(seconds=i), ph=7.0 + i / 100, temperature=None)
+        for i in range(count)
+    ])
+
+
+def test_columnar_page_is_oldest_first(app_context, client, make_reading, base):
+    device_id = f'TEST_COLUMNAR_{uuid.uuid4().hex[:8]}'
+    ingest_series(make_reading, device_id, base, 3)
+
+    response = client.get(f'/api/devices/{device_id}/readings?format=columnar')
+
+    assert response.status_code == 200
+    epoch = int((base - datetime(1970, 1, 1)).total_seconds())
+    assert response.get_json() == {
+        'device_id': device_id,
+        'count': 3,
+        'timestamps': [epoch, epoch + 1, epoch + 2],
+        'ph': [7.0, 7.01, 7.02],
+        'turbidity': [3.5, 3.5, 3.5],
+        'temperature': [None, None, None]
+    }
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_columnar_allows_larger_pages(app_context, client, make_reading, base):
+    device_id = f'TEST_COLUMNAR_{uuid.uuid4().hex[:8]}'
+    ingest_series(make_reading, device_id, base, 150)
+
+    rows = client.get(f'/api/devices/{device_id}/readings?limit=150').get_json()
+    columns = client.get(f'/api/devices/{device_id}/readings?format=columnar&limit=150').get_json()
+
+    assert len(rows) == 100
+    assert columns['count'] == 150
+
+
+def test_columnar_cursor_pages_cover_every_reading(app_context, client, make_reading, base):
+    device_id = f'TEST_COLUMNAR_{uuid.uuid4().hex[:8]}'
+    ingest_series(make_reading, device_id, base, 5)
+
+    response = client.get(f'/api/devices/{device_id}/readings?format=columnar&limit=2')
+    pages = [response.get_json()['timestamps']]
+    while 'X-Next-Cursor' in response.headers:
+        response = client.get(f'/api/devices/{device_id}/readings?format=columnar&limit=2'
+                              f"&cursor={response.headers['X-Next-Cursor']}")
+        pages.append(response.get_json()['timestamps'])
+
+    # Pages walk backwards in time, each page oldest first
+    timestamps = [timestamp for page in reversed(pages) for timestamp in page]
+    assert len(timestamps) == 5
+    assert timestamps == sorted(set(timestamps))
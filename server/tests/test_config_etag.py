@@ -0,0 +1,62 @@
+"""
+Device config ETags: 304 for current clients, answered from the device cache
+"""
+
+import uuid
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def device_id(client):
+    device_id = f'TEST_ETAG_{uuid.uuid4().hex[:8]}'
+    client.get(f'/pool/config?device_id={device_id}')
+    return device_id
+
+
+@pytest.mark.parametrize('path', ['/pool/config?device_id={}', '/api/devices/{}/config'])
+def test_matching_etag_answers_304(client, device_id, path):
+    first = client.get(path.format(device_id))
+    second = client.get(path.format(device_id), headers={'If-None-Match': first.headers['ETag']})
+
+    assert first.status_code == 200
+    assert 'thresholds' in first.get_json()
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == first.headers['ETag']
+
+
+def test_config_change_moves_the_etag(client, device_id):
+    etag = client.get(f'/pool/config?device_id={device_id}').headers['ETag']
+
+    client.put(f'/api/devices/{device_id}/config', json={'intervals': {'post_interval': 5000}})
+    response = client.get(f'/pool/config?device_id={device_id}', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['intervals']['post_interval'] == 5000
+
+
+def test_not_modified_is_answered_from_the_cache(app_context, client, device_id):
+    etag = client.get(f'/pool/config?device_id={device_id}').headers['ETag']
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = main.db.engine
+    main.db.event.listen(engine, 'before_cursor_execute', record)
+    try:
+        for _ in range(10):
+            assert client.get(f'/pool/config?device_id={device_id}',
+                              headers={'If-None-Match': etag}).status_code == 304
+    finally:
+        main.db.event.remove(engine, 'before_cursor_execute', record)
+
+    assert statements == []
+
+
+def test_unknown_device_config_is_404(client):
+    assert client.get(f'/api/devices/TEST_ETAG_{uuid.uuid4().hex[:8]}/config').status_code == 404
@@ -0,0 +1,76 @@
+"""
+Config piggybacking: /pool/data answers with the config version and stale configs
+"""
+
+import uuid
+
+import pytest
+
+
+def reading(device_id, **extra):
+    return {
+        'device_id': device_id,
+        'sensors': {'ph': 7.2, 'turbidity': 3.5, 'temperature': 26.8},
+        'status': {'water_quality': 'optimal', 'wifi_rssi': -65, 'uptime': 3600},
+        **extra
+    }
+
+
+@pytest.fixture
+def device(client):
+    """(device_id, current config version) for a device with a config"""
+    device_id = f'TEST_SYNC_{uuid.uuid4().hex[:8]}'
+    etag = client.get(f'/pool/config?device_id={device_id}').headers['ETag']
+    return device_id, etag.strip('"')
+
+
+def test_current_version_gets_no_config(client, device):
+    device_id, version = device
+
+    body = client.post('/pool/data', json=reading(device_id, config_version=int(version))).get_json()
+
+    assert body['config_version'] == int(version)
+    assert 'config' not in body
+
+
+def test_stale_version_gets_the_config(client, device):
+    device_id, version = device
+    client.put(f'/api/devices/{device_id}/config', json={'intervals': {'post_interval': 3000}})
+
+    body = client.post('/pool/data', json=reading(device_id, config_version=int(version))).get_json()
+
+    assert body['config_version'] != int(version)
+    assert body['config']['intervals']['post_interval'] == 3000
+
+
+def test_version_can_be_reported_in_a_header(client, device):
+    device_id, version = device
+
+    current = client.post('/pool/data', json=reading(device_id), headers={'X-Config-Version': version})
+    stale = client.post('/pool/data', json=reading(device_id), headers={'X-Config-Version': '1'})
+
+    assert 'config' not in current.get_json()
+    assert 'config' in stale.get_json()
+
+
+def test_unreported_version_gets_no_config(client, device):
+    device_id, version = device
+
+    body = client.post('/pool/data', json=reading(device_id)).get_json()
+
+    assert body['config_version'] == int(version)
+    assert 'config' not in body
+
+
+def test_batch_returns_configs_for_stale_devices_only(client, device):
+    device_id, version = device
+    other_id = f'TEST_SYNC_{uuid.uuid4().hex[:8]}'
+    other_version = client.get(f'/pool/config?device_id={other_id}').headers['ETag'].strip('"')
+
+    body = client.post('/pool/data/batch', json={
+        'readings': [reading(device_id), reading(other_id)],
+        'config_versions': {device_id: version, other_id: '1'}
+    }).get_json()
+
+    assert body['config_versions'] == {device_id: int(version), other_id: int(other_version)}
+    assert list(body['configs']) == [other_id]
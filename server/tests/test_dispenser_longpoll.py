@@ -0,0 +1,73 @@
+"""
+Dispenser long-poll and SSE: waits wake on writes, and are refused without gevent
+"""
+
+import time
+import uuid
+from threading import Timer
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def dispenser_id():
+    return f'TEST_LONGPOLL_{uuid.uuid4().hex[:8]}'
+
+
+@pytest.fixture
+def long_waits(monkeypatch):
+    monkeypatch.setattr(main, 'LONG_WAITS_ENABLED', True)
+
+
+def test_wait_answers_at_once_without_gevent(client, dispenser_id):
+    started = time.monotonic()
+    response = client.get(f'/api/dispenser/get?dispenser_id={dispenser_id}&wait=5')
+
+    assert time.monotonic() - started < 1
+    assert response.status_code == 200
+    assert response.headers['X-Long-Poll'] == 'disabled'
+
+
+def test_stream_is_refused_without_gevent(client, dispenser_id):
+    response = client.get(f'/api/dispenser/stream?dispenser_id={dispenser_id}')
+
+    assert response.status_code == 501
+    assert 'ASYNC_MODE=gevent' in response.get_json()['error']
+
+
+def test_wait_times_out_with_the_current_state(client, dispenser_id, long_waits):
+    started = time.monotonic()
+    response = client.get(f'/api/dispenser/get?dispenser_id={dispenser_id}&wait=0.3&version=0')
+
+    assert time.monotonic() - started >= 0.3
+    assert response.headers['X-Dispenser-Version'] == '0'
+    assert 'X-Long-Poll' not in response.headers
+
+
+def test_write_wakes_a_waiting_poll(client, dispenser_id, long_waits):
+    def write():
+        main.app.test_client().post('/api/dispenser/set', json={'dispenser_id': dispenser_id, 'dispenser1': 12})
+
+    timer = Timer(0.2, write)
+    timer.start()
+    started = time.monotonic()
+    try:
+        response = client.get(f'/api/dispenser/get?dispenser_id={dispenser_id}&wait=10')
+    finally:
+        timer.join()
+
+    assert time.monotonic() - started < 5
+    assert response.get_json()['dispenser1'] == '12'
+    assert response.headers['X-Dispenser-Version'] == '1'
+
+
+def test_pending_dispense_answers_at_once(client, dispenser_id, long_waits):
+    client.post('/api/dispenser/set', json={'dispenser_id': dispenser_id, 'dispenser2': 3})
+
+    started = time.monotonic()
+    response = client.get(f'/api/dispenser/get?dispenser_id={dispenser_id}&wait=10')
+
+    assert time.monotonic() - started < 1
+    assert response.get_json()['dispenser2'] == '3'
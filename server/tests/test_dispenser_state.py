@@ -0,0 +1,81 @@
+"""
+Dispenser state: versioned rows per dispenser behind a per-process snapshot
+"""
+
+import json
+import uuid
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def dispenser_id():
+    return f'TEST_DISPENSER_{uuid.uuid4().hex[:8]}'
+
+
+def test_unknown_dispenser_reads_as_zero(client, dispenser_id):
+    response = client.get(f'/api/dispenser/get?dispenser_id={dispenser_id}')
+
+    assert response.get_json() == {'dispenser1': '0', 'dispenser2': '0', 'dispenser3': '0', 'dispenser4': '0'}
+    assert response.headers['X-Dispenser-Version'] == '0'
+
+
+def test_every_write_bumps_the_version(client, dispenser_id):
+    first = client.post('/api/dispenser/set', json={'dispenser_id': dispenser_id, 'dispenser2': 15})
+    second = client.post('/api/dispenser/set', json={'dispenser_id': dispenser_id, 'dispenser4': '5'})
+    reset = client.post('/api/dispenser/reset', json={'dispenser_id': dispenser_id})
+
+    assert [r.headers['X-Dispenser-Version'] for r in (first, second, reset)] == ['1', '2', '3']
+    assert second.get_json()['config'] == {'dispenser1': '0', 'dispenser2': '15', 'dispenser3': '0', 'dispenser4': '5'}
+    assert set(reset.get_json()['config'].values()) == {'0'}
+
+
+def test_set_requires_a_dispenser_field(client, dispenser_id):
+    assert client.post('/api/dispenser/set', json={'dispenser_id': dispenser_id, 'volume': 3}).status_code == 400
+
+
+def test_polls_are_served_from_the_snapshot(app_context, client, dispenser_id):
+    client.post('/api/dispenser/set', json={'dispenser_id': dispenser_id, 'dispenser1': 7})
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = main.db.engine
+    main.db.event.listen(engine, 'before_cursor_execute', record)
+    try:
+        for _ in range(20):
+            assert client.get(f'/api/dispenser/get?dispenser_id={dispenser_id}').get_json()['dispenser1'] == '7'
+    finally:
+        main.db.event.remove(engine, 'before_cursor_execute', record)
+
+    assert statements == []
+
+
+def test_write_from_another_worker_is_seen(app_context, client, dispenser_id):
+    client.post('/api/dispenser/set', json={'dispenser_id': dispenser_id, 'dispenser3': 2})
+    client.get(f'/api/dispenser/get?dispenser_id={dispenser_id}')
+
+    # Another process: the row changes and the shared generation moves
+    main.DispenserState.query.filter_by(dispenser_id=dispenser_id).update({'dispenser3': '9', 'version': 2})
+    main.db.session.commit()
+    main.dispenser_states.generation.increment()
+
+    response = client.get(f'/api/dispenser/get?dispenser_id={dispenser_id}')
+    assert response.get_json()['dispenser3'] == '9'
+    assert response.headers['X-Dispenser-Version'] == '2'
+
+
+def test_migration_imports_the_json_file(app_context, dispenser_id, tmp_path, monkeypatch):
+    config_file = tmp_path / 'dispenser_config.json'
+    config_file.write_text(json.dumps({'dispenser1': '4', 'dispenser2': '0', 'dispenser3': '1', 'dispenser4': '0'}))
+    monkeypatch.setattr(main, 'DISPENSER_CONFIG_FILE', str(config_file))
+    monkeypatch.setattr(main, 'DEFAULT_DISPENSER_ID', dispenser_id)
+    main.SchemaMigration.query.filter_by(version=4).delete()
+    main.db.session.commit()
+
+    assert [version for version, _ in main.upgrade_database()] == [4]
+    state = main.db.session.get(main.DispenserState, dispenser_id)
+    assert (state.dispenser1, state.dispenser3, state.version) == ('4', '1', 1)
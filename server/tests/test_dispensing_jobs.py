@@ -0,0 +1,79 @@
+"""
+Dispensing job claims, leases and completion
+"""
+
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def device(client):
+    device_id = f'TEST_CHEM_{uuid.uuid4().hex[:8]}'
+    for _ in range(10):
+        response = client.post('/api/dispensing-jobs', json={
+            'device_id': device_id, 'hcl': 1, 'soda': 2, 'cl': 0.5, 'al': 0, 'flag': 'PENDING'
+        })
+        assert response.status_code == 201
+    return device_id
+
+
+def claim(client, device_id, **options):
+    response = client.post('/api/dispensing-jobs/claim', json={'device_id': device_id, **options})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()
+
+
+def test_concurrent_claims_never_share_a_job(device):
+    def claim_two(_):
+        return [job['id'] for job in claim(main.app.test_client(), device, limit=2, owner='worker')['jobs']]
+
+    with ThreadPoolExecutor(8) as pool:
+        claimed = [job_id for job_ids in pool.map(claim_two, range(10)) for job_id in job_ids]
+
+    assert len(claimed) == 10
+    assert len(set(claimed)) == 10
+
+
+def test_claim_returns_oldest_jobs_with_float_amounts(client, device):
+    listed = client.get(f'/api/dispensing-jobs/{device}').get_json()
+    claimed = claim(client, device, limit=3)
+
+    oldest = sorted(listed, key=lambda job: (job['timestamp'], job['id']))[:3]
+    assert [job['id'] for job in claimed['jobs']] == [job['id'] for job in oldest]
+    job = claimed['jobs'][0]
+    assert job['flag'] == 'IN_PROGRESS'
+    assert all(isinstance(job[name], float) for name in ('hcl', 'soda', 'cl', 'al'))
+    assert claimed['lease_owner'] == device
+
+
+def test_complete_requires_the_lease_owner(client, device):
+    job_id = claim(client, device, owner='dispenser-a')['jobs'][0]['id']
+    url = f'/api/dispensing-jobs/{job_id}/complete'
+
+    assert client.post(url, json={}).status_code == 400
+    assert client.post(url, json={'owner': 'dispenser-b'}).status_code == 409
+
+    response = client.post(url, json={'owner': 'dispenser-a'})
+    assert response.status_code == 200
+    assert response.get_json()['flag'] == 'COMPLETED'
+    assert response.get_json()['hcl'] == 1.0
+
+    assert client.post(url, json={'owner': 'dispenser-a'}).status_code == 409
+    assert client.post('/api/dispensing-jobs/999999/complete', json={'owner': 'x'}).status_code == 404
+
+
+def test_expired_lease_is_reclaimed(client, app_context, device):
+    job_id = claim(client, device, owner='dispenser-a', lease_seconds=1)['jobs'][0]['id']
+
+    assert main.reclaim_expired_leases() == 0
+    assert main.reclaim_expired_leases(datetime.utcnow() + timedelta(seconds=2)) >= 1
+
+    # The late dispenser can no longer complete it; the next claim gets it again
+    url = f'/api/dispensing-jobs/{job_id}/complete'
+    assert client.post(url, json={'owner': 'dispenser-a'}).status_code == 409
+    assert claim(client, device, owner='dispenser-b')['jobs'][0]['id'] == job_id
@@ -0,0 +1,87 @@
+"""
+Downsampling: LTTB and min/max samplers and the ?points= readings query
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+
+
+def run_sampler(sampler_class, samples, buckets):
+    """Feed (t, value) samples to a sampler in ``buckets`` equal time slices"""
+    sampler = sampler_class()
+    width = (samples[-1][0] + 1) / buckets
+    groups = {}
+    for sample in samples:
+        groups.setdefault(int(sample[0] // width), []).append(sample)
+    for index in sorted(groups):
+        sampler.add_bucket(groups[index])
+    return sampler.finish()
+
+
+def test_lttb_keeps_first_last_and_spike():
+    samples = [(t, 1.0) for t in range(100)]
+    samples[42] = (42, 9.0)
+
+    selected = run_sampler(main.LTTBDownsampler, samples, 8)
+
+    assert selected[0] == (0, 1.0)
+    assert selected[-1] == (99, 1.0)
+    assert (42, 9.0) in selected
+    assert len(selected) == 10
+    assert selected == sorted(selected)
+
+
+def test_lttb_with_fewer_samples_than_points_keeps_them_all():
+    samples = [(0, 1.0), (1, 2.0), (2, 3.0)]
+
+    assert run_sampler(main.LTTBDownsampler, samples, 8) == samples
+
+
+def test_minmax_keeps_extremes_of_each_bucket_in_time_order():
+    samples = [(0, 5.0), (1, 9.0), (2, 1.0), (3, 4.0), (4, 4.0), (5, 4.0)]
+
+    assert run_sampler(main.MinMaxDownsampler, samples, 2) == [(1, 9.0), (2, 1.0), (3, 4.0)]
+
+
+@pytest.fixture
+def device(app_context, make_reading):
+    device_id = f'TEST_DOWNSAMPLE_{uuid.uuid4().hex[:8]}'
+    start = datetime.utcnow() - timedelta(hours=2)
+    main.ingest_readings([
+        make_reading(device_id, timestamp=start + timedelta(seconds=10 * i), ph=7.0 + (i % 7) / 10,
+                     temperature=None if i % 2 else 26.0)
+        for i in range(500)
+    ])
+    return device_id
+
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_points_query_reduces_every_metric(client, device, method):
+    response = client.get(f'/api/devices/{device}/readings?hours=3&points=20&downsample={method}')
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['source_readings'] == 500
+    assert data['downsample'] == method
+    for metric in ('ph', 'turbidity', 'temperature'):
+        series = data['series'][metric]
+        assert 0 < len(series['values']) <= 20
+        assert len(series['timestamps']) == len(series['values'])
+        assert series['timestamps'] == sorted(series['timestamps'])
+    assert None not in data['series']['temperature']['values']
+
+
+def test_minmax_query_keeps_the_range_of_values(client, device):
+    series = client.get(f'/api/devices/{device}/readings?hours=3&points=20&downsample=minmax').get_json()['series']
+
+    assert min(series['ph']['values']) == 7.0
+    assert max(series['ph']['values']) == 7.6
+
+
+@pytest.mark.parametrize('query', ['points=2', 'points=20&downsample=average', 'points=20&hours=1&start=x'])
+def test_invalid_points_query_is_rejected(client, device, query):
+    assert client.get(f'/api/devices/{device}/readings?{query}').status_code == 400
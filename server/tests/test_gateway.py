@@ -0,0 +1,111 @@
+"""
+Ingestion gateway: batch failures, unexpected errors and dispenser reads
+"""
+
+import asyncio
+import json
+import threading
+
+import gateway
+import main
+
+
+def reading_body(device_id, uptime=3600):
+    return json.dumps({
+        'device_id': device_id,
+        'sensors': {'ph': 7.2, 'turbidity': 3.5, 'temperature': 26.8},
+        'status': {'water_quality': 'optimal', 'wifi_rssi': -65, 'uptime': uptime}
+    }).encode()
+
+
+def test_bad_reading_does_not_fail_its_batch():
+    async def scenario():
+        ingest = gateway.IngestGateway(100, 100)
+        posts = [
+            asyncio.create_task(ingest.receive_data({}, reading_body('TEST_GATEWAY_GOOD'))),
+            asyncio.create_task(ingest.receive_data({}, reading_body('TEST_GATEWAY_BAD', uptime=2 ** 70)))
+        ]
+        await asyncio.sleep(0)  # both readings queued before the writer starts: one batch
+        writer = asyncio.create_task(ingest.writer())
+        results = await asyncio.gather(*posts, return_exceptions=True)
+        writer.cancel()
+        ingest.database.shutdown(wait=True)
+        return ingest, results
+
+    ingest, (good, bad) = asyncio.run(scenario())
+
+    status, body, _ = good
+    assert status == 200 and body['reading_id']
+    assert isinstance(bad, gateway.GatewayError) and bad.status == 500
+    assert (ingest.batches, ingest.stored, ingest.failed) == (1, 1, 1)
+    with main.app.app_context():
+        assert main.SensorReading.query.filter_by(device_id='TEST_GATEWAY_GOOD').count() == 1
+
+
+def test_unexpected_error_answers_500():
+    async def scenario():
+        ingest = gateway.IngestGateway(100, 100)
+
+        def broken(dispenser_id):
+            raise RuntimeError('database unavailable')
+        ingest._dispenser_snapshot = broken
+
+        server = await asyncio.start_server(ingest.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /api/dispenser/get HTTP/1.1\r\nHost: test\r\n\r\n')
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        ingest.database.shutdown(wait=True)
+        ingest.reads.shutdown(wait=True)
+        return response
+
+    response = asyncio.run(scenario())
+
+    head, _, body = response.partition(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 500')
+    assert b'Connection: close' in head
+    assert json.loads(body) == {'error': 'database unavailable'}
+
+
+def request(ingest, raw):
+    async def scenario():
+        server = await asyncio.start_server(ingest.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5)
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+
+    return asyncio.run(scenario())
+
+
+def test_dispenser_poll_does_not_wait_for_a_commit():
+    ingest = gateway.IngestGateway(100, 100)
+    commit_running = threading.Event()
+    ingest.database.submit(commit_running.wait, 10)  # a slow batch holding the write thread
+    try:
+        head = request(ingest, b'GET /api/dispenser/get?dispenser_id=TEST_GATEWAY_POLL HTTP/1.1\r\nHost: test\r\n\r\n')
+        assert head.startswith(b'HTTP/1.1 200')
+        assert ingest.snapshot_reads == 1
+
+        request(ingest, b'GET /api/dispenser/get?dispenser_id=TEST_GATEWAY_POLL HTTP/1.1\r\nHost: test\r\n\r\n')
+        assert ingest.snapshot_reads == 1  # answered from the snapshot cache
+    finally:
+        commit_running.set()
+        ingest.database.shutdown(wait=True)
+        ingest.reads.shutdown(wait=True)
+
+
+def test_stats_only_answer_get():
+    ingest = gateway.IngestGateway(100, 100)
+
+    assert request(ingest, b'GET /api/gateway/stats HTTP/1.1\r\nHost: test\r\n\r\n').startswith(b'HTTP/1.1 200')
+    assert request(ingest, b'POST /api/gateway/stats HTTP/1.1\r\nHost: test\r\n\r\n').startswith(b'HTTP/1.1 405')
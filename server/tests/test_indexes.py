@@ -0,0 +1,30 @@
+"""
+Composite indexes for the hot query shapes
+"""
+
+import pytest
+
+import main
+
+
+def query_plan(sql):
+    rows = main.db.session.execute(main.db.text(f'EXPLAIN QUERY PLAN {sql}'))
+    return ' '.join(row[3] for row in rows)
+
+
+@pytest.mark.parametrize('sql, index', [
+    ("SELECT * FROM pool_sensor_readings WHERE device_id = 'A' ORDER BY timestamp DESC LIMIT 1",
+     'ix_pool_sensor_readings_device_timestamp'),
+    ("SELECT * FROM pool_alerts WHERE device_id = 'A' ORDER BY timestamp DESC LIMIT 50",
+     'ix_pool_alerts_device_timestamp'),
+    ("SELECT max(timestamp) FROM pool_alerts WHERE device_id = 'A' AND acknowledged = 0 AND alert_type = 'ph_critical'",
+     'ix_pool_alerts_dedup'),
+    ("SELECT * FROM chemical_dispenser_jobs WHERE flag = 'PENDING' AND device_id = 'A' ORDER BY timestamp LIMIT 3",
+     'ix_chemical_dispenser_jobs_flag_device_timestamp'),
+])
+def test_hot_queries_use_their_index(app_context, sql, index):
+    plan = query_plan(sql)
+
+    assert index in plan
+    assert 'TEMP B-TREE' not in plan  # ordered by the index, not sorted
+
@@ -0,0 +1,31 @@
+"""
+Ingest path: device cache and write-behind group commits
+"""
+
+import main
+
+
+def test_failed_group_commit_does_not_cache_new_device(app_context, make_reading):
+    main.ingest_readings([make_reading('TEST_GROUP_KNOWN')])
+    buffer = main.WriteBehindBuffer(10, 10, 10)
+    batch = [
+        make_reading('TEST_GROUP_NEW'),
+        make_reading('TEST_GROUP_KNOWN', uptime=2 ** 70)  # overflows SQLite INTEGER
+    ]
+
+    buffer._flush(batch)
+
+    assert buffer.written == 1
+    assert buffer.failed == 1
+    assert main.Device.query.filter_by(device_id='TEST_GROUP_NEW').count() == 1
+    assert main.DeviceConfig.query.filter_by(device_id='TEST_GROUP_NEW').count() == 1
+    assert main.SensorReading.query.filter_by(device_id='TEST_GROUP_NEW').count() == 1
+
+
+def test_new_device_cached_after_commit(app_context, make_reading):
+    main.ingest_readings([make_reading('TEST_CACHED_WARM')])
+    main.ingest_readings([make_reading('TEST_CACHED_NEW')])
+
+    found, missing = main.device_cache.get_many({'TEST_CACHED_NEW'})
+    assert 'TEST_CACHED_NEW' in found
+    assert not missing
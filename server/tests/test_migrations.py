@@ -0,0 +1,46 @@
+"""
+Startup migrations: versioned, applied once, never run per request
+"""
+
+import main
+
+
+def test_every_migration_is_recorded(app_context):
+    assert main.applied_migrations() == {version for version, _, _ in main.MIGRATIONS}
+
+
+def test_pending_migration_is_applied_once(app_context):
+    main.db.session.execute(main.db.text('DROP INDEX ix_pool_alerts_dedup'))
+    main.SchemaMigration.query.filter_by(version=2).delete()
+    main.db.session.commit()
+
+    assert main.upgrade_database() == [(2, 'Add composite indexes for hot query shapes')]
+    assert 'ix_pool_alerts_dedup' in {index['name'] for index in main.db.inspect(main.db.engine).get_indexes('pool_alerts')}
+    assert main.upgrade_database() == []
+
+
+def test_requests_issue_no_schema_statements(client):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.lstrip().upper())
+
+    with main.app.app_context():
+        engine = main.db.engine
+    main.db.event.listen(engine, 'before_cursor_execute', record)
+    try:
+        client.get('/pool/config?device_id=TEST_MIGRATIONS')
+        client.get('/api/dispensing-jobs?device_id=TEST_MIGRATIONS')
+    finally:
+        main.db.event.remove(engine, 'before_cursor_execute', record)
+
+    assert statements
+    assert not [s for s in statements if s.startswith(('PRAGMA', 'CREATE', 'ALTER', 'SELECT NAME FROM SQLITE_MASTER'))]
+
+
+def test_status_lists_applied_migrations():
+    result = main.app.test_cli_runner().invoke(args=['upgrade-db', '--status'])
+
+    lines = result.output.splitlines()
+    assert len(lines) == len(main.MIGRATIONS)
+    assert all('applied' in line for line in lines)
@@ -0,0 +1,72 @@
+"""
+Password hashing pool: queue bounds and counters
+"""
+
+import time
+
+import pytest
+
+import main
+
+
+# Routes must exist before the app serves its first request
+@main.app.route('/_test/remote-addr')
+def _remote_addr():
+    return main.request.remote_addr
+
+
+def make_hasher(timeout):
+    hasher = main.PasswordHasher('pbkdf2:sha256:1000', 1, 1, 2, 30, 0)
+    hasher._run((), time.sleep, 0)  # start the worker process
+    hasher.timeout = timeout
+    return hasher
+
+
+def test_timed_out_job_keeps_its_queue_slot():
+    hasher = make_hasher(0.2)
+
+    with pytest.raises(main.PasswordHashingBusy) as timed_out:
+        hasher._run(('client',), time.sleep, 1.0)
+    assert timed_out.value.status == 503
+
+    # The sleeping job still runs in the pool, so the queue is still full:
+    # rejected at once, not after another timeout
+    started = time.perf_counter()
+    with pytest.raises(main.PasswordHashingBusy) as busy:
+        hasher._run(('other',), time.sleep, 0)
+    assert busy.value.status == 503
+    assert time.perf_counter() - started < 0.1
+
+    time.sleep(1.2)
+    assert hasher._run(('other',), time.sleep, 0) is None
+    assert hasher.stats()['rejected_busy'] == 2
+    hasher.stop()
+
+
+def test_saturated_queue_answers_503_with_retry_after(client, monkeypatch):
+    hasher = make_hasher(10)
+    hasher._slots.acquire()  # the only slot is taken
+    monkeypatch.setattr(main, 'password_hasher', hasher)
+
+    response = client.post('/api/auth/register', json={'email': 'busy@example.com', 'password': 'secret'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    hasher._slots.release()
+    hasher.stop()
+
+
+def test_counters():
+    hasher = make_hasher(10)
+    password_hash = hasher.hash('secret')
+    assert hasher.verify(password_hash, 'secret')
+    hasher.rehash('secret')
+
+    stats = hasher.stats()
+    assert (stats['hashed'], stats['verified'], stats['rehashed']) == (2, 1, 1)
+    hasher.stop()
+
+
+def test_client_address_from_forwarded_for(client):
+    response = client.get('/_test/remote-addr', headers={'X-Forwarded-For': '203.0.113.7'})
+    assert response.get_data(as_text=True) == '203.0.113.7'
@@ -0,0 +1,93 @@
+"""
+Principal cache: verified tokens skip the User lookup until the user changes
+"""
+
+import time
+import uuid
+
+import jwt
+import pytest
+
+import main
+
+
+@pytest.fixture
+def user(app_context):
+    user = main.User(email=f'{uuid.uuid4().hex[:8]}@example.com', password_hash='unused', role='user')
+    main.db.session.add(user)
+    main.db.session.commit()
+    return user
+
+
+def count_statements(call):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = main.db.engine
+    main.db.event.listen(engine, 'before_cursor_execute', record)
+    try:
+        call()
+    finally:
+        main.db.event.remove(engine, 'before_cursor_execute', record)
+    return len(statements)
+
+
+def test_repeated_token_is_served_from_the_cache(client, user):
+    token = user.generate_token()
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/users', headers=headers).status_code == 403
+
+    hits = main.principal_cache.stats()['hits']
+    assert count_statements(lambda: client.get('/api/users', headers=headers)) == 0
+    assert main.principal_cache.stats()['hits'] == hits + 1
+
+
+@pytest.mark.parametrize('change,status', [
+    ({'role': 'admin'}, 200),
+    ({'is_active': False}, 401),
+    ({'password_hash': 'changed'}, 403)
+])
+def test_principal_changes_invalidate_cached_tokens(client, user, change, status):
+    token = user.generate_token()
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/users', headers=headers).status_code == 403
+    invalidations = main.principal_cache.stats()['invalidations']
+
+    for field, value in change.items():
+        setattr(user, field, value)
+    main.db.session.commit()
+
+    assert main.principal_cache.stats()['invalidations'] == invalidations + 1
+    assert main.principal_cache.get(token) is None
+    assert client.get('/api/users', headers=headers).status_code == status
+
+
+def test_profile_changes_keep_cached_tokens(client, user):
+    token = user.generate_token()
+    client.get('/api/users', headers={'Authorization': f'Bearer {token}'})
+    invalidations = main.principal_cache.stats()['invalidations']
+
+    user.first_name = 'Renamed'
+    main.db.session.commit()
+
+    assert main.principal_cache.stats()['invalidations'] == invalidations
+    assert main.principal_cache.get(token) is not None
+
+
+def test_change_in_another_worker_clears_the_cache(client, user):
+    token = user.generate_token()
+    client.get('/api/users', headers={'Authorization': f'Bearer {token}'})
+
+    main.principal_cache.shared_generation.increment()
+
+    assert main.principal_cache.get(token) is None
+
+
+def test_cached_token_still_expires(user):
+    token = user.generate_token()
+    main.principal_cache.put(token, main.Principal(user.id, user.email, user.role, True), time.time() - 1)
+
+    with pytest.raises(jwt.ExpiredSignatureError):
+        main.principal_cache.get(token)
@@ -0,0 +1,82 @@
+"""
+Live reading stream: events from every process on the host
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import main
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+INGEST_IN_OTHER_PROCESS = """
+from datetime import datetime
+import main
+with main.app.app_context():
+    main.ingest_readings([{
+        'device_id': 'TEST_STREAM_REMOTE', 'timestamp': datetime.utcnow(),
+        'ph': 5.0, 'turbidity': 3.5, 'temperature': 26.8,
+        'water_quality': 'critical', 'wifi_rssi': -65, 'uptime': 1
+    }])
+"""
+
+
+def parse_frame(frame):
+    fields = dict(line.split(': ', 1) for line in frame.strip().splitlines())
+    return fields['event'], json.loads(fields['data'])
+
+
+def test_readings_stored_by_another_process_reach_subscribers():
+    main.reading_tail.start()
+    subscriber = main.reading_broker.subscribe('TEST_STREAM_REMOTE')
+    try:
+        subprocess.run([sys.executable, '-c', INGEST_IN_OTHER_PROCESS],
+                       cwd=SERVER_DIR, env=os.environ, check=True, capture_output=True)
+
+        events = [parse_frame(subscriber.get(timeout=5)) for _ in range(2)]
+    finally:
+        main.reading_broker.unsubscribe('TEST_STREAM_REMOTE', subscriber)
+
+    (reading_event, reading), (alert_event, alert) = events
+    assert reading_event == 'reading' and reading['device_id'] == 'TEST_STREAM_REMOTE'
+    assert alert_event == 'alert' and alert['alert_type'] == 'ph_critical'
+
+
+def test_event_log_reports_events_lost_to_a_lagging_reader(tmp_path):
+    log = main.SharedEventLog(str(tmp_path / 'events.log'), 3, 128)
+    log.append([('A', f'frame {i}') for i in range(5)])
+
+    events, last, lost = log.read_since(0)
+
+    assert events == [('A', 'frame 2'), ('A', 'frame 3'), ('A', 'frame 4')]
+    assert (last, lost) == (5, 2)
+    assert log.read_since(last) == ([], 5, 0)
+
+
+def test_event_log_skips_oversized_frames(tmp_path):
+    log = main.SharedEventLog(str(tmp_path / 'events.log'), 4, 64)
+
+    assert log.append([('A', 'x' * 100), ('A', 'small')]) == 1
+    assert log.read_since(0)[0] == [('A', 'small')]
+    assert log.oversized == 1
+
+
+def test_subscriber_count_is_shared(tmp_path):
+    path = str(tmp_path / 'events.log')
+    first, second = main.SharedEventLog(path, 4, 64), main.SharedEventLog(path, 4, 64)
+    broker = main.ReadingBroker(10, first)
+
+    subscriber = broker.subscribe('A')
+    assert second.has_subscribers()
+    broker.unsubscribe('A', subscriber)
+    broker.unsubscribe('A', subscriber)
+    assert not second.has_subscribers()
+
+
+def test_streams_are_refused_without_gevent(client, monkeypatch):
+    monkeypatch.setattr(main, 'LONG_WAITS_ENABLED', False)
+
+    assert client.get('/api/readings/stream').status_code == 501
+    assert client.get('/api/devices/TEST_STREAM_REMOTE/stream').status_code == 501
@@ -0,0 +1,36 @@
+"""
+Reading pages: limits and keyset cursors
+"""
+
+import uuid
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def device(app_context, make_reading):
+    device_id = f'TEST_PAGES_{uuid.uuid4().hex[:8]}'
+    main.ingest_readings([make_reading(device_id, uptime=i) for i in range(5)])
+    return device_id
+
+
+@pytest.mark.parametrize('limit', [0, -1])
+def test_empty_limit_returns_empty_page(client, device, limit):
+    response = client.get(f'/api/devices/{device}/readings?limit={limit}')
+
+    assert response.status_code == 200
+    assert response.get_json() == []
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_cursor_pages_cover_every_reading(client, device):
+    response = client.get(f'/api/devices/{device}/readings?limit=2')
+    seen = [reading['id'] for reading in response.get_json()]
+    while 'X-Next-Cursor' in response.headers:
+        response = client.get(f"/api/devices/{device}/readings?limit=2&cursor={response.headers['X-Next-Cursor']}")
+        seen += [reading['id'] for reading in response.get_json()]
+
+    assert len(seen) == 5
+    assert seen == sorted(seen, reverse=True)
@@ -0,0 +1,63 @@
+"""
+Retention: archived readings and pruned rollups
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def device_id():
+    return f'TEST_RETENTION_{uuid.uuid4().hex[:8]}'
+
+
+def ingest_minutes(make_reading, device_id, start, minutes):
+    main.ingest_readings([
+        make_reading(device_id, timestamp=start + timedelta(minutes=i), ph=7.0 + i % 5 / 10)
+        for i in range(minutes)
+    ])
+
+
+def test_archived_readings_are_still_aggregated(app_context, make_reading, device_id):
+    start = main.floor_bucket(datetime.utcnow() - timedelta(days=100), 3600)
+    ingest_minutes(make_reading, device_id, start, 30)
+
+    archived, segments = main.archive_readings(datetime.utcnow() - timedelta(days=90), device_id=device_id, pause_ms=0)
+
+    assert (archived, segments) == (30, 1)
+    assert main.SensorReading.query.filter_by(device_id=device_id).count() == 0
+    assert [r['ph'] for r in main.reading_archive.read(device_id)] == [7.0 + i % 5 / 10 for i in range(30)]
+    end = start + timedelta(minutes=30, seconds=30)
+    assert main.aggregate_window(device_id, start, end, use_rollups=False).reading_count == 30
+    assert main.aggregate_window(device_id, start, end).reading_count == 30
+
+
+def test_pruned_minute_rollups_fall_back_to_coarser_buckets(app_context, make_reading, device_id):
+    start = main.floor_bucket(datetime.utcnow() - timedelta(days=40), 3600) + timedelta(minutes=30)
+    ingest_minutes(make_reading, device_id, start, 90)
+
+    assert main.prune_rollups(pause_ms=0) > 0
+
+    remaining = {
+        resolution: count for resolution, count in main.db.session.query(
+            main.SensorRollup.resolution, main.db.func.count()
+        ).filter_by(device_id=device_id).group_by(main.SensorRollup.resolution)
+    }
+    assert 60 not in remaining and remaining[3600] == 2
+    assert main.SensorSketchBin.query.filter_by(device_id=device_id, resolution=60).count() == 0
+
+    # Whole hours from the 1h rollups, the partial hours at the edges from raw readings
+    assert main.aggregate_window(device_id, start, start + timedelta(minutes=90)).reading_count == 90
+    assert main.aggregate_window(device_id, start + timedelta(minutes=5), start + timedelta(minutes=20)).reading_count == 15
+
+
+def test_recent_minute_rollups_are_kept(app_context, make_reading, device_id):
+    ingest_minutes(make_reading, device_id, main.floor_bucket(datetime.utcnow() - timedelta(hours=2), 60), 3)
+
+    main.prune_rollups(pause_ms=0)
+
+    assert main.SensorRollup.query.filter_by(device_id=device_id, resolution=60).count() == 3
@@ -0,0 +1,119 @@
+"""
+Sensor rollups: bucket arithmetic, incremental upserts and rebuilds
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def device_id():
+    return f'TEST_ROLLUP_{uuid.uuid4().hex[:8]}'
+
+
+@pytest.fixture
+def base():
+    # A recent whole minute, away from the hour boundary
+    return main.floor_bucket(datetime.utcnow() - timedelta(hours=3), 3600) + timedelta(minutes=10)
+
+
+def rollup_rows(device_id):
+    columns = ['resolution', 'bucket_start', 'reading_count', 'ph_count', 'ph_sum', 'ph_min', 'ph_max',
+               'temperature_count', 'temperature_sum', 'temperature_min', 'temperature_max']
+    rows = main.db.session.execute(
+        main.db.select(*(main.SensorRollup.__table__.c[column] for column in columns))
+        .where(main.SensorRollup.device_id == device_id)
+        .order_by(main.SensorRollup.resolution, main.SensorRollup.bucket_start)
+    )
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def test_plan_uses_coarsest_whole_buckets():
+    start = datetime(2024, 5, 1, 10, 0, 30)
+    end = datetime(2024, 5, 1, 12, 1, 10)
+
+    assert main.plan_rollup_ranges(start, end, [86400, 3600, 60]) == [
+        (None, start, datetime(2024, 5, 1, 10, 1)),
+        (60, datetime(2024, 5, 1, 10, 1), datetime(2024, 5, 1, 11)),
+        (3600, datetime(2024, 5, 1, 11), datetime(2024, 5, 1, 12)),
+        (60, datetime(2024, 5, 1, 12), datetime(2024, 5, 1, 12, 1)),
+        (None, datetime(2024, 5, 1, 12, 1), end),
+    ]
+
+
+def test_plan_inside_one_minute_is_raw():
+    start = datetime(2024, 5, 1, 10, 0, 10)
+
+    assert main.plan_rollup_ranges(start, start + timedelta(seconds=30), [86400, 3600, 60]) == [
+        (None, start, start + timedelta(seconds=30))
+    ]
+
+
+def test_separate_batches_merge_into_the_same_buckets(app_context, make_reading, device_id, base):
+    main.ingest_readings([make_reading(device_id, timestamp=base, ph=7.0, temperature=26.0)])
+    main.ingest_readings([
+        make_reading(device_id, timestamp=base + timedelta(seconds=20), ph=7.4, temperature=None),
+        make_reading(device_id, timestamp=base + timedelta(seconds=70), ph=8.0, temperature=28.0),
+    ])
+
+    minute, next_minute, hour, day = rollup_rows(device_id)
+    assert (minute['resolution'], minute['bucket_start']) == (60, base)
+    assert (minute['reading_count'], minute['ph_count'], minute['temperature_count']) == (2, 2, 1)
+    assert minute['ph_sum'] == pytest.approx(14.4)
+    assert (minute['ph_min'], minute['ph_max']) == (7.0, 7.4)
+    assert (minute['temperature_min'], minute['temperature_max']) == (26.0, 26.0)
+    assert (next_minute['bucket_start'], next_minute['reading_count']) == (base + timedelta(minutes=1), 1)
+    for row in (hour, day):
+        assert (row['reading_count'], row['ph_min'], row['ph_max']) == (3, 7.0, 8.0)
+        assert (row['temperature_count'], row['temperature_sum']) == (2, pytest.approx(54.0))
+
+
+def test_window_aggregate_matches_readings(app_context, make_reading, device_id, base):
+    values = [7.0, 7.2, 7.6, 8.1]
+    main.ingest_readings([
+        make_reading(device_id, timestamp=base + timedelta(minutes=20 * i, seconds=5), ph=ph)
+        for i, ph in enumerate(values)
+    ])
+
+    aggregate = main.aggregate_window(device_id, base - timedelta(seconds=30), base + timedelta(hours=2))
+
+    assert aggregate.reading_count == 4
+    assert aggregate.metrics['ph'].to_dict() == {
+        'avg': pytest.approx(sum(values) / 4), 'min': 7.0, 'max': 8.1
+    }
+
+
+def test_stats_endpoint_reads_rollups(client, make_reading, device_id):
+    with main.app.app_context():
+        main.ingest_readings([
+            make_reading(device_id, timestamp=datetime.utcnow() - timedelta(minutes=minutes), ph=ph)
+            for minutes, ph in ((90, 7.0), (30, 7.5), (1, 8.0))
+        ])
+
+    stats = client.get(f'/api/stats/{device_id}?hours=2').get_json()
+
+    assert stats['total_readings'] == 3
+    assert stats['ph'] == {'avg': pytest.approx(7.5), 'min': 7.0, 'max': 8.0}
+
+
+def test_rebuild_reproduces_incremental_rollups(app_context, make_reading, device_id, base):
+    main.ingest_readings([
+        make_reading(device_id, timestamp=base + timedelta(minutes=7 * i), ph=7.0 + i / 10)
+        for i in range(12)
+    ])
+    incremental = rollup_rows(device_id)
+    main.SensorRollup.query.filter_by(device_id=device_id).delete()
+    main.db.session.commit()
+
+    processed = main.rebuild_rollups(device_id=device_id, since=base, until=datetime.utcnow() + timedelta(days=1))
+
+    assert processed == 12
+    rebuilt = rollup_rows(device_id)
+    assert len(rebuilt) == len(incremental)
+    for before, after in zip(incremental, rebuilt):
+        assert after == {key: pytest.approx(value) if isinstance(value, float) else value
+                         for key, value in before.items()}
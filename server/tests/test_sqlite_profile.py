@@ -0,0 +1,40 @@
+"""
+SQLite engine profile: connection pragmas and WAL checkpoints
+"""
+
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize('pragma,expected', [
+    ('journal_mode', 'wal'),
+    ('synchronous', 1),  # NORMAL
+    ('busy_timeout', main.SQLITE_BUSY_TIMEOUT_MS),
+    ('cache_size', -main.SQLITE_CACHE_SIZE_KB),
+    ('temp_store', 2),  # MEMORY
+    ('wal_autocheckpoint', main.SQLITE_WAL_AUTOCHECKPOINT)
+])
+def test_new_connections_use_the_performance_profile(app_context, pragma, expected):
+    with main.db.engine.connect() as connection:
+        assert connection.exec_driver_sql(f'PRAGMA {pragma}').scalar() == expected
+
+
+def test_checkpoint_truncates_a_large_wal(app_context, make_reading, monkeypatch):
+    main.ingest_readings([make_reading('TEST_CHECKPOINT') for _ in range(20)])
+    before = main.sqlite_checkpointer.stats()
+    monkeypatch.setattr(main, 'SQLITE_WAL_TRUNCATE_BYTES', 0)
+
+    main.sqlite_checkpointer.checkpoint()
+
+    stats = main.sqlite_checkpointer.stats()
+    assert stats['last_error'] is None
+    assert stats['checkpoints'] == before['checkpoints'] + 1
+    assert stats['truncations'] + stats['busy'] == before['truncations'] + before['busy'] + 1
+
+
+def test_checkpointer_is_reported_in_ingest_stats(client):
+    database = client.get('/api/ingest/stats').get_json()['database']
+
+    assert database['profile'] == 'sqlite-performance'
+    assert database['running'] is False  # SQLITE_CHECKPOINT_INTERVAL=0 in tests
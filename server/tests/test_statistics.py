@@ -0,0 +1,45 @@
+"""
+Statistics: threshold bands from quantile sketches
+"""
+
+import pytest
+
+import main
+
+
+def bands_by_name(client, device_id, metric):
+    response = client.get(f'/api/stats/{device_id}?hours=1&distribution=true')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return {band['band']: band for band in response.get_json()[metric]['bands']}
+
+
+def test_low_ph_is_critical_not_optimal(client, app_context, make_reading):
+    main.ingest_readings([make_reading('TEST_BANDS_PH', ph=5.0) for _ in range(3)]
+                         + [make_reading('TEST_BANDS_PH', ph=7.2)])
+
+    bands = bands_by_name(client, 'TEST_BANDS_PH', 'ph')
+
+    # Default ph_optimal 7.4: below 6.4 raises a ph_critical alert
+    assert bands['critical_low']['at_most'] == pytest.approx(6.4)
+    assert bands['critical_low']['readings'] == 3
+    assert bands['optimal']['above'] == pytest.approx(6.4)
+    assert bands['optimal']['readings'] == 1
+    assert sum(band['readings'] for band in bands.values()) == 4
+
+
+def test_low_temperature_is_critical_not_optimal(client, app_context, make_reading):
+    main.ingest_readings([make_reading('TEST_BANDS_TEMP', temperature=15.0)])
+
+    bands = bands_by_name(client, 'TEST_BANDS_TEMP', 'temperature')
+
+    assert bands['critical_low']['readings'] == 1
+    assert bands['optimal']['readings'] == 0
+
+
+def test_turbidity_has_no_lower_band(client, app_context, make_reading):
+    main.ingest_readings([make_reading('TEST_BANDS_TURBIDITY', turbidity=0.5)])
+
+    bands = bands_by_name(client, 'TEST_BANDS_TURBIDITY', 'turbidity')
+
+    assert 'critical_low' not in bands
+    assert bands['optimal']['readings'] == 1
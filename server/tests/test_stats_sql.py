@@ -0,0 +1,82 @@
+"""
+Statistics aggregated in SQL for several devices and windows
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+
+
+def new_devices(count):
+    return [f'TEST_STATS_{uuid.uuid4().hex[:8]}' for _ in range(count)]
+
+
+def ingest_ago(make_reading, device_id, *minutes_and_ph):
+    with main.app.app_context():
+        main.ingest_readings([
+            make_reading(device_id, timestamp=datetime.utcnow() - timedelta(minutes=minutes), ph=ph)
+            for minutes, ph in minutes_and_ph
+        ])
+
+
+def test_several_devices_and_windows_in_one_call(client, make_reading):
+    first, second = new_devices(2)
+    ingest_ago(make_reading, first, (30, 7.0), (40, 7.4), (300, 8.0))
+    ingest_ago(make_reading, second, (10, 7.8))
+
+    response = client.get(f'/api/stats?device_id={first},{second}&hours=1&hours=24')
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['windows'] == [1, 24]
+    assert body['devices'][first]['1']['total_readings'] == 2
+    assert body['devices'][first]['24']['total_readings'] == 3
+    assert body['devices'][first]['24']['ph']['max'] == 8.0
+    assert body['devices'][second]['1']['ph'] == {'avg': 7.8, 'min': 7.8, 'max': 7.8}
+
+
+def test_raw_source_agrees_with_rollups(client, make_reading):
+    (device_id,) = new_devices(1)
+    ingest_ago(make_reading, device_id, *((minutes * 7 + 1, 7.0 + minutes / 20) for minutes in range(20)))
+
+    rollup = client.get(f'/api/stats/{device_id}?hours=3').get_json()
+    raw = client.get(f'/api/stats/{device_id}?hours=3&source=raw').get_json()
+
+    assert rollup['total_readings'] == raw['total_readings'] == 20
+    for metric in ('ph', 'temperature'):
+        assert rollup[metric]['avg'] == pytest.approx(raw[metric]['avg'])
+        assert (rollup[metric]['min'], rollup[metric]['max']) == (raw[metric]['min'], raw[metric]['max'])
+
+
+def test_query_count_does_not_grow_with_devices(app_context, make_reading):
+    devices = new_devices(5)
+    for device_id in devices:
+        ingest_ago(make_reading, device_id, (5, 7.2), (65, 7.3))
+    end = datetime.utcnow()
+    start = end - timedelta(hours=6)
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    counts = []
+    main.db.event.listen(main.db.engine, 'before_cursor_execute', record)
+    try:
+        for device_ids in (devices[:1], devices):
+            statements.clear()
+            aggregates = main.aggregate_devices(device_ids, start, end)
+            counts.append(len(statements))
+    finally:
+        main.db.event.remove(main.db.engine, 'before_cursor_execute', record)
+
+    assert counts[0] == counts[1]
+    assert all(aggregate.reading_count == 2 for aggregate in aggregates.values())
+
+
+@pytest.mark.parametrize('query', ['hours=24', 'device_id=A&hours=day'])
+def test_invalid_requests_are_rejected(client, query):
+    assert client.get(f'/api/stats?{query}').status_code == 400
@@ -0,0 +1,36 @@
+"""
+Write-behind ingestion: acknowledged readings that are lost or dropped
+"""
+
+import uuid
+
+import main
+
+
+def test_queued_readings_are_committed_on_stop(app_context, make_reading):
+    device_id = f'TEST_WB_{uuid.uuid4().hex[:8]}'
+    buffer = main.WriteBehindBuffer(100, 100, 60000)  # would otherwise wait a minute to flush
+
+    for uptime in range(3):
+        assert buffer.put(make_reading(device_id, uptime=uptime))
+    buffer.stop()
+
+    assert main.SensorReading.query.filter_by(device_id=device_id).count() == 3
+    assert buffer.stats()['lost_at_exit'] == 0
+
+
+def test_failed_reading_is_reported(make_reading):
+    buffer = main.WriteBehindBuffer(100, 100, 10)
+
+    buffer._flush([make_reading('TEST_WB_GOOD'), make_reading('TEST_WB_BAD', uptime=2 ** 70)])
+
+    stats = buffer.stats()
+    assert (stats['written'], stats['failed']) == (1, 1)
+    (failure,) = stats['recent_failures']
+    assert failure['device_id'] == 'TEST_WB_BAD' and failure['error']
+
+
+def test_ingest_stats_expose_write_behind_losses(client):
+    stats = client.get('/api/ingest/stats').get_json()['write_behind']
+
+    assert {'failed', 'lost_at_exit', 'recent_failures'} <= stats.keys()
@@ -0,0 +1,12 @@
+"""
+WSGI entry point for production serving
+
+  gunicorn -c gunicorn.conf.py wsgi:app
+
+Each worker process imports main and runs startup() (migrations are
+serialized by a file lock, so concurrent workers apply them once).
+"""
+
+from main import app, startup
+
+startup()